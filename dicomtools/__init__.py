@@ -3,3 +3,11 @@ from . import series
 from . import volume
 from . import visualization
 from . import export
+from . import projection
+from . import profiling
+from . import cache
+from . import statistics
+from . import dataset
+from . import contours
+from . import chunked
+from . import dicom_write
@@ -0,0 +1,46 @@
+import numpy as np
+from multiprocessing.pool import ThreadPool
+#
+from .series import DicomSeries
+from .volume import DicomVolume
+#
+# Helpers shared by the modules which read a volume one slice at a time, optionally
+# splitting the slices between a pool of worker threads.
+#
+def get_streaming_volume(dicom_data):
+	r'''
+	Accept either a :class:`dicomtools.volume.DicomVolume` or a
+	:class:`dicomtools.series.DicomSeries`. A series is turned into a volume without
+	loading the pixel data, so that the slices are only read as they are needed.
+	'''
+	#
+	if isinstance(dicom_data, DicomSeries):
+		return DicomVolume(dicom_data, load_pixel_data=False)
+	return dicom_data
+#
+def map_with_workers(function, arguments, workers):
+	r'''
+	Apply the function to each of the arguments (a list of tuples), using a pool of
+	threads if ``workers`` is greater than 1. Decoding and reducing the slices is
+	mostly done within numpy, so threads are able to run in parallel.
+	'''
+	#
+	if workers <= 1 or len(arguments) <= 1:
+		return [function(*x) for x in arguments]
+	#
+	pool = ThreadPool(min(workers, len(arguments)))
+	try:
+		return pool.map(lambda x: function(*x), arguments)
+	finally:
+		pool.close()
+		pool.join()
+	#
+#
+def split_range(start, stop, num_of_chunks):
+	r'''
+	Split the range ``[start, stop)`` into (at most) ``num_of_chunks`` contiguous ranges.
+	'''
+	#
+	bounds = np.linspace(start, stop, min(num_of_chunks, stop-start)+1).astype(int)
+	return [(bounds[x], bounds[x+1]) for x in range(len(bounds)-1)]
+#
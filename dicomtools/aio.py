@@ -0,0 +1,80 @@
+import asyncio
+import functools
+import io
+import dicom
+#
+from .series import DicomSeries
+from .volume import DicomVolume
+#
+# Coroutines for loading DICOM data from an asyncio event loop. All of the blocking work
+# (reading files, parsing datasets and building volumes) is done in an executor, so the
+# event loop is never blocked. This module requires python 3.7 or later, so it is not
+# imported by the dicomtools package and must be imported directly:
+#
+#	import dicomtools.aio
+#
+def _read_bytes(filename):
+	with open(filename, 'rb') as f:
+		return f.read()
+	#
+#
+def _parse_dicom(data):
+	return dicom.read_file(io.BytesIO(data))
+#
+async def _read_dicom_file(filename, semaphore, executor):
+	r'''
+	Read the file's bytes while holding the semaphore (to bound the number of concurrent
+	reads), then parse them without holding it.
+	'''
+	#
+	loop = asyncio.get_running_loop()
+	async with semaphore:
+		data = await loop.run_in_executor(executor, _read_bytes, filename)
+	#
+	return await loop.run_in_executor(executor, _parse_dicom, data)
+#
+async def read_dicom_series(dicom_file_list, max_concurrent_reads=8, executor=None):
+	r'''
+	Build a :class:`dicomtools.series.DicomSeries` object containing all of the given
+	DICOMs in a series, like :meth:`dicomtools.dicom_read.read_dicom_series`. At most
+	``max_concurrent_reads`` files are read at once, and the files are read and parsed
+	in the ``executor`` (the event loop's default executor if None).
+	
+	To bound the number of files being read across many series, pass the same
+	:class:`asyncio.Semaphore` as ``max_concurrent_reads`` to each call.
+	
+	Example:
+	::
+	
+		>>> series_list = await asyncio.gather(*[dicomtools.aio.read_dicom_series(x) for x in filename_lists])
+	'''
+	#
+	if isinstance(max_concurrent_reads, asyncio.Semaphore):
+		semaphore = max_concurrent_reads
+	else:
+		semaphore = asyncio.Semaphore(max_concurrent_reads)
+	#
+	loaded_series = await asyncio.gather(*[_read_dicom_file(x, semaphore, executor) for x in dicom_file_list])
+	#
+	loop = asyncio.get_running_loop()
+	return await loop.run_in_executor(executor, DicomSeries, list(loaded_series))
+#
+async def load_volume(dicom_series, executor=None, **kwargs):
+	r'''
+	Build a :class:`dicomtools.volume.DicomVolume` from the series in the ``executor``
+	(the event loop's default executor if None). Any keyword arguments are passed to
+	:class:`dicomtools.volume.DicomVolume`.
+	'''
+	#
+	loop = asyncio.get_running_loop()
+	return await loop.run_in_executor(executor, functools.partial(DicomVolume, dicom_series, **kwargs))
+#
+async def read_dicom_volume(dicom_file_list, max_concurrent_reads=8, executor=None, **kwargs):
+	r'''
+	Read the DICOMs in a series with :meth:`read_dicom_series` and build a
+	:class:`dicomtools.volume.DicomVolume` with :meth:`load_volume`.
+	'''
+	#
+	dicom_series = await read_dicom_series(dicom_file_list, max_concurrent_reads, executor)
+	return await load_volume(dicom_series, executor, **kwargs)
+#
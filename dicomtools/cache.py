@@ -0,0 +1,110 @@
+import collections
+import threading
+#
+class PixelCache(object):
+	r'''
+	A thread-safe least-recently-used cache of decoded pixel data (numpy arrays), limited
+	to a budget of ``max_bytes``. When adding an array would exceed the budget, the least
+	recently used arrays are evicted. Arrays larger than the whole budget are never
+	cached, so a budget of 0 disables caching.
+	
+	The cached arrays are made read-only, since they are shared by everything that reads
+	the same slice.
+	
+	A single cache can be shared by many :class:`dicomtools.volume.DicomVolume` objects
+	(see :meth:`get_default_pixel_cache`), so that the memory used for decoded slices
+	stays within the budget no matter how many volumes are open.
+	'''
+	def __init__(self, max_bytes):
+		#
+		self.max_bytes = max_bytes
+		self.current_bytes = 0
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self._entries = collections.OrderedDict()
+		self._lock = threading.Lock()
+	#
+	def _evict(self, max_bytes):
+		r'''
+		Evict the least recently used arrays until the cache is within ``max_bytes``. The
+		lock must be held.
+		'''
+		#
+		while self.current_bytes > max_bytes and len(self._entries) > 0:
+			(key, value) = self._entries.popitem(last=False)
+			self.current_bytes -= value.nbytes
+			self.evictions += 1
+		#
+	#
+	def get(self, key, load):
+		r'''
+		Get the array for the key. If it's not in the cache, ``load()`` is called to get the
+		array, which is then added to the cache. The array is loaded without holding the
+		cache's lock, so other threads can use the cache in the meantime.
+		'''
+		#
+		with self._lock:
+			if key in self._entries:
+				value = self._entries.pop(key)
+				self._entries[key] = value
+				# move it to the most recently used end
+				self.hits += 1
+				return value
+			#
+			self.misses += 1
+		#
+		value = load()
+		value.flags.writeable = False
+		#
+		if value.nbytes <= self.max_bytes:
+			with self._lock:
+				if key not in self._entries:
+					self._entries[key] = value
+					self.current_bytes += value.nbytes
+					self._evict(self.max_bytes)
+				#
+			#
+		#
+		return value
+	#
+	def set_max_bytes(self, max_bytes):
+		r'''
+		Change the budget, evicting arrays if needed.
+		'''
+		#
+		with self._lock:
+			self.max_bytes = max_bytes
+			self._evict(max_bytes)
+		#
+	#
+	def clear(self):
+		r'''
+		Remove all of the arrays from the cache.
+		'''
+		#
+		with self._lock:
+			self._entries.clear()
+			self.current_bytes = 0
+		#
+	#
+	def get_stats(self):
+		r'''
+		Get a dictionary of the cache statistics.
+		'''
+		#
+		with self._lock:
+			return {'max_bytes': self.max_bytes, 'current_bytes': self.current_bytes, 'num_of_arrays': len(self._entries), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+		#
+	#
+#
+_default_pixel_cache = PixelCache(256*1024*1024)
+#
+def get_default_pixel_cache():
+	r'''
+	Get the pixel cache shared by all volumes which weren't given their own cache. It has
+	a budget of 256 MiB, which can be changed with :meth:`PixelCache.set_max_bytes`.
+	'''
+	#
+	return _default_pixel_cache
+#
@@ -0,0 +1,197 @@
+import numpy as np
+import itertools
+import json
+import os
+import shutil
+import zlib
+#
+from . import cache
+from . import coordinates
+from .volume import _get_volume_metadata
+#
+# A chunked on-disk format for volumes. The volume is split into tiles (64 x 64 x 64 voxels
+# by default), each stored in its own (optionally zlib compressed) file, so reading a small
+# box or a slice along any axis only reads the tiles which overlap it:
+#
+#	directory/
+#		metadata.json		the shape, chunk shape, type, compression and volume info
+#		chunks/x_y_z		the tile at chunk index (x, y, z)
+#
+_COMPRESSIONS = [None, 'zlib']
+#
+def _get_chunk_filename(directory, chunk_index):
+	return os.path.join(directory, 'chunks', '_'.join(str(x) for x in chunk_index))
+#
+def _get_num_of_chunks(shape, chunk_shape):
+	return tuple((x+y-1)//y for (x, y) in zip(shape, chunk_shape))
+#
+def write_chunked_volume(dicom_volume, directory, chunk_shape=(64, 64, 64), compression='zlib', dtype=np.double):
+	r'''
+	Save a :class:`dicomtools.volume.DicomVolume` to a chunked volume directory, which can
+	be read with :class:`ChunkedVolume`. The volume is read one slab of ``chunk_shape[2]``
+	slices at a time (see :meth:`dicomtools.volume.DicomVolume.get_slice`), so a volume
+	built without loading its pixel data is never fully loaded into memory.
+	
+	The ``compression`` can be ``'zlib'`` or None. The pixel data is stored as ``dtype``,
+	which must be able to hold the values without any loss (for example, ``np.int16`` for
+	most CT volumes).
+	'''
+	#
+	if compression not in _COMPRESSIONS:
+		raise ValueError('Unknown compression: ' + str(compression))
+	#
+	shape = dicom_volume.get_shape()
+	chunk_shape = tuple(int(x) for x in chunk_shape)
+	num_of_chunks = _get_num_of_chunks(shape, chunk_shape)
+	#
+	partial_directory = directory + '.partial'
+	if os.path.isdir(partial_directory):
+		shutil.rmtree(partial_directory)
+	os.makedirs(os.path.join(partial_directory, 'chunks'))
+	# written to a temporary directory which is renamed once it's complete
+	#
+	try:
+		for z in range(num_of_chunks[2]):
+			slab_slices = range(z*chunk_shape[2], min((z+1)*chunk_shape[2], shape[2]))
+			slab = np.empty((shape[0], shape[1], len(slab_slices)), dtype=dtype)
+			for (x, slice_index) in enumerate(slab_slices):
+				image = dicom_volume.get_slice(slice_index)
+				slab[:,:,x] = image
+				if not np.array_equal(slab[:,:,x], image):
+					raise ValueError('The pixel data cannot be stored as {} without loss.'.format(np.dtype(dtype).name))
+				#
+			#
+			for (x, y) in itertools.product(range(num_of_chunks[0]), range(num_of_chunks[1])):
+				chunk = np.ascontiguousarray(slab[x*chunk_shape[0]:(x+1)*chunk_shape[0], y*chunk_shape[1]:(y+1)*chunk_shape[1]])
+				data = chunk.tobytes()
+				if compression == 'zlib':
+					data = zlib.compress(data)
+				#
+				with open(_get_chunk_filename(partial_directory, (x, y, z)), 'wb') as f:
+					f.write(data)
+				#
+			#
+		#
+		metadata = {'shape': list(shape), 'chunk_shape': list(chunk_shape), 'dtype': np.dtype(dtype).str, 'compression': compression, 'info': _get_volume_metadata(dicom_volume)}
+		with open(os.path.join(partial_directory, 'metadata.json'), 'w') as f:
+			json.dump(metadata, f, indent=2, sort_keys=True)
+		#
+	except Exception:
+		shutil.rmtree(partial_directory, ignore_errors=True)
+		raise
+	#
+	if os.path.isdir(directory):
+		shutil.rmtree(directory)
+	os.rename(partial_directory, directory)
+#
+class ChunkedVolume(object):
+	r'''
+	Reads boxes and slices from a chunked volume directory (see
+	:meth:`write_chunked_volume`). Only the chunks which overlap a request are read, and
+	they are kept in the ``pixel_cache`` (a :class:`dicomtools.cache.PixelCache`, by default
+	the cache shared by all volumes), so neighbouring requests don't read them again.
+	Since the chunks are cubes, slices along axes 0 and 1 are as cheap to read as slices
+	along axis 2.
+	
+	The volume info (everything but the pixel data) is in ``info``, with the same keys as
+	:attr:`dicomtools.volume.DicomVolume.info`.
+	
+	Example (a sagittal slice):
+	::
+	
+		>>> dicomtools.chunked.write_chunked_volume(volume, 'volume.chunked', dtype=np.int16)
+		>>> chunked_volume = dicomtools.chunked.ChunkedVolume('volume.chunked')
+		>>> image = chunked_volume.get_slice(100, axis=0)
+	'''
+	def __init__(self, directory, pixel_cache=None):
+		#
+		self.directory = directory
+		with open(os.path.join(directory, 'metadata.json')) as f:
+			metadata = json.load(f)
+		#
+		self.shape = tuple(metadata['shape'])
+		self.chunk_shape = tuple(metadata['chunk_shape'])
+		self.dtype = np.dtype(str(metadata['dtype']))
+		self.compression = metadata['compression']
+		#
+		self.description = metadata['info'].pop('description')
+		metadata['info'].pop('shape')
+		self.info = dict((x, np.array(y) if isinstance(y, list) else y) for (x, y) in metadata['info'].items())
+		#
+		self._pixel_cache = pixel_cache if pixel_cache is not None else cache.get_default_pixel_cache()
+		self._cache_token = object()
+	#
+	def get_shape(self):
+		return self.shape
+	#
+	def build_image_to_patient_matrix(self):
+		r'''
+		See :meth:`dicomtools.volume.DicomVolume.build_image_to_patient_matrix`.
+		'''
+		#
+		return coordinates.build_image_to_patient_matrix(self.info['position'], self.info['pixel_spacing'], self.info['row_vec'], self.info['col_vec'], self.info.get('slice_vec'))
+	#
+	def _read_chunk(self, chunk_index):
+		r'''
+		Read and decompress a single chunk from its file.
+		'''
+		#
+		chunk_shape = tuple(min(x, y-i*x) for (x, y, i) in zip(self.chunk_shape, self.shape, chunk_index))
+		# the chunks at the far edges of the volume can be smaller
+		with open(_get_chunk_filename(self.directory, chunk_index), 'rb') as f:
+			data = f.read()
+		#
+		if self.compression == 'zlib':
+			data = zlib.decompress(data)
+		#
+		return np.frombuffer(data, dtype=self.dtype).reshape(chunk_shape)
+	#
+	def _get_chunk(self, chunk_index):
+		return self._pixel_cache.get((self._cache_token, chunk_index), lambda: self._read_chunk(chunk_index))
+	#
+	def read_region(self, start, stop):
+		r'''
+		Read the box of voxels from ``start`` (inclusive) to ``stop`` (exclusive), which are
+		clipped to the volume. Only the chunks overlapping the box are read. The region has
+		the stored type.
+		'''
+		#
+		start = np.clip(np.asarray(start, dtype=np.intp), 0, self.shape)
+		stop = np.clip(np.asarray(stop, dtype=np.intp), start, self.shape)
+		chunk_shape = np.array(self.chunk_shape)
+		#
+		region = np.empty(tuple(stop-start), dtype=self.dtype)
+		if region.size == 0:
+			return region
+		#
+		first_chunk = start//chunk_shape
+		last_chunk = (stop-1)//chunk_shape
+		for chunk_index in itertools.product(*[range(x, y+1) for (x, y) in zip(first_chunk, last_chunk)]):
+			chunk_start = np.array(chunk_index)*chunk_shape
+			# the overlap of the chunk and the box, in volume coordinates
+			overlap_start = np.maximum(start, chunk_start)
+			overlap_stop = np.minimum(stop, chunk_start+chunk_shape)
+			#
+			chunk = self._get_chunk(chunk_index)
+			region[tuple(slice(x, y) for (x, y) in zip(overlap_start-start, overlap_stop-start))] = chunk[tuple(slice(x, y) for (x, y) in zip(overlap_start-chunk_start, overlap_stop-chunk_start))]
+		#
+		return region
+	#
+	def get_slice(self, index, axis=2):
+		r'''
+		Get a single slice of the volume along any axis, in the stored type. Negative
+		indices count from the end of the axis.
+		'''
+		#
+		if index < 0:
+			index += self.shape[axis]
+		if index < 0 or index >= self.shape[axis]:
+			raise IndexError('Slice index {} is out of range for axis {} with {} slices.'.format(index, axis, self.shape[axis]))
+		#
+		start = [0, 0, 0]
+		stop = list(self.shape)
+		(start[axis], stop[axis]) = (index, index+1)
+		#
+		return np.squeeze(self.read_region(start, stop), axis=axis)
+	#
+#
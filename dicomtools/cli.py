@@ -0,0 +1,148 @@
+import numpy as np
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+#
+from . import dicom_read
+from . import volume
+#
+# The 'dicomtools' console command, which converts every DICOM series found within the
+# given directories to image stacks or numpy array files.
+#
+_FORMATS = ['png', 'npy', 'npz']
+#
+def _convert_series(task):
+	r'''
+	Convert a single series. The output is written to a temporary directory which is
+	renamed once the conversion is complete, so a partially converted series is never
+	mistaken for a finished one. Returns a tuple of the series UID, the status
+	(``'converted'``, ``'skipped'`` or ``'failed'``) and a message.
+	'''
+	#
+	(uid, filenames, output_directory, output_format) = task
+	series_directory = os.path.join(output_directory, uid)
+	partial_directory = series_directory + '.partial'
+	#
+	if os.path.isdir(series_directory):
+		return (uid, 'skipped', 'already converted')
+	#
+	try:
+		if os.path.isdir(partial_directory):
+			shutil.rmtree(partial_directory)
+			# left over from an interrupted run
+		os.makedirs(partial_directory)
+		#
+		dicom_volume = volume.DicomVolume(dicom_read.read_dicom_series(filenames))
+		#
+		if output_format == 'png':
+			dicom_volume.export_images(partial_directory, 'image')
+		elif output_format == 'npy':
+			np.save(os.path.join(partial_directory, 'pixel_data.npy'), dicom_volume.info['pixel_data'])
+		elif output_format == 'npz':
+			np.savez_compressed(os.path.join(partial_directory, 'pixel_data.npz'), pixel_data=dicom_volume.info['pixel_data'])
+		#
+		with open(os.path.join(partial_directory, 'metadata.json'), 'w') as f:
+			json.dump(volume._get_volume_metadata(dicom_volume), f, indent=2, sort_keys=True)
+		#
+		os.rename(partial_directory, series_directory)
+	except Exception as e:
+		shutil.rmtree(partial_directory, ignore_errors=True)
+		return (uid, 'failed', str(e))
+	#
+	return (uid, 'converted', '{} files'.format(len(filenames)))
+#
+def find_series(paths):
+	r'''
+	Find all of the series within the given directories or 'DICOMDIR' files. Returns a
+	dictionary of lists of filenames, keyed by the series UID.
+	'''
+	#
+	series = {}
+	for path in paths:
+		if os.path.isfile(path) and os.path.basename(path).upper() == 'DICOMDIR':
+			path = os.path.dirname(os.path.abspath(path))
+		#
+		for (uid, filenames) in dicom_read.find_dicom_series(path).items():
+			series.setdefault(uid, []).extend(filenames)
+		#
+	#
+	return series
+#
+def convert_series(series, output_directory, output_format='npz', workers=1, progress=None):
+	r'''
+	Convert each of the series (a dictionary of lists of filenames, keyed by the series
+	UID) and save them to a directory named by the series UID within the output directory.
+	Series which have already been converted are skipped, so an interrupted conversion can
+	be resumed. The series are converted in parallel using ``workers`` processes.
+	
+	If given, ``progress`` is called with ``(num_finished, num_total, result)`` after each
+	series is finished, where ``result`` is a tuple of the series UID, the status
+	(``'converted'``, ``'skipped'`` or ``'failed'``) and a message. Returns a list of all
+	the results.
+	'''
+	#
+	if output_format not in _FORMATS:
+		raise ValueError('Unknown output format: ' + str(output_format))
+	#
+	if not os.path.isdir(output_directory):
+		os.makedirs(output_directory)
+	#
+	tasks = [(uid, series[uid], output_directory, output_format) for uid in sorted(series)]
+	#
+	if workers > 1:
+		pool = multiprocessing.Pool(workers)
+		results_iter = pool.imap_unordered(_convert_series, tasks)
+	else:
+		pool = None
+		results_iter = (_convert_series(x) for x in tasks)
+	#
+	results = []
+	try:
+		for result in results_iter:
+			results.append(result)
+			if progress is not None:
+				progress(len(results), len(tasks), result)
+			#
+		#
+	finally:
+		if pool is not None:
+			pool.close()
+			pool.join()
+		#
+	#
+	return results
+#
+def _print_progress(num_finished, num_total, result):
+	sys.stderr.write('[{}/{}] {}: {} ({})\n'.format(num_finished, num_total, result[0], result[1], result[2]))
+#
+def main(argv=None):
+	r'''
+	The entry point for the ``dicomtools`` console command.
+	'''
+	#
+	parser = argparse.ArgumentParser(prog='dicomtools', description='Convert every DICOM series found within the given directories (or DICOMDIR files) to image stacks or numpy arrays. Each series is saved to a directory named by its series UID, and series which have already been converted are skipped.')
+	parser.add_argument('paths', nargs='+', metavar='PATH', help='a directory or DICOMDIR file')
+	parser.add_argument('-o', '--output', required=True, help='the output directory')
+	parser.add_argument('-f', '--format', choices=_FORMATS, default='npz', help='png images, or the pixel data as a numpy array (default: %(default)s)')
+	parser.add_argument('-j', '--workers', type=int, default=multiprocessing.cpu_count(), help='number of worker processes (default: %(default)s)')
+	parser.add_argument('-q', '--quiet', action='store_true', help='do not print progress')
+	args = parser.parse_args(argv)
+	#
+	series = find_series(args.paths)
+	if not args.quiet:
+		sys.stderr.write('Found {} series\n'.format(len(series)))
+	#
+	results = convert_series(series, args.output, args.format, args.workers, None if args.quiet else _print_progress)
+	#
+	failed = [x for x in results if x[1] == 'failed']
+	if not args.quiet:
+		sys.stderr.write('Converted {}, skipped {}, failed {}\n'.format(sum(x[1] == 'converted' for x in results), sum(x[1] == 'skipped' for x in results), len(failed)))
+	#
+	return 1 if len(failed) > 0 else 0
+#
+if __name__ == '__main__':
+	sys.exit(main())
+#
@@ -0,0 +1,150 @@
+import numpy as np
+#
+from . import coordinates
+#
+# Rasterizing planar contours in patient coordinates (such as the ContourData of an RT
+# structure set) into masks aligned to a volume. Each contour is a closed polygon, given
+# as an n x 3 array of points (or a flat list of x, y, z values, as stored in the DICOM).
+#
+def _get_voxel_polygons(dicom_volume, contours):
+	r'''
+	Transform all of the contours to voxel coordinates with a single call. Returns a list
+	of (slice index, n x 2 array of in-slice voxel coordinates) tuples.
+	'''
+	#
+	contours = [np.asarray(x, dtype=np.double).reshape(-1, 3) for x in contours]
+	if len(contours) == 0:
+		return []
+	#
+	pat2img = np.linalg.pinv(dicom_volume.build_image_to_patient_matrix())
+	# a pseudo-inverse, since the matrix of a 2D volume is singular
+	voxels = coordinates.transform_vectors(pat2img, np.concatenate(contours))[:, 0:3]
+	#
+	polygons = []
+	for points in np.split(voxels, np.cumsum([len(x) for x in contours])[:-1]):
+		slice_index = int(np.rint(np.mean(points[:,2])))
+		if np.any(np.abs(points[:,2]-slice_index) >= 0.5):
+			raise ValueError('A contour is not within the plane of a single slice.')
+		#
+		polygons.append((slice_index, points[:, 0:2]))
+	#
+	return polygons
+#
+def _fill_polygons(shape, polygons):
+	r'''
+	Fill the polygons (a list of n x 2 arrays of voxel coordinates) in a 2D mask of the
+	given shape, using a scanline fill with the even-odd rule, so that a polygon within
+	another polygon is a hole. A voxel is filled if its center is within a polygon.
+	
+	All of the edges are intersected with the scanlines they cross at once, and the spans
+	between pairs of intersections are filled with a cumulative sum, so there are no loops
+	over edges or voxels. Only the bounding box of the polygons is filled, which is
+	returned as a tuple of the box's first voxel and its mask, or None if no voxels are
+	filled.
+	'''
+	#
+	start = np.concatenate(polygons)
+	end = np.concatenate([np.roll(x, -1, axis=0) for x in polygons])
+	# the edges from each point to the next, including the edge which closes the polygon
+	#
+	not_horizontal = start[:,1] != end[:,1]
+	(start, end) = (start[not_horizontal], end[not_horizontal])
+	if len(start) == 0:
+		return None
+	#
+	low = np.minimum(start[:,1], end[:,1])
+	high = np.maximum(start[:,1], end[:,1])
+	#
+	first_rows = np.clip(np.ceil(low), 0, shape[1]).astype(np.intp)
+	stop_rows = np.clip(np.ceil(high), 0, shape[1]).astype(np.intp)
+	# each edge crosses the scanlines (lines of voxel centers along axis 0) from its first
+	# row up to its stop row, and the half-open range means that a vertex shared by two
+	# edges is only counted once
+	num_of_crossings = np.maximum(stop_rows-first_rows, 0)
+	if np.sum(num_of_crossings) == 0:
+		return None
+	#
+	edges = np.repeat(np.arange(len(start)), num_of_crossings)
+	crossing_rows = first_rows[edges] + np.arange(len(edges)) - np.repeat(np.cumsum(num_of_crossings)-num_of_crossings, num_of_crossings)
+	crossings = start[edges,0] + (crossing_rows-start[edges,1])*(end[edges,0]-start[edges,0])/(end[edges,1]-start[edges,1])
+	#
+	first_row = np.min(crossing_rows)
+	num_of_rows = np.max(crossing_rows)-first_row+1
+	row_indices = crossing_rows-first_row
+	#
+	order = np.lexsort((crossings, row_indices))
+	(row_indices, crossings) = (row_indices[order], np.clip(np.ceil(crossings[order]), 0, shape[0]).astype(np.intp))
+	# each scanline crosses the polygons an even number of times, so consecutive pairs of
+	# crossings are the spans inside the polygons (the voxels from the first up to the second)
+	#
+	first_column = np.min(crossings)
+	width = np.max(crossings)-first_column+1
+	if width <= 1:
+		return None
+	#
+	span_rows = row_indices[0::2]*width
+	size = num_of_rows*width
+	changes = np.bincount(span_rows+crossings[0::2]-first_column, minlength=size) - np.bincount(span_rows+crossings[1::2]-first_column, minlength=size)
+	filled = np.cumsum(changes.reshape(num_of_rows, width)[:, 0:width-1], axis=1) > 0
+	#
+	return ((first_column, first_row), filled.T)
+#
+def _rasterize_into(mask, polygons, value):
+	r'''
+	Set the voxels of the mask within the polygons to the value, one slice at a time.
+	'''
+	#
+	polygons_by_slice = {}
+	for (slice_index, points) in polygons:
+		if 0 <= slice_index < mask.shape[2]:
+			polygons_by_slice.setdefault(slice_index, []).append(points)
+		#
+	#
+	for (slice_index, slice_polygons) in polygons_by_slice.items():
+		box = _fill_polygons(mask.shape[0:2], slice_polygons)
+		if box is not None:
+			((x, y), filled) = box
+			mask[x:x+filled.shape[0], y:y+filled.shape[1], slice_index][filled] = value
+		#
+	#
+#
+def rasterize_contours(dicom_volume, contours):
+	r'''
+	Build a boolean mask (with the same shape as the volume) of the voxels within the
+	contours, which are closed polygons in patient coordinates. Each contour must lie
+	within a single slice of the volume. Contours on the same slice are combined with the
+	even-odd rule, so a contour within another contour is a hole. Contours outside of the
+	volume are ignored.
+	
+	Example (a structure from an RT structure set):
+	::
+	
+		>>> contours = [x.ContourData for x in rtstruct.ROIContourSequence[0].ContourSequence]
+		>>> mask = dicomtools.contours.rasterize_contours(volume, contours)
+	'''
+	#
+	mask = np.zeros(dicom_volume.get_shape(), dtype=bool)
+	_rasterize_into(mask, _get_voxel_polygons(dicom_volume, contours), True)
+	return mask
+#
+def rasterize_structures(dicom_volume, structures):
+	r'''
+	Build a label volume (with the same shape as the volume) for a list of structures,
+	where each structure is a list of contours (see :meth:`rasterize_contours`). The
+	voxels within structure ``x`` are labelled ``x+1``, and the other voxels are 0. Where
+	structures overlap, the later structure's label is used.
+	
+	The contours of every structure are transformed to voxel coordinates together.
+	'''
+	#
+	contours = [x for structure in structures for x in structure]
+	polygons = _get_voxel_polygons(dicom_volume, contours)
+	#
+	labels = np.zeros(dicom_volume.get_shape(), dtype=np.int32 if len(structures) >= 2**15 else np.int16)
+	start = 0
+	for (x, structure) in enumerate(structures):
+		_rasterize_into(labels, polygons[start:start+len(structure)], x+1)
+		start += len(structure)
+	#
+	return labels
+#
@@ -0,0 +1,192 @@
+import numpy as np
+import collections
+import hashlib
+import multiprocessing
+import os
+from multiprocessing.pool import ThreadPool
+#
+from . import dicom_read
+from . import volume
+#
+def _get_compact_array(pixel_data):
+	r'''
+	Get the pixel data in the smallest type which stores it without any loss, which for
+	most CT and MR volumes is 16 bit integers.
+	'''
+	#
+	for dtype in [np.int16, np.int32, np.float32]:
+		compact = pixel_data.astype(dtype)
+		if np.array_equal(compact, pixel_data):
+			return compact
+		#
+	#
+	return pixel_data
+#
+def _build_sample(dicom_volume):
+	r'''
+	Get the dictionary of arrays for a volume. It contains the volume info (see
+	:attr:`dicomtools.volume.DicomVolume.info`) along with the ``'image_to_patient'``
+	matrix.
+	'''
+	#
+	sample = dict(dicom_volume.info)
+	sample['image_to_patient'] = dicom_volume.build_image_to_patient_matrix()
+	return sample
+#
+def _save_sample(sample, cache_path):
+	r'''
+	Save the sample to the cache as an (uncompressed) npz file. The file is written under a
+	temporary name and then renamed, so a partially written file is never loaded.
+	'''
+	#
+	arrays = dict((x, np.asarray(y)) for (x, y) in sample.items())
+	arrays['pixel_data'] = _get_compact_array(sample['pixel_data'])
+	#
+	partial_path = '{}.{}.partial'.format(cache_path, os.getpid())
+	with open(partial_path, 'wb') as f:
+		np.savez(f, **arrays)
+	#
+	os.rename(partial_path, cache_path)
+#
+def _load_cached_sample(cache_path):
+	with np.load(cache_path) as f:
+		sample = dict((x, f[x]) for x in f.files)
+	#
+	sample['patient_orientation'] = str(sample['patient_orientation'])
+	return sample
+#
+def _load_sample(task):
+	r'''
+	Load a single sample, from the cache if possible. This is run by the workers.
+	'''
+	#
+	(filenames, cache_path, dtype, volume_kwargs) = task
+	#
+	if cache_path is not None and os.path.isfile(cache_path):
+		sample = _load_cached_sample(cache_path)
+	else:
+		sample = _build_sample(volume.DicomVolume(dicom_read.read_dicom_series(filenames), **volume_kwargs))
+		if cache_path is not None:
+			_save_sample(sample, cache_path)
+		#
+	#
+	sample['pixel_data'] = sample['pixel_data'].astype(dtype if dtype is not None else np.double, copy=False)
+	# the cached pixel data is converted straight to the requested type
+	return sample
+#
+class VolumeDataset(object):
+	r'''
+	A dataset of volumes for feeding a training pipeline. Each item is a dictionary with the
+	volume's ``'pixel_data'`` and geometry (the keys of
+	:attr:`dicomtools.volume.DicomVolume.info`, along with the ``'image_to_patient'``
+	matrix and the ``'uid'``).
+	
+	Iterating over the dataset (see :meth:`iterate`) loads the upcoming volumes in
+	background workers. If a ``cache_directory`` is given, each volume is saved there the
+	first time it's loaded, and is loaded from there afterwards, which avoids reading and
+	assembling the DICOMs again in later epochs. The cached pixel data is stored in the
+	smallest type that loses no precision (usually 16 bit integers).
+	
+	Example:
+	::
+	
+		>>> dataset = dicomtools.dataset.VolumeDataset(dicomtools.dicom_read.find_dicom_series(directory), cache_directory='/tmp/cache', dtype=np.float32)
+		>>> for epoch in range(num_of_epochs):
+		...     for sample in dataset.iterate(np.random.permutation(len(dataset)), workers=4):
+		...         train(sample['pixel_data'], sample['image_to_patient'])
+	'''
+	def __init__(self, series, cache_directory=None, dtype=None, **volume_kwargs):
+		r'''
+		The ``series`` is either a list of lists of filenames, or a dictionary of lists of
+		filenames keyed by series UID (such as from
+		:meth:`dicomtools.dicom_read.find_dicom_series`). The pixel data is converted to the
+		``dtype`` if given. Any keyword arguments are passed to
+		:class:`dicomtools.volume.DicomVolume`.
+		'''
+		#
+		if isinstance(series, dict):
+			self.uids = sorted(series)
+			self.filename_lists = [list(series[x]) for x in self.uids]
+		else:
+			self.uids = [None]*len(series)
+			self.filename_lists = [list(x) for x in series]
+		#
+		self.cache_directory = cache_directory
+		self.dtype = dtype
+		self.volume_kwargs = volume_kwargs
+		#
+		if self.cache_directory is not None and not os.path.isdir(self.cache_directory):
+			os.makedirs(self.cache_directory)
+		#
+	#
+	def __len__(self):
+		return len(self.filename_lists)
+	#
+	def _get_cache_path(self, index):
+		r'''
+		Get the cache file for the volume, which is named by a hash of its filenames and
+		the volume options.
+		'''
+		#
+		if self.cache_directory is None:
+			return None
+		#
+		key = repr((sorted(self.filename_lists[index]), sorted(self.volume_kwargs.items())))
+		return os.path.join(self.cache_directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.npz')
+	#
+	def _get_task(self, index):
+		return (self.filename_lists[index], self._get_cache_path(index), self.dtype, self.volume_kwargs)
+	#
+	def _finish_sample(self, index, sample):
+		sample['uid'] = self.uids[index]
+		return sample
+	#
+	def __getitem__(self, index):
+		return self._finish_sample(index, _load_sample(self._get_task(index)))
+	#
+	def __iter__(self):
+		return self.iterate()
+	#
+	def iterate(self, indices=None, workers=2, prefetch=None, processes=False):
+		r'''
+		Iterate over the samples at the ``indices`` (all of them, in order, by default). While
+		a sample is being used, up to ``prefetch`` (by default twice the number of workers)
+		upcoming samples are loaded by ``workers`` threads, or processes if ``processes`` is
+		True. Processes avoid contending for the GIL while parsing the DICOMs, but the pixel
+		data has to be copied back from them.
+		'''
+		#
+		if indices is None:
+			indices = range(len(self))
+		#
+		indices = list(indices)
+		if workers <= 0:
+			for index in indices:
+				yield self[index]
+			#
+			return
+		#
+		if prefetch is None:
+			prefetch = 2*workers
+		#
+		pool = multiprocessing.Pool(workers) if processes else ThreadPool(workers)
+		pending = collections.deque()
+		try:
+			for index in indices:
+				pending.append((index, pool.apply_async(_load_sample, (self._get_task(index),))))
+				if len(pending) > prefetch:
+					(next_index, result) = pending.popleft()
+					yield self._finish_sample(next_index, result.get())
+				#
+			#
+			while len(pending) > 0:
+				(next_index, result) = pending.popleft()
+				yield self._finish_sample(next_index, result.get())
+			#
+		finally:
+			pool.terminate()
+			pool.join()
+			# stops any prefetching which is no longer needed if the iteration was stopped early
+		#
+	#
+#
@@ -1,9 +1,54 @@
 import numpy as np
 import dicom
+import io
 import os
+import tarfile
 import warnings
+import zipfile
 #
-from .series import DicomSeries
+from .series import DicomSeries, CompactDicomInstance, CompactDicomSeries
+from . import profiling
+#
+def _is_dicom_data(dicom_file):
+	r'''
+	Check if the argument is the contents of a DICOM file rather than a path. Bytes are
+	taken to be file contents if they have the 'DICM' prefix after the 128 byte preamble
+	(so that they can't be confused with a path on python 2), and bytearrays and
+	memoryviews are always taken to be file contents.
+	'''
+	#
+	if isinstance(dicom_file, (bytearray, memoryview)):
+		return True
+	#
+	return isinstance(dicom_file, bytes) and dicom_file[128:132] == b'DICM'
+#
+def _read_file(dicom_file):
+	r'''
+	Read a single DICOM, recording the time and number of bytes read for any active
+	profilers. The DICOM can be a path, the contents of a DICOM file (see
+	:meth:`_is_dicom_data`), or a file-like object which is read from its current
+	position.
+	'''
+	#
+	if _is_dicom_data(dicom_file):
+		dicom_file = io.BytesIO(bytes(dicom_file))
+	#
+	is_file_object = hasattr(dicom_file, 'read')
+	if is_file_object:
+		start_position = dicom_file.tell()
+	#
+	with profiling.stage('dicom_read.read_file'):
+		dicom_instance = dicom.read_file(dicom_file)
+	#
+	if profiling.is_active():
+		if is_file_object:
+			num_of_bytes = dicom_file.tell()-start_position
+		else:
+			num_of_bytes = os.path.getsize(dicom_file)
+		#
+		profiling.count('dicom_read.read_file', 'bytes_read', num_of_bytes)
+	#
+	return dicom_instance
 #
 def _get_all_series_from_dicomdir(dicomdir_file):
 	r'''
@@ -46,25 +91,159 @@ def read_dicomdir(dicomdir_file):
 	#
 	series_list = _get_all_series_from_dicomdir(dicomdir_file)
 	# this is a list of series, each series containing the paths to dicom files within that series
-	loaded_series_list = [[dicom.read_file(x) for x in y] for y in series_list]
+	loaded_series_list = [[_read_file(x) for x in y] for y in series_list]
 	# this is a list of series, each series containing the loaded dicom files within that series
 	#
 	return [DicomSeries(x) for x in loaded_series_list]
 #
 def read_dicom(dicom_file):
 	r'''
-	Build a DicomSeries object containing the DICOM.
+	Build a DicomSeries object containing the DICOM. The DICOM can be a path, the
+	contents of a DICOM file as bytes, or a file-like object.
 	'''
 	#
-	return DicomSeries([dicom.read_file(dicom_file)])
+	return DicomSeries([_read_file(dicom_file)])
 #
 def read_dicom_series(dicom_file_list):
 	r'''
-	Build a DicomSeries object containing all of the given DICOMs in a series.
+	Build a DicomSeries object containing all of the given DICOMs in a series. Each DICOM
+	can be a path, the contents of a DICOM file as bytes (for example received over the
+	network), or a file-like object (for example from :meth:`zipfile.ZipFile.open`).
 	'''
 	#
-	loaded_series = [dicom.read_file(x) for x in dicom_file_list]
+	loaded_series = [_read_file(x) for x in dicom_file_list]
 	# this is a series containing the loaded dicom files within that series
 	#
 	return DicomSeries(loaded_series)
 #
+def find_dicom_series(directory):
+	r'''
+	Search a directory (recursively) for DICOM files, and group them by their
+	``SeriesInstanceUID``. Only the headers are read, so this is much faster than loading
+	the files. Files which cannot be read as DICOM are ignored. If the directory contains a
+	'DICOMDIR' file, the series are taken from it instead.
+	
+	Returns a dictionary of lists of filenames, keyed by the series UID.
+	'''
+	#
+	dicomdir_file = os.path.join(directory, 'DICOMDIR')
+	if os.path.isfile(dicomdir_file):
+		filename_lists = _get_all_series_from_dicomdir(dicomdir_file)
+	else:
+		filename_lists = [[os.path.join(x[0], y) for y in sorted(x[2])] for x in os.walk(directory)]
+	#
+	series = {}
+	for filenames in filename_lists:
+		for filename in filenames:
+			try:
+				header = dicom.read_file(filename, stop_before_pixels=True)
+				uid = header.SeriesInstanceUID
+			except Exception:
+				# not a DICOM file (or not a DICOM instance belonging to a series)
+				continue
+			#
+			series.setdefault(uid, []).append(filename)
+		#
+	#
+	return series
+#
+def iter_archive_members(archive_file):
+	r'''
+	Iterate over the files in a zip or tar archive (optionally gzip or bzip2 compressed),
+	yielding ``(member_name, data)`` tuples where ``data`` is the file's contents as bytes.
+	The archive can be a path or a file-like object. The members are read directly from
+	the archive, one at a time, without being extracted to disk. Tar archives are read as
+	a stream, so a non-seekable file-like object (such as an HTTP response) can be used.
+	'''
+	#
+	is_file_object = hasattr(archive_file, 'read')
+	#
+	if is_file_object:
+		is_zip = hasattr(archive_file, 'seek') and zipfile.is_zipfile(archive_file)
+		if hasattr(archive_file, 'seek'):
+			archive_file.seek(0)
+		#
+	else:
+		is_zip = zipfile.is_zipfile(archive_file)
+	#
+	if is_zip:
+		with zipfile.ZipFile(archive_file) as archive:
+			for member in archive.infolist():
+				if not member.filename.endswith('/'):
+					yield (member.filename, archive.read(member))
+				#
+			#
+		#
+	else:
+		if is_file_object:
+			archive = tarfile.open(fileobj=archive_file, mode='r|*')
+		else:
+			archive = tarfile.open(archive_file, mode='r:*')
+		#
+		try:
+			for member in archive:
+				if member.isfile():
+					yield (member.name, archive.extractfile(member).read())
+				#
+			#
+		finally:
+			archive.close()
+		#
+	#
+#
+def read_dicom_archive(archive_file):
+	r'''
+	Build a list of DicomSeries objects, one for each series in a zip or tar archive (see
+	:meth:`iter_archive_members`). The DICOMs are read from the archive in memory, without
+	being extracted to disk. Members which cannot be read as DICOM are ignored.
+	'''
+	#
+	series = {}
+	uids = []
+	for (name, data) in iter_archive_members(archive_file):
+		try:
+			dicom_instance = _read_file(io.BytesIO(data))
+			uid = dicom_instance.SeriesInstanceUID
+		except Exception:
+			# not a DICOM file (or not a DICOM instance belonging to a series)
+			continue
+		#
+		if uid not in series:
+			series[uid] = []
+			uids.append(uid)
+		#
+		series[uid].append(dicom_instance)
+	#
+	return [DicomSeries(series[x]) for x in uids]
+#
+def _read_compact_instance(dicom_file, shared_values):
+	r'''
+	Read the header of a DICOM file (but not the pixel data) into a
+	:class:`dicomtools.series.CompactDicomInstance`.
+	'''
+	#
+	with profiling.stage('dicom_read.read_file'):
+		with open(dicom_file, 'rb') as f:
+			header = dicom.read_file(f, stop_before_pixels=True)
+			pixel_offset = f.tell()
+			# pydicom stops at the start of the pixel data element
+			has_pixel_data = f.read(4) != b''
+		#
+	#
+	if profiling.is_active():
+		profiling.count('dicom_read.read_file', 'bytes_read', pixel_offset)
+	#
+	return CompactDicomInstance(header, dicom_file, pixel_offset if has_pixel_data else None, shared_values)
+#
+def read_compact_dicom_series(dicom_file_list):
+	r'''
+	Build a :class:`dicomtools.series.CompactDicomSeries` for the given DICOMs in a series.
+	Only the headers are read, and only the attributes needed to build a
+	:class:`dicomtools.volume.DicomVolume` are kept. The pixel data is read from the files
+	when it's needed, so this uses much less memory than
+	:meth:`read_dicom_series` for large numbers of instances.
+	'''
+	#
+	shared_values = {}
+	return CompactDicomSeries([_read_compact_instance(x, shared_values) for x in dicom_file_list])
+#
@@ -0,0 +1,301 @@
+import numpy as np
+import copy
+import dicom
+import dicom.UID
+import os
+import time
+from dicom.dataset import Dataset, FileDataset
+#
+from . import coordinates
+from . import profiling
+from ._streaming import map_with_workers
+from .series import CompactDicomInstance
+#
+IMPLEMENTATION_CLASS_UID = '1.2.826.0.1.3680043.8.498.497200579904714615426333857872'
+# identifies dicomtools as the software which wrote the files
+#
+_PER_INSTANCE_KEYWORDS = ['SOPInstanceUID', 'InstanceNumber', 'ImagePositionPatient', 'SliceLocation',
+                          'NumberOfFrames', 'PerFrameFunctionalGroupsSequence', 'SharedFunctionalGroupsSequence',
+                          'DimensionOrganizationSequence', 'DimensionIndexSequence',
+                          'PixelData', 'LargestImagePixelValue', 'SmallestImagePixelValue',
+                          'SmallestPixelValueInSeries', 'LargestPixelValueInSeries', 'PixelPaddingValue',
+                          'PixelPaddingRangeLimit', 'WindowCenter', 'WindowWidth', 'WindowCenterWidthExplanation',
+                          'VOILUTSequence', 'ModalityLUTSequence']
+# attributes of the source instances which don't apply to the written instances (or
+# which depend on the source pixel values)
+#
+_ENHANCED_CT_IMAGE_STORAGE = '1.2.840.10008.5.1.4.1.1.2.1'
+_ENHANCED_MR_IMAGE_STORAGE = '1.2.840.10008.5.1.4.1.1.4.1'
+_ENHANCED_PET_IMAGE_STORAGE = '1.2.840.10008.5.1.4.1.1.130'
+#
+_ENHANCED_SOP_CLASSES = {
+	'1.2.840.10008.5.1.4.1.1.2': _ENHANCED_CT_IMAGE_STORAGE,
+	'1.2.840.10008.5.1.4.1.1.4': _ENHANCED_MR_IMAGE_STORAGE,
+	'1.2.840.10008.5.1.4.1.1.128': _ENHANCED_PET_IMAGE_STORAGE,
+}
+# the enhanced (multi-frame) SOP class for each single-frame CT, MR and PET SOP class
+#
+_FRAME_TYPE_KEYWORDS = {
+	_ENHANCED_CT_IMAGE_STORAGE: 'CTImageFrameTypeSequence',
+	_ENHANCED_MR_IMAGE_STORAGE: 'MRImageFrameTypeSequence',
+	_ENHANCED_PET_IMAGE_STORAGE: 'PETFrameTypeSequence',
+}
+# the functional group with the frame type of each enhanced SOP class
+#
+def _round_for_decimal_string(value):
+	r'''
+	Round a value so that it fits in a DICOM decimal string (at most 16 characters).
+	'''
+	#
+	return float('{:.10g}'.format(value))
+#
+def _encode_pixel_data(pixel_data):
+	r'''
+	Get the stored pixel values (16 bit integers) for the pixel data, along with the
+	rescale slope and intercept. Integer values which fit in 16 bits (such as CT numbers)
+	are stored exactly, while other values are scaled to the full 16 bit range.
+	'''
+	#
+	int16 = np.iinfo(np.int16)
+	low = float(np.min(pixel_data))
+	high = float(np.max(pixel_data))
+	#
+	if int16.min <= low and high <= int16.max and np.array_equal(pixel_data, np.rint(pixel_data)):
+		return (pixel_data.astype(np.int16), 1.0, 0.0)
+	#
+	slope = _round_for_decimal_string((high-low)/(int16.max-int16.min)) if high > low else 1.0
+	intercept = _round_for_decimal_string(low - int16.min*slope)
+	# rounded before encoding, so that the stored values match the written slope and intercept
+	stored = np.clip(np.rint((pixel_data-intercept)/slope), int16.min, int16.max)
+	return (stored.astype(np.int16), slope, intercept)
+#
+def _get_sop_class_uid(source_sop_class_uid, multiframe):
+	r'''
+	Get the SOP class of the written instances. Multi-frame instances use the enhanced
+	(multi-frame) SOP class of a CT, MR or PET source series, and single-frame instances
+	use the single-frame SOP class of an enhanced source series. Other SOP classes can
+	only be written as single-frame instances, and are kept.
+	'''
+	#
+	if not multiframe:
+		single_frame_sop_classes = dict((y, x) for (x, y) in _ENHANCED_SOP_CLASSES.items())
+		return single_frame_sop_classes.get(source_sop_class_uid, source_sop_class_uid)
+	#
+	if source_sop_class_uid in _FRAME_TYPE_KEYWORDS:
+		return source_sop_class_uid
+	if source_sop_class_uid in _ENHANCED_SOP_CLASSES:
+		return _ENHANCED_SOP_CLASSES[source_sop_class_uid]
+	#
+	raise ValueError('Only CT, MR and PET series can be written as multi-frame instances, not SOP class {}.'.format(source_sop_class_uid))
+#
+def _new_dimension_index(dimension_organization_uid, index_pointer, label):
+	dimension_index = Dataset()
+	dimension_index.DimensionOrganizationUID = dimension_organization_uid
+	dimension_index.DimensionIndexPointer = index_pointer
+	dimension_index.FunctionalGroupPointer = 0x00209111
+	# the Frame Content Sequence
+	dimension_index.DimensionDescriptionLabel = label
+	return dimension_index
+#
+def _get_template(dicom_volume):
+	r'''
+	Get a copy of the header of the volume's first instance, to use for the attributes
+	(patient, study, equipment, etc) which the written instances share with the source.
+	Private attributes are not copied, since their meaning is unknown.
+	'''
+	#
+	instance = dicom_volume.image_instances[0]
+	if isinstance(instance, CompactDicomInstance):
+		instance = dicom.read_file(instance.filename, stop_before_pixels=True)
+		# the compact record doesn't keep the whole header
+	#
+	template = Dataset()
+	for element in instance:
+		if element.keyword not in _PER_INSTANCE_KEYWORDS and not element.tag.is_private:
+			template.add(copy.deepcopy(element))
+			# so that changing the template doesn't change the source instance
+		#
+	#
+	return template
+#
+def _new_dataset(template, sop_instance_uid):
+	r'''
+	Build a dataset for a new instance from the template. The elements are shared with the
+	template rather than copied, so only attributes which aren't in the template should be
+	set on it.
+	'''
+	#
+	dataset = Dataset()
+	for element in template:
+		dataset.add(element)
+	#
+	dataset.file_meta = Dataset()
+	dataset.file_meta.TransferSyntaxUID = dicom.UID.ExplicitVRLittleEndian
+	dataset.file_meta.MediaStorageSOPClassUID = template.SOPClassUID
+	dataset.file_meta.MediaStorageSOPInstanceUID = sop_instance_uid
+	dataset.file_meta.ImplementationClassUID = IMPLEMENTATION_CLASS_UID
+	dataset.SOPInstanceUID = sop_instance_uid
+	return dataset
+#
+def _save_dataset(dataset, filename):
+	with profiling.stage('dicom_write.save_file'):
+		file_dataset = FileDataset(filename, dataset, file_meta=dataset.file_meta, preamble=b'\0'*128)
+		file_dataset.is_little_endian = True
+		file_dataset.is_implicit_VR = False
+		file_dataset.save_as(filename)
+	#
+	return filename
+#
+def write_dicom_series(dicom_volume, directory, pixel_data=None, multiframe=False, series_description=None, workers=1, filename_prefix='IM'):
+	r'''
+	Write a :class:`dicomtools.volume.DicomVolume` (for example, after processing its pixel
+	data) as a new DICOM series, with either one single-frame instance per slice or a
+	single multi-frame instance if ``multiframe`` is True. The ``pixel_data`` defaults to
+	the volume's ``info['pixel_data']``, and must have the same shape.
+	
+	The patient, study and other attributes are copied from the volume's source series,
+	and the series gets a new ``SeriesInstanceUID``. The instances are marked as derived
+	(``ImageType`` of ``DERIVED\SECONDARY``), and the window, pixel padding and private
+	attributes of the source are not copied. The geometry (positions, orientation
+	and spacing) is taken from the volume, so it's correct for a region of a volume as well.
+	The pixel data is stored as 16 bit integers with a rescale slope and intercept. Integer
+	values which fit in 16 bits are stored exactly, and other values are scaled to the 16
+	bit range.
+	
+	The SOP class of the source series is kept, except that a multi-frame instance is
+	written as an enhanced CT, MR or PET image (with the multi-frame functional groups and
+	dimensions), and a ``ValueError`` is raised for other SOP classes. The modality-specific
+	acquisition attributes of the enhanced images are only written if the source series
+	has them.
+	
+	Single-frame instances are written in parallel using ``workers`` threads. Returns the
+	list of written filenames.
+	'''
+	#
+	if pixel_data is None:
+		pixel_data = dicom_volume.info['pixel_data']
+	#
+	if pixel_data.shape != dicom_volume.get_shape():
+		raise ValueError('The pixel data does not have the same shape as the volume.')
+	#
+	(stored, slope, intercept) = _encode_pixel_data(pixel_data)
+	num_of_slices = stored.shape[2]
+	#
+	positions = coordinates.transform_vectors(dicom_volume.build_image_to_patient_matrix(), np.column_stack([np.zeros((num_of_slices, 2)), np.arange(num_of_slices)]))
+	# the position of the first voxel of every slice, computed at once
+	#
+	template = _get_template(dicom_volume)
+	template.SOPClassUID = _get_sop_class_uid(template.SOPClassUID, multiframe)
+	template.SeriesInstanceUID = dicom.UID.generate_uid()
+	if series_description is not None:
+		template.SeriesDescription = series_description
+	#
+	template.Rows = stored.shape[1]
+	template.Columns = stored.shape[0]
+	template.SamplesPerPixel = 1
+	template.PhotometricInterpretation = 'MONOCHROME2'
+	template.BitsAllocated = 16
+	template.BitsStored = 16
+	template.HighBit = 15
+	template.PixelRepresentation = 1
+	template.PatientPosition = dicom_volume.info['patient_orientation']
+	template.ImageType = ['DERIVED', 'SECONDARY']
+	#
+	orientation = [_round_for_decimal_string(x) for x in np.concatenate([dicom_volume.info['row_vec'], dicom_volume.info['col_vec']])]
+	pixel_spacing = [_round_for_decimal_string(x) for x in dicom_volume.info['pixel_spacing'][0:2]]
+	slice_thickness = _round_for_decimal_string(dicom_volume.info['pixel_size'][2])
+	#
+	if not os.path.isdir(directory):
+		os.makedirs(directory)
+	#
+	if multiframe:
+		rescale_type = str(template.RescaleType) if 'RescaleType' in template else ('HU' if template.SOPClassUID == _ENHANCED_CT_IMAGE_STORAGE else 'US')
+		for keyword in ['ImagePositionPatient', 'ImageOrientationPatient', 'PixelSpacing', 'SliceThickness', 'RescaleSlope', 'RescaleIntercept', 'RescaleType']:
+			if keyword in template:
+				delattr(template, keyword)
+			#
+		#
+		image_type = ['DERIVED', 'SECONDARY', 'VOLUME', 'NONE']
+		template.ImageType = image_type
+		template.ContentDate = time.strftime('%Y%m%d')
+		template.ContentTime = time.strftime('%H%M%S')
+		template.PixelPresentation = 'MONOCHROME'
+		template.VolumetricProperties = 'VOLUME'
+		template.VolumeBasedCalculationTechnique = 'NONE'
+		template.PresentationLUTShape = 'IDENTITY'
+		defaults = {'ContentQualification': 'PRODUCT', 'BurnedInAnnotation': 'NO'}
+		if template.SOPClassUID == _ENHANCED_MR_IMAGE_STORAGE:
+			defaults.update({'ComplexImageComponent': 'MAGNITUDE', 'AcquisitionContrast': 'UNKNOWN'})
+		#
+		for (keyword, value) in defaults.items():
+			if keyword not in template:
+				setattr(template, keyword, value)
+			#
+		#
+		dimension_organization = Dataset()
+		dimension_organization.DimensionOrganizationUID = dicom.UID.generate_uid()
+		template.DimensionOrganizationSequence = [dimension_organization]
+		template.DimensionIndexSequence = [
+			_new_dimension_index(dimension_organization.DimensionOrganizationUID, 0x00209056, 'Stack ID'),
+			_new_dimension_index(dimension_organization.DimensionOrganizationUID, 0x00209057, 'In-Stack Position Number'),
+		]
+		# the frames are a single stack, ordered by their position in it
+		#
+		dataset = _new_dataset(template, dicom.UID.generate_uid())
+		dataset.InstanceNumber = 1
+		dataset.NumberOfFrames = num_of_slices
+		#
+		frame_type = Dataset()
+		frame_type.FrameType = image_type
+		shared = Dataset()
+		setattr(shared, _FRAME_TYPE_KEYWORDS[template.SOPClassUID], [frame_type])
+		dataset.SharedFunctionalGroupsSequence = [shared]
+		#
+		measures = Dataset()
+		measures.PixelSpacing = pixel_spacing
+		measures.SliceThickness = slice_thickness
+		plane_orientation = Dataset()
+		plane_orientation.ImageOrientationPatient = orientation
+		value_transformation = Dataset()
+		value_transformation.RescaleSlope = slope
+		value_transformation.RescaleIntercept = intercept
+		value_transformation.RescaleType = rescale_type
+		# the same for every frame, so the frames share them (they stay in the per-frame
+		# groups, since that's where DicomVolume reads them from)
+		#
+		frames = []
+		for x in range(num_of_slices):
+			plane_position = Dataset()
+			plane_position.ImagePositionPatient = [_round_for_decimal_string(y) for y in positions[x]]
+			frame_content = Dataset()
+			frame_content.StackID = '1'
+			frame_content.InStackPositionNumber = x+1
+			frame_content.DimensionIndexValues = [1, x+1]
+			frame = Dataset()
+			frame.FrameContentSequence = [frame_content]
+			frame.PixelMeasuresSequence = [measures]
+			frame.PlanePositionSequence = [plane_position]
+			frame.PlaneOrientationSequence = [plane_orientation]
+			frame.PixelValueTransformationSequence = [value_transformation]
+			frames.append(frame)
+		#
+		dataset.PerFrameFunctionalGroupsSequence = frames
+		dataset.PixelData = np.ascontiguousarray(np.transpose(stored, (2, 1, 0))).astype('<i2').tobytes()
+		#
+		return [_save_dataset(dataset, os.path.join(directory, '{}_00000.dcm'.format(filename_prefix)))]
+	#
+	template.ImageOrientationPatient = orientation
+	template.PixelSpacing = pixel_spacing
+	template.SliceThickness = slice_thickness
+	template.RescaleSlope = slope
+	template.RescaleIntercept = intercept
+	#
+	def write_slice(x):
+		dataset = _new_dataset(template, dicom.UID.generate_uid())
+		dataset.InstanceNumber = x+1
+		dataset.ImagePositionPatient = [_round_for_decimal_string(y) for y in positions[x]]
+		dataset.PixelData = np.ascontiguousarray(stored[:,:,x].T).astype('<i2').tobytes()
+		return _save_dataset(dataset, os.path.join(directory, '{}_{:05d}.dcm'.format(filename_prefix, x)))
+	#
+	return map_with_workers(write_slice, [(x,) for x in range(num_of_slices)], workers)
+#
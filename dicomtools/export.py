@@ -1,6 +1,7 @@
 import numpy as np
 import os
-import matplotlib
+#
+# matplotlib is only imported when an image is saved, since importing it is slow
 #
 def export_stack_to_png(images, axis, directory, filename_prefix):
 	r'''
@@ -21,6 +22,66 @@ def export_image_to_png(image, filename):
 	Given a 2-dimensional image, save it to a file.
 	'''
 	#
+	import matplotlib.cm
+	import matplotlib.image
+	#
 	matplotlib.image.imsave(filename, image, cmap=matplotlib.cm.gray)
 	# let matplotlib deal with saving the image since it probably already has a supported backend
 #
+def build_montage(dicom_volume, slice_indices=None, num_of_slices=16, axis=2, columns=None, window=None):
+	r'''
+	Tile slices of a :class:`dicomtools.volume.DicomVolume` into a single 2D image. The
+	slices are either given by ``slice_indices``, or ``num_of_slices`` evenly spaced slices
+	are used. The tiles are placed in rows of ``columns`` tiles (by default, the montage is
+	roughly square), and unused tiles are left black.
+	
+	The ``window`` is a ``(center, width)`` tuple for the intensity range, and by default
+	covers the range of the selected slices. Returns an array of type ``uint8``.
+	'''
+	#
+	shape = dicom_volume.get_shape()
+	if slice_indices is None:
+		slice_indices = np.unique(np.linspace(0, shape[axis]-1, min(num_of_slices, shape[axis])).round().astype(int))
+	slice_indices = np.asarray(slice_indices, dtype=int)
+	#
+	if 'pixel_data' in dicom_volume.info:
+		slices = np.moveaxis(dicom_volume.info['pixel_data'].take(slice_indices, axis=axis), axis, 0)
+		# all of the slices in a single (n x width x height) array
+	elif axis == 2:
+		slices = np.array([dicom_volume.get_slice(x) for x in slice_indices])
+	else:
+		raise Exception('Volumes without pixel data can only be sliced along axis 2.')
+	#
+	if window is None:
+		vmin = slices.min()
+		vmax = slices.max()
+	else:
+		vmin = window[0]-window[1]/2.0
+		vmax = window[0]+window[1]/2.0
+	#
+	scale = 255.0/max(vmax-vmin, np.finfo(np.double).tiny)
+	slices = np.clip((slices-vmin)*scale, 0, 255).astype(np.uint8)
+	#
+	if columns is None:
+		columns = int(np.ceil(np.sqrt(len(slices))))
+	rows = int(np.ceil(len(slices)/float(columns)))
+	#
+	tiles = np.zeros((rows*columns,)+slices.shape[1:], dtype=np.uint8)
+	tiles[0:len(slices)] = slices
+	#
+	tile_height, tile_width = slices.shape[1:]
+	return tiles.reshape(rows, columns, tile_height, tile_width).transpose(0, 2, 1, 3).reshape(rows*tile_height, columns*tile_width)
+	# place the tiles in a grid
+#
+def export_montage_to_png(dicom_volume, filename, slice_indices=None, num_of_slices=16, axis=2, columns=None, window=None):
+	r'''
+	Build a montage of slices with :meth:`build_montage` and save it to a file. This does
+	not use pyplot, so it can safely be used from worker processes without a display.
+	'''
+	#
+	import matplotlib.cm
+	import matplotlib.image
+	#
+	montage = build_montage(dicom_volume, slice_indices, num_of_slices, axis, columns, window)
+	matplotlib.image.imsave(filename, montage, cmap=matplotlib.cm.gray, vmin=0, vmax=255)
+#
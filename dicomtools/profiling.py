@@ -0,0 +1,207 @@
+import json
+import threading
+import timeit
+#
+try:
+	import tracemalloc
+except ImportError:
+	tracemalloc = None
+	# not available before python 3.4
+#
+_active_profilers = []
+_lock = threading.Lock()
+_local = threading.local()
+#
+class Profiler(object):
+	r'''
+	Records the time spent in each stage of loading and processing DICOM data (reading
+	files, decoding pixel data, validating and building volumes, etc), along with counts
+	such as the number of bytes read and slices decoded. Profiling is only done within a
+	``with`` block, and has no effect on code outside of it.
+	
+	If ``track_memory`` is True, the peak memory allocated during each stage is also
+	recorded using :mod:`tracemalloc` (python 3.9 or later). This slows down the code
+	being profiled, and the peaks are only approximate when several threads are used.
+	
+	Stages can be nested (decoding pixel data happens while building a volume), and the
+	time of a stage includes the time of the stages within it.
+	
+	Example:
+	::
+	
+		>>> with dicomtools.profiling.Profiler() as profiler:
+		...     volume = dicomtools.volume.DicomVolume(dicomtools.dicom_read.read_dicom_series(filenames))
+		...
+		>>> profiler.print_report()
+		stage                             calls   time (s)  peak (MB)  counts
+		DicomSeries.__init__                  1     0.0003          -
+		DicomVolume._build_volume             1     0.4120          -
+		...
+	'''
+	def __init__(self, track_memory=False):
+		#
+		self.track_memory = track_memory and tracemalloc is not None and hasattr(tracemalloc, 'reset_peak')
+		self.stages = {}
+		self._started_tracemalloc = False
+	#
+	def __enter__(self):
+		if self.track_memory and not tracemalloc.is_tracing():
+			tracemalloc.start()
+			self._started_tracemalloc = True
+		#
+		with _lock:
+			_active_profilers.append(self)
+		#
+		return self
+	#
+	def __exit__(self, exc_type, exc_value, traceback):
+		with _lock:
+			_active_profilers.remove(self)
+		#
+		if self._started_tracemalloc:
+			tracemalloc.stop()
+			self._started_tracemalloc = False
+		#
+	#
+	def _get_stage(self, name):
+		if name not in self.stages:
+			self.stages[name] = {'calls': 0, 'seconds': 0.0, 'peak_bytes': None, 'counts': {}}
+		return self.stages[name]
+	#
+	def _record(self, name, seconds, peak_bytes):
+		with _lock:
+			stage = self._get_stage(name)
+			stage['calls'] += 1
+			stage['seconds'] += seconds
+			if peak_bytes is not None:
+				stage['peak_bytes'] = max(stage['peak_bytes'] or 0, peak_bytes)
+			#
+		#
+	#
+	def _count(self, name, key, amount):
+		with _lock:
+			counts = self._get_stage(name)['counts']
+			counts[key] = counts.get(key, 0) + amount
+		#
+	#
+	def get_report(self):
+		r'''
+		Get the recorded stages as a list of dictionaries (sorted by stage name), each with
+		the keys ``'stage'``, ``'calls'``, ``'seconds'``, ``'peak_bytes'`` and ``'counts'``.
+		'''
+		#
+		with _lock:
+			return [dict(stage=x, calls=y['calls'], seconds=y['seconds'], peak_bytes=y['peak_bytes'], counts=dict(y['counts'])) for (x, y) in sorted(self.stages.items())]
+		#
+	#
+	def to_json(self, **kwargs):
+		r'''
+		Get the report from :meth:`get_report` as a JSON string. Any keyword arguments are
+		passed to :func:`json.dumps`.
+		'''
+		#
+		return json.dumps(self.get_report(), **kwargs)
+	#
+	def print_report(self):
+		r'''
+		Print the report as a table.
+		'''
+		#
+		print('{:<32} {:>7} {:>10} {:>10}  {}'.format('stage', 'calls', 'time (s)', 'peak (MB)', 'counts'))
+		for x in self.get_report():
+			peak = '-' if x['peak_bytes'] is None else '{:.1f}'.format(x['peak_bytes']/1e6)
+			counts = ', '.join('{}={}'.format(key, value) for (key, value) in sorted(x['counts'].items()))
+			print('{:<32} {:>7} {:>10.4f} {:>10}  {}'.format(x['stage'], x['calls'], x['seconds'], peak, counts))
+		#
+	#
+#
+class _NullStage(object):
+	def __enter__(self):
+		return self
+	def __exit__(self, exc_type, exc_value, traceback):
+		pass
+	#
+#
+_null_stage = _NullStage()
+#
+class _Stage(object):
+	def __init__(self, name, profilers):
+		self.name = name
+		self.profilers = profilers
+		self.track_memory = any(x.track_memory for x in profilers) and tracemalloc.is_tracing()
+	#
+	def __enter__(self):
+		if self.track_memory:
+			# the peak is reset for this stage, so remember the peak seen so far by the
+			# enclosing stage, which is restored when this stage exits
+			stack = _get_memory_stack()
+			(current, peak) = tracemalloc.get_traced_memory()
+			if len(stack) > 0:
+				stack[-1][1] = max(stack[-1][1], peak)
+			stack.append([current, 0])
+			tracemalloc.reset_peak()
+		#
+		self.start = timeit.default_timer()
+		return self
+	#
+	def __exit__(self, exc_type, exc_value, traceback):
+		seconds = timeit.default_timer()-self.start
+		peak_bytes = None
+		#
+		if self.track_memory:
+			stack = _get_memory_stack()
+			(start_current, enclosed_peak) = stack.pop()
+			peak = max(tracemalloc.get_traced_memory()[1], enclosed_peak)
+			peak_bytes = peak-start_current
+			if len(stack) > 0:
+				stack[-1][1] = max(stack[-1][1], peak)
+			#
+		#
+		for x in self.profilers:
+			x._record(self.name, seconds, peak_bytes)
+		#
+	#
+#
+def _get_memory_stack():
+	if not hasattr(_local, 'memory_stack'):
+		_local.memory_stack = []
+	return _local.memory_stack
+#
+def is_active():
+	r'''
+	Returns True if there are any active profilers, otherwise returns False.
+	'''
+	#
+	return len(_active_profilers) > 0
+#
+def stage(name):
+	r'''
+	Get a context manager which records the time (and memory) spent within it as the
+	named stage for all active profilers. Returns a no-op context manager if there are
+	no active profilers.
+	'''
+	#
+	if len(_active_profilers) == 0:
+		return _null_stage
+	#
+	with _lock:
+		profilers = list(_active_profilers)
+	#
+	return _Stage(name, profilers)
+#
+def count(name, key, amount=1):
+	r'''
+	Add to a named counter (for example, ``'bytes_read'``) of a stage for all active
+	profilers.
+	'''
+	#
+	if len(_active_profilers) == 0:
+		return
+	#
+	with _lock:
+		profilers = list(_active_profilers)
+	#
+	for x in profilers:
+		x._count(name, key, amount)
+	#
+#
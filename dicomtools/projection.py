@@ -0,0 +1,109 @@
+import numpy as np
+#
+from ._streaming import get_streaming_volume, map_with_workers, split_range
+#
+_REDUCTIONS = {
+	'max': np.maximum,
+	'min': np.minimum,
+	'mean': np.add,
+}
+#
+def _project_slice_range(dicom_volume, mode, start, stop):
+	r'''
+	Reduce the slices ``[start, stop)`` (along axis 2) into a single image, reading one
+	slice at a time. For the ``'mean'`` mode, the sum is returned.
+	'''
+	#
+	reduction = _REDUCTIONS[mode]
+	result = np.array(dicom_volume.get_slice(start), dtype=np.double)
+	for x in range(start+1, stop):
+		reduction(result, dicom_volume.get_slice(x), out=result)
+	#
+	return result
+#
+def _project_slice_range_across_slice(dicom_volume, mode, axis, start, stop):
+	r'''
+	For a projection along axis 0 or 1, each slice reduces to a single line of the
+	resulting image. Returns the lines for slices ``[start, stop)``.
+	'''
+	#
+	reduction = getattr(np, mode)
+	return [reduction(dicom_volume.get_slice(x), axis=axis) for x in range(start, stop)]
+#
+def project_volume(dicom_data, mode='max', axis=2, workers=1):
+	r'''
+	Compute the maximum (``mode='max'``), minimum (``mode='min'``) or mean
+	(``mode='mean'``) intensity projection along an axis of the volume. The ``dicom_data``
+	can be either a :class:`dicomtools.volume.DicomVolume` or a
+	:class:`dicomtools.series.DicomSeries`. Given a series, the full volume is never built;
+	the slices are read and reduced one at a time, and released afterwards.
+	
+	The slices are split into ``workers`` groups which are projected in parallel.
+	
+	Example:
+	::
+	
+		>>> series = dicomtools.read_dicom_series(filenames)
+		>>> mip = dicomtools.projection.project_volume(series, 'max', axis=2, workers=4)
+	'''
+	#
+	if mode not in _REDUCTIONS:
+		raise ValueError('Unknown projection mode: ' + str(mode))
+	if axis not in [0, 1, 2]:
+		raise ValueError('The axis must be 0, 1, or 2.')
+	#
+	dicom_volume = get_streaming_volume(dicom_data)
+	num_of_slices = dicom_volume.get_shape()[2]
+	chunks = split_range(0, num_of_slices, workers)
+	#
+	if axis != 2:
+		lines = map_with_workers(lambda start, stop: _project_slice_range_across_slice(dicom_volume, mode, axis, start, stop), chunks, workers)
+		return np.transpose(np.array([line for chunk in lines for line in chunk]))
+		# each slice is a column of the resulting image
+	#
+	partial_results = map_with_workers(lambda start, stop: _project_slice_range(dicom_volume, mode, start, stop), chunks, workers)
+	#
+	result = partial_results[0]
+	for x in partial_results[1:]:
+		_REDUCTIONS[mode](result, x, out=result)
+	#
+	if mode == 'mean':
+		result /= num_of_slices
+	#
+	return result
+#
+def project_slabs(dicom_data, slab_thickness, slab_spacing=None, mode='max', workers=1):
+	r'''
+	Compute thick-slab intensity projections along axis 2 of the volume. Each slab covers
+	``slab_thickness`` millimeters (rounded to a whole number of slices), and a new slab
+	starts every ``slab_spacing`` millimeters (by default, the slabs do not overlap). The
+	``mode`` and ``dicom_data`` are the same as for :meth:`project_volume`.
+	
+	Returns a 3D array where ``result[:,:,x]`` is the projection of slab ``x``. The slabs are
+	streamed from the series one at a time, and are projected in parallel using
+	``workers`` threads.
+	'''
+	#
+	if mode not in _REDUCTIONS:
+		raise ValueError('Unknown projection mode: ' + str(mode))
+	#
+	dicom_volume = get_streaming_volume(dicom_data)
+	if 'slice_vec' not in dicom_volume.info:
+		raise Exception('Slab projections can only be computed for a 3D volume.')
+	#
+	if slab_spacing is None:
+		slab_spacing = slab_thickness
+	#
+	slice_spacing = dicom_volume.info['pixel_spacing'][2]
+	slices_per_slab = max(1, int(round(slab_thickness/slice_spacing)))
+	slices_between_slabs = max(1, int(round(slab_spacing/slice_spacing)))
+	#
+	num_of_slices = dicom_volume.get_shape()[2]
+	slabs = [(x, min(x+slices_per_slab, num_of_slices)) for x in range(0, max(num_of_slices-slices_per_slab, 0)+1, slices_between_slabs)]
+	#
+	projections = map_with_workers(lambda start, stop: _project_slice_range(dicom_volume, mode, start, stop), slabs, workers)
+	if mode == 'mean':
+		projections = [projections[x]/(slabs[x][1]-slabs[x][0]) for x in range(len(slabs))]
+	#
+	return np.dstack(projections)
+#
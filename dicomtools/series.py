@@ -1,8 +1,18 @@
 import numpy as np
 import dicom
 import os
+import struct
+import sys
 import warnings
 #
+from . import profiling
+#
+try:
+	_intern = intern
+except NameError:
+	_intern = sys.intern
+	# python 3
+#
 class DicomSeries(object):
 	r'''
 	A class for storing and processing DICOM series. Instances are verified to all have
@@ -17,10 +27,12 @@ class DicomSeries(object):
 		if len(dicom_list) == 0:
 			raise Exception('No DICOM instances were given for the series.')
 		#
-		if not self._uids_equal(dicom_list):
-			raise Exception('Each \'SeriesInstanceUID\' does not match, so images do not belong to the same series.')
+		with profiling.stage('DicomSeries.__init__'):
+			if not self._uids_equal(dicom_list):
+				raise Exception('Each \'SeriesInstanceUID\' does not match, so images do not belong to the same series.')
+			#
+			self.instances = self._sort_dicom_instances(dicom_list)
 		#
-		self.instances = self._sort_dicom_instances(dicom_list)
 		self.uid = self.instances[0].SeriesInstanceUID
 		if hasattr(self.instances[0], 'SeriesDescription'):
 			self.description = self.instances[0].SeriesDescription
@@ -59,7 +71,15 @@ class DicomSeries(object):
 		False.
 		'''
 		#
-		return hasattr(dicom_instance, 'pixel_array')
+		with profiling.stage('DicomSeries.decode_pixels'):
+			was_decoded = _is_pixel_array_cached(dicom_instance)
+			has_image_data = hasattr(dicom_instance, 'pixel_array')
+			# accessing the pixel_array decodes the pixel data
+			if has_image_data and not was_decoded:
+				profiling.count('DicomSeries.decode_pixels', 'slices_decoded', int(getattr(dicom_instance, 'NumberOfFrames', 1)))
+			#
+		#
+		return has_image_data
 	#
 	def get_instances_with_image_data(self):
 		r'''
@@ -78,3 +98,205 @@ class DicomSeries(object):
 		return [x for x in self.instances if not self._instance_has_image_data(x)]
 	#
 #
+def _is_pixel_array_cached(dicom_instance):
+	r'''
+	Returns True if pydicom has already decoded (and cached) the instance's pixel data.
+	'''
+	#
+	return getattr(dicom_instance, '_pixel_array', None) is not None
+#
+def _release_pixel_array(dicom_instance):
+	r'''
+	Drop the decoded pixel data that pydicom caches on the instance. It will be decoded
+	again the next time the ``pixel_array`` is accessed.
+	'''
+	#
+	if _is_pixel_array_cached(dicom_instance) and _PIXEL_DATA_TAG_NUMBER in dicom_instance:
+		dicom_instance[_PIXEL_DATA_TAG_NUMBER] = dicom_instance[_PIXEL_DATA_TAG_NUMBER]
+		# pydicom drops the decoded array whenever the pixel data element is set
+	#
+#
+_UNCOMPRESSED_LITTLE_ENDIAN = {
+	'1.2.840.10008.1.2': True,
+	'1.2.840.10008.1.2.1': False,
+}
+# maps the uncompressed little endian transfer syntaxes to whether they use implicit VRs
+#
+_PIXEL_DATA_TAG_NUMBER = 0x7FE00010
+_PIXEL_DATA_TAG = struct.pack('<HH', 0x7FE0, 0x0010)
+#
+class CompactDicomInstance(object):
+	r'''
+	A small record of a DICOM instance, which keeps only the attributes needed by
+	:class:`dicomtools.series.DicomSeries` and :class:`dicomtools.volume.DicomVolume`, along
+	with the filename and the file offset of the pixel data. The pixel data is read from the
+	file each time the ``pixel_array`` is accessed, and is never kept in memory.
+	
+	Attributes which are the same for many instances (UIDs, orientations, pixel spacings)
+	are shared between records, so that a record takes only a few hundred bytes. Use
+	:meth:`dicomtools.dicom_read.read_compact_dicom_series` to build the records from files.
+	'''
+	#
+	KEYWORDS = ['SeriesInstanceUID', 'SeriesDescription', 'InstanceNumber', 'PatientPosition',
+	            'Rows', 'Columns', 'NumberOfFrames', 'SamplesPerPixel', 'BitsAllocated', 'BitsStored',
+	            'PixelRepresentation', 'PixelSpacing', 'SliceThickness', 'ImagePositionPatient',
+	            'ImageOrientationPatient', 'RescaleSlope', 'RescaleIntercept', 'TemporalPositionIdentifier',
+	            'TriggerTime', 'PerFrameFunctionalGroupsSequence']
+	#
+	__slots__ = KEYWORDS + ['filename', 'transfer_syntax_uid', 'pixel_offset']
+	#
+	def __init__(self, header, filename, pixel_offset, shared_values=None):
+		r'''
+		Build the record from a dataset read without its pixel data. The ``pixel_offset`` is
+		the file offset of the pixel data element, or None if the instance has no pixel data.
+		The ``shared_values`` dictionary is used to share equal attribute values between
+		records, and should be re-used for all of the instances in a series.
+		'''
+		#
+		if shared_values is None:
+			shared_values = {}
+		#
+		for keyword in self.KEYWORDS:
+			if keyword not in header:
+				continue
+				# the attribute stays unset, so hasattr() behaves as it does for a dataset
+			#
+			value = getattr(header, keyword)
+			if keyword in ['SeriesInstanceUID', 'SeriesDescription', 'PatientPosition']:
+				value = _intern(str(value))
+			elif keyword in ['InstanceNumber', 'Rows', 'Columns', 'NumberOfFrames', 'SamplesPerPixel', 'BitsAllocated', 'BitsStored', 'PixelRepresentation', 'TemporalPositionIdentifier']:
+				value = int(value)
+			elif keyword in ['SliceThickness', 'RescaleSlope', 'RescaleIntercept', 'TriggerTime']:
+				value = float(value)
+			elif keyword in ['PixelSpacing', 'ImagePositionPatient', 'ImageOrientationPatient']:
+				value = tuple(float(x) for x in value)
+			#
+			if keyword != 'PerFrameFunctionalGroupsSequence':
+				value = shared_values.setdefault((keyword, value), value)
+			#
+			setattr(self, keyword, value)
+		#
+		self.filename = filename
+		self.transfer_syntax_uid = _intern(str(header.file_meta.TransferSyntaxUID))
+		self.pixel_offset = pixel_offset
+	#
+	def __contains__(self, keyword):
+		if keyword == 'PixelData':
+			return self.pixel_offset is not None
+		return hasattr(self, keyword)
+	#
+	def _get_frame_shape(self):
+		if getattr(self, 'SamplesPerPixel', 1) > 1:
+			return (self.Rows, self.Columns, self.SamplesPerPixel)
+		return (self.Rows, self.Columns)
+	#
+	def _get_num_of_frames(self):
+		return getattr(self, 'NumberOfFrames', 1)
+	#
+	def _can_read_directly(self):
+		r'''
+		Returns True if the pixel data can be read directly from the file, which is possible
+		for uncompressed little endian data with one sample per pixel. Signed data which
+		needs its sign extended is left to pydicom.
+		'''
+		#
+		return (self.transfer_syntax_uid in _UNCOMPRESSED_LITTLE_ENDIAN and
+		        getattr(self, 'SamplesPerPixel', 1) == 1 and
+		        self.BitsAllocated in [8, 16, 32] and
+		        (self.PixelRepresentation == 0 or getattr(self, 'BitsStored', self.BitsAllocated) == self.BitsAllocated))
+	#
+	def _get_pixel_dtype(self):
+		return np.dtype('<{}{}'.format('i' if self.PixelRepresentation == 1 else 'u', self.BitsAllocated//8))
+	#
+	def _read_pixel_value_offset(self, f):
+		r'''
+		Read the header of the pixel data element and return the offset of its value, or None
+		if the pixel data is encapsulated.
+		'''
+		#
+		f.seek(self.pixel_offset)
+		if f.read(4) != _PIXEL_DATA_TAG:
+			return None
+		#
+		if _UNCOMPRESSED_LITTLE_ENDIAN[self.transfer_syntax_uid]:
+			length = struct.unpack('<I', f.read(4))[0]
+		else:
+			f.read(4)
+			# the VR ('OB' or 'OW') and two reserved bytes
+			length = struct.unpack('<I', f.read(4))[0]
+		#
+		if length == 0xFFFFFFFF:
+			return None
+		return f.tell()
+	#
+	def read_frames(self, start, stop, rows=None):
+		r'''
+		Read the frames ``[start, stop)`` of the pixel data. Returns an array with the frames
+		along axis 0. If ``rows`` is given as a ``(first_row, stop_row)`` tuple, only those
+		rows of each frame are returned. If possible, only the requested frames (and rows)
+		are read from the file.
+		'''
+		#
+		if self.pixel_offset is None:
+			raise Exception('The instance does not have pixel data.')
+		#
+		if rows is None:
+			rows = (0, self.Rows)
+		#
+		if self._can_read_directly():
+			with open(self.filename, 'rb') as f:
+				value_offset = self._read_pixel_value_offset(f)
+				if value_offset is not None:
+					dtype = self._get_pixel_dtype()
+					frame_shape = self._get_frame_shape()
+					frame_size = int(np.prod(frame_shape))
+					row_size = frame_size//self.Rows
+					#
+					if rows == (0, self.Rows):
+						f.seek(value_offset + start*frame_size*dtype.itemsize)
+						frames = np.fromfile(f, dtype=dtype, count=(stop-start)*frame_size)
+						return frames.reshape((stop-start,)+frame_shape)
+					#
+					frames = np.empty((stop-start, rows[1]-rows[0])+frame_shape[1:], dtype=dtype)
+					for x in range(start, stop):
+						f.seek(value_offset + (x*frame_size + rows[0]*row_size)*dtype.itemsize)
+						frames[x-start] = np.fromfile(f, dtype=dtype, count=(rows[1]-rows[0])*row_size).reshape(frames.shape[1:])
+					# only read the requested rows of each frame
+					return frames
+				#
+			#
+		#
+		pixel_array = dicom.read_file(self.filename).pixel_array
+		# fall back to letting pydicom read and decode the pixel data
+		if self._get_num_of_frames() == 1:
+			pixel_array = pixel_array[np.newaxis]
+		return pixel_array[start:stop, rows[0]:rows[1]]
+	#
+	@property
+	def pixel_array(self):
+		r'''
+		Read the pixel data from the file. This has the same shape as a dataset's
+		``pixel_array``.
+		'''
+		#
+		frames = self.read_frames(0, self._get_num_of_frames())
+		if self._get_num_of_frames() == 1:
+			return frames[0]
+		return frames
+	#
+#
+class CompactDicomSeries(DicomSeries):
+	r'''
+	A :class:`dicomtools.series.DicomSeries` of
+	:class:`dicomtools.series.CompactDicomInstance` records. Checking which instances have
+	image data does not read any pixel data.
+	'''
+	#
+	def _instance_has_image_data(self, dicom_instance):
+		r'''
+		Returns True if the dicom instance has pixel data, otherwise returns False.
+		'''
+		#
+		return 'PixelData' in dicom_instance
+	#
+#
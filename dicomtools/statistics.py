@@ -0,0 +1,169 @@
+import numpy as np
+#
+from ._streaming import get_streaming_volume, map_with_workers, split_range
+#
+class VolumeStatistics(object):
+	r'''
+	Statistics of the voxel values (in rescaled units, such as HU) of a volume, which are
+	accumulated one slice at a time with :meth:`update`. Only the statistics are kept, so
+	the memory used doesn't depend on the size of the volume.
+	
+	The histogram has fixed bins of width ``bin_width``, centered on ``low``,
+	``low+bin_width``, ..., ``high``. Values outside of the bins are counted as underflow or
+	overflow. The counts are exact, so with the default bins (one per whole HU value) the
+	percentiles of CT data are exact as well.
+	
+	Statistics of different parts of a volume (for example, slabs processed in parallel)
+	can be combined with :meth:`merge`, as long as they use the same bins.
+	'''
+	def __init__(self, low=-1024.0, high=3071.0, bin_width=1.0):
+		#
+		self.low = float(low)
+		self.bin_width = float(bin_width)
+		self.num_of_bins = int(round((high-low)/bin_width))+1
+		self.counts = np.zeros(self.num_of_bins, dtype=np.int64)
+		self.underflow = 0
+		self.overflow = 0
+		#
+		self.count = 0
+		self.min = np.inf
+		self.max = -np.inf
+		self._mean = 0.0
+		self._sum_of_squared_deviations = 0.0
+	#
+	def get_bin_edges(self):
+		r'''
+		Get the ``num_of_bins+1`` edges of the histogram bins.
+		'''
+		#
+		return self.low + (np.arange(self.num_of_bins+1)-0.5)*self.bin_width
+	#
+	def update(self, values):
+		r'''
+		Add an array of voxel values (such as a slice) to the statistics.
+		'''
+		#
+		values = np.asarray(values, dtype=np.double).ravel()
+		if len(values) == 0:
+			return
+		#
+		bins = np.floor((values-self.low)/self.bin_width+0.5)
+		np.clip(bins, -1, self.num_of_bins, out=bins)
+		bin_counts = np.bincount(bins.astype(np.intp)+1, minlength=self.num_of_bins+2)
+		# bin 0 is the underflow and the last bin is the overflow
+		self.underflow += int(bin_counts[0])
+		self.overflow += int(bin_counts[-1])
+		self.counts += bin_counts[1:-1]
+		#
+		mean = np.mean(values)
+		self._merge_moments(len(values), mean, np.dot(values-mean, values-mean))
+		self.min = min(self.min, float(np.min(values)))
+		self.max = max(self.max, float(np.max(values)))
+	#
+	def _merge_moments(self, count, mean, sum_of_squared_deviations):
+		r'''
+		Combine the mean and sum of squared deviations of another set of values, using the
+		pairwise formula of Chan et al, which is numerically stable.
+		'''
+		#
+		total = self.count+count
+		delta = mean-self._mean
+		self._mean += delta*count/total
+		self._sum_of_squared_deviations += sum_of_squared_deviations + delta*delta*self.count*count/total
+		self.count = total
+	#
+	def merge(self, other):
+		r'''
+		Add the statistics of another :class:`VolumeStatistics` (with the same bins) to these
+		statistics. Returns ``self``.
+		'''
+		#
+		if (self.low, self.bin_width, self.num_of_bins) != (other.low, other.bin_width, other.num_of_bins):
+			raise ValueError('The statistics do not have the same histogram bins.')
+		#
+		if other.count == 0:
+			return self
+		#
+		self.counts += other.counts
+		self.underflow += other.underflow
+		self.overflow += other.overflow
+		self._merge_moments(other.count, other._mean, other._sum_of_squared_deviations)
+		self.min = min(self.min, other.min)
+		self.max = max(self.max, other.max)
+		#
+		return self
+	#
+	def get_mean(self):
+		return self._mean if self.count > 0 else np.nan
+	#
+	def get_std(self):
+		return np.sqrt(self._sum_of_squared_deviations/self.count) if self.count > 0 else np.nan
+	#
+	def get_percentile(self, percentile):
+		r'''
+		Get the value at the ``percentile`` (between 0 and 100), using the nearest-rank
+		method. The value is the center of the histogram bin containing it, or the minimum
+		or maximum if it's in the underflow or overflow.
+		'''
+		#
+		if self.count == 0:
+			return np.nan
+		#
+		rank = max(1, int(np.ceil(percentile/100.0*self.count)))
+		# the number of values which are less than or equal to the percentile
+		if rank <= self.underflow:
+			return self.min
+		#
+		index = np.searchsorted(np.cumsum(self.counts), rank-self.underflow)
+		if index >= self.num_of_bins:
+			return self.max
+		#
+		return self.low + index*self.bin_width
+	#
+	def get_summary(self, percentiles=(1, 5, 25, 50, 75, 95, 99)):
+		r'''
+		Get a dictionary with the count, minimum, maximum, mean, standard deviation and the
+		given percentiles.
+		'''
+		#
+		summary = {'count': self.count, 'min': self.min, 'max': self.max, 'mean': self.get_mean(), 'std': self.get_std()}
+		summary['percentiles'] = dict((x, self.get_percentile(x)) for x in percentiles)
+		return summary
+	#
+#
+def _compute_slice_range_statistics(dicom_volume, start, stop, statistics_args):
+	statistics = VolumeStatistics(**statistics_args)
+	for x in range(start, stop):
+		statistics.update(dicom_volume.get_slice(x))
+	#
+	return statistics
+#
+def compute_statistics(dicom_data, workers=1, **kwargs):
+	r'''
+	Compute the :class:`VolumeStatistics` of a volume in a single pass over its slices. The
+	``dicom_data`` can be either a :class:`dicomtools.volume.DicomVolume` or a
+	:class:`dicomtools.series.DicomSeries`. Given a series, the full volume is never built;
+	the slices are read one at a time (see :meth:`dicomtools.projection.project_volume`).
+	
+	The slices are split into ``workers`` slabs whose statistics are computed in parallel
+	and then merged. Any keyword arguments are passed to :class:`VolumeStatistics`.
+	
+	Example:
+	::
+	
+		>>> statistics = dicomtools.statistics.compute_statistics(series, workers=4)
+		>>> statistics.get_percentile(50)
+		40.0
+	'''
+	#
+	dicom_volume = get_streaming_volume(dicom_data)
+	chunks = split_range(0, dicom_volume.get_shape()[2], workers)
+	#
+	partial_results = map_with_workers(lambda start, stop: _compute_slice_range_statistics(dicom_volume, start, stop, kwargs), chunks, workers)
+	#
+	statistics = partial_results[0]
+	for x in partial_results[1:]:
+		statistics.merge(x)
+	#
+	return statistics
+#
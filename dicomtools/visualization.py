@@ -1,10 +1,13 @@
-import matplotlib.pylab as plt
+#
+# matplotlib is only imported when something is plotted, since importing it is slow
 #
 def plot_slice(dicom_volume, slice_axis, slice_index, figure=None):
 	r'''
 	Plot a single slice (along axis 0, 1, or 2) of a :class:`dicomtools.volume.DicomVolume` using matplotlib.
 	'''
 	#
+	import matplotlib.pylab as plt
+	#
 	dimension_indices = [0, 1, 2]
 	dimension_labels = ['Axis {} (mm)'.format(x) for x in range(3)]
 	assert slice_axis in dimension_indices
@@ -30,3 +33,153 @@ def plot_slice(dicom_volume, slice_axis, slice_index, figure=None):
 		plt.show()
 	#
 #
+def _get_volume_slice(dicom_volume, slice_axis, slice_index):
+	r'''
+	Get a slice of the volume. Volumes built without the pixel data can only be sliced
+	along axis 2.
+	'''
+	#
+	if 'pixel_data' in dicom_volume.info:
+		return dicom_volume.info['pixel_data'].take(slice_index, axis=slice_axis)
+	if slice_axis != 2:
+		raise Exception('Volumes without pixel data can only be sliced along axis 2.')
+	return dicom_volume.get_slice(slice_index)
+#
+class SliceViewer(object):
+	r'''
+	An interactive viewer for stepping through the slices (along axis 0, 1, or 2) of a
+	:class:`dicomtools.volume.DicomVolume`. Unlike :meth:`plot_slice`, the figure and image
+	are only created once, and changing the slice only updates the image data, so
+	scrolling through a volume is fast and does not create any new figures.
+	
+	The ``window`` is a ``(center, width)`` tuple for the display intensity range, and by
+	default covers the full range of the volume. For a volume without ``info['pixel_data']``
+	(see :class:`dicomtools.volume.DicomVolume`), the default only covers the range of the
+	first displayed slice, since every slice would have to be read to find the full range.
+	A ``downsample`` factor greater than 1 displays every n-th pixel, which is useful for
+	large images. The viewer does not block; use :meth:`show` to display the figure outside
+	of a notebook.
+	
+	The mouse scroll wheel and the up/down arrow keys step through the slices.
+	
+	Example:
+	::
+	
+		>>> viewer = dicomtools.visualization.SliceViewer(volume, 2)
+		>>> viewer.set_slice(40)
+		>>> viewer.show()
+	'''
+	def __init__(self, dicom_volume, slice_axis, slice_index=0, figure=None, window=None, downsample=1):
+		#
+		import matplotlib.pylab as plt
+		#
+		assert slice_axis in [0, 1, 2]
+		#
+		self.dicom_volume = dicom_volume
+		self.slice_axis = slice_axis
+		self.slice_index = slice_index
+		self.downsample = max(1, int(downsample))
+		self.num_of_slices = dicom_volume.get_shape()[slice_axis]
+		#
+		dimension_indices = [0, 1, 2]
+		dimension_labels = ['Axis {} (mm)'.format(x) for x in range(3)]
+		dimension_indices.pop(slice_axis)
+		dimension_labels.pop(slice_axis)
+		#
+		volume_dimensions = dicom_volume.get_dimensions_in_mm()
+		x_range = [0, volume_dimensions[dimension_indices[0]]]
+		y_range = [0, volume_dimensions[dimension_indices[1]]]
+		#
+		slice = self._get_display_slice(slice_index)
+		#
+		if window is not None:
+			vmin = window[0]-window[1]/2.0
+			vmax = window[0]+window[1]/2.0
+		elif 'pixel_data' in dicom_volume.info:
+			vmin = dicom_volume.info['pixel_data'].min()
+			vmax = dicom_volume.info['pixel_data'].max()
+		else:
+			vmin = slice.min()
+			vmax = slice.max()
+			# computing the range of a volume without pixel data would require reading every slice
+		#
+		if figure is None:
+			figure = plt.figure()
+		#
+		self.figure = figure
+		self.axes = figure.add_subplot(111)
+		self.image = self.axes.imshow(slice, interpolation='none', aspect=1, extent=x_range+y_range, cmap=plt.cm.gray, vmin=vmin, vmax=vmax)
+		# the intensity limits are fixed so that they aren't recomputed for every slice
+		self.axes.set_xlabel(dimension_labels[0])
+		self.axes.set_ylabel(dimension_labels[1])
+		self._update_title()
+		#
+		self._callback_ids = [figure.canvas.mpl_connect('scroll_event', self._on_scroll), figure.canvas.mpl_connect('key_press_event', self._on_key_press)]
+	#
+	def _get_display_slice(self, slice_index):
+		slice = _get_volume_slice(self.dicom_volume, self.slice_axis, slice_index)
+		if self.downsample > 1:
+			slice = slice[::self.downsample, ::self.downsample]
+		#
+		return slice
+	#
+	def _update_title(self):
+		self.axes.set_title('{} - slice {} along axis {}'.format(self.dicom_volume.description, self.slice_index, self.slice_axis))
+	#
+	def _on_scroll(self, event):
+		if event.button == 'up':
+			self.step(1)
+		elif event.button == 'down':
+			self.step(-1)
+		#
+	#
+	def _on_key_press(self, event):
+		if event.key == 'up':
+			self.step(1)
+		elif event.key == 'down':
+			self.step(-1)
+		#
+	#
+	def set_slice(self, slice_index):
+		r'''
+		Display a different slice, re-using the existing figure and image.
+		'''
+		#
+		if slice_index < 0 or slice_index >= self.num_of_slices:
+			raise IndexError('Slice index {} is out of range.'.format(slice_index))
+		#
+		self.slice_index = slice_index
+		self.image.set_data(self._get_display_slice(slice_index))
+		self._update_title()
+		self.figure.canvas.draw_idle()
+	#
+	def step(self, num_of_slices):
+		r'''
+		Move forward (or backward for negative numbers) by a number of slices, stopping at
+		the first and last slices.
+		'''
+		#
+		self.set_slice(min(max(self.slice_index+num_of_slices, 0), self.num_of_slices-1))
+	#
+	def show(self):
+		r'''
+		Display the figure without blocking.
+		'''
+		#
+		import matplotlib.pylab as plt
+		#
+		plt.show(block=False)
+	#
+	def close(self):
+		r'''
+		Disconnect the event handlers and close the figure.
+		'''
+		#
+		import matplotlib.pylab as plt
+		#
+		for x in self._callback_ids:
+			self.figure.canvas.mpl_disconnect(x)
+		#
+		plt.close(self.figure)
+	#
+#
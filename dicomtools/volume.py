@@ -1,28 +1,75 @@
 import numpy as np
 import dicom
 import os
+import bisect
+import hashlib
+import threading
 import warnings
 #
 from . import coordinates
 from . import export
+from . import profiling
+from . import cache
+from .series import DicomSeries, CompactDicomInstance, _is_pixel_array_cached, _release_pixel_array
 #
 class DicomVolume(object):
 	r'''
 	Simplifies working with 3D DICOM data.
 	'''
-	def __init__(self, dicom_series):
+	def __init__(self, dicom_series, load_pixel_data=True, pixel_cache=None, region=None, region_coordinates='image', pixel_data=None):
 		r'''
 		Given a DicomSeries object, this determines volume data about the
 		series.
+		
+		If ``load_pixel_data`` is False, only the volume metadata is built and
+		``info['pixel_data']`` is not created. The slices can then be read one at a
+		time with :meth:`get_slice`, which avoids holding the full volume in memory.
+		The decoded slices are kept in the ``pixel_cache`` (a
+		:class:`dicomtools.cache.PixelCache`), which by default is the cache shared by
+		all volumes (see :meth:`dicomtools.cache.get_default_pixel_cache`). A multi-frame
+		dataset is decoded in full each time one of its slices is loaded into the cache, so
+		for large multi-frame files use :meth:`dicomtools.dicom_read.read_compact_dicom_series`,
+		which reads only the needed frames of uncompressed files.
+		
+		If a ``region`` is given as a ``(start, stop)`` tuple, the volume only contains the
+		voxels within that box, so only the slices which intersect it are read, and only the
+		rows within it are read from uncompressed compact instances (see
+		:class:`dicomtools.series.CompactDicomInstance`). If ``region_coordinates`` is
+		``'image'``, the ``start`` (inclusive) and ``stop`` (exclusive) are voxel indices. If
+		it's ``'patient'``, they are opposite corners of a box in patient coordinates, and
+		the volume is the smallest block of voxels which contains every voxel whose center
+		is within the box. If the volume is oblique to the patient axes, the block is larger
+		than the box, and also contains voxels outside of it. The region is clipped to the
+		volume, and ``info['position']`` is the position of the region's first voxel.
+		
+		Example (a 64mm box around a lesion):
+		::
+		
+			>>> region = (lesion_position-32, lesion_position+32)
+			>>> volume = DicomVolume(series, region=region, region_coordinates='patient')
+		
+		If the slices were already decoded, the ``pixel_data`` can be given as an array of
+		the rescaled values with the volume's shape (see :meth:`get_shape`), with the slices
+		in the order of the series' instances. It's used as ``info['pixel_data']`` without
+		being copied, and the instances are not decoded.
 		'''
 		#
 		self._dicom_series = dicom_series
+		self._load_pixel_data = load_pixel_data or pixel_data is not None
+		self._pixel_cache = pixel_cache if pixel_cache is not None else cache.get_default_pixel_cache()
+		self._cache_token = object()
+		# identifies this volume's slices in the (possibly shared) cache
 		#
 		# the series could either be a single dicom instance, or multiple dicom instances
 		# if a single dicom instance, it could be either a single slice or a multi-frame dicom
 		# if multiple dicom instances, it could be multiple single slice instances
 		#
-		self.image_instances = self._dicom_series.get_instances_with_image_data()
+		if self._load_pixel_data and region is None and pixel_data is None:
+			self.image_instances = self._dicom_series.get_instances_with_image_data()
+		else:
+			self.image_instances = [x for x in self._dicom_series.instances if 'PixelData' in x]
+			# avoid decoding (and caching) every image just to check that it has pixel data
+		#
 		if len(self.image_instances) == 0:
 			raise Exception('There are no DICOM instances with image data in the series.')
 		#
@@ -31,10 +78,10 @@ class DicomVolume(object):
 			# if there are multiple dicom instances and one or more are multi-frame, we consider the input to be bad
 			raise Exception('One of the dicom instances is a multi-frame dicom. If a multi-frame dicom is used, it can be the only dicom in the series.')
 		#
-		if self._is_multiframe and self.image_instances[0].pixel_array.ndim != 3:
+		if self._is_multiframe and len(self._get_instance_pixel_shape(self.image_instances[0])) != 3:
 			raise Exception('Multi-frame dicom data must be 3D.')
 		#
-		if not self._is_multiframe and any(x.pixel_array.ndim != 2 for x in self.image_instances):
+		if not self._is_multiframe and any(len(self._get_instance_pixel_shape(x)) != 2 for x in self.image_instances):
 			# not multi-frame and one of the pixel_arrays is not 2D
 			raise Exception('Non-multi-frame dicom instance data must be 2D.')
 		#
@@ -46,8 +93,12 @@ class DicomVolume(object):
 		self.info = {}
 		self.description = self._dicom_series.description
 		#
-		self._validate_volume()
-		self._build_volume()
+		with profiling.stage('DicomVolume._validate_volume'):
+			self._validate_volume()
+		#
+		with profiling.stage('DicomVolume._build_volume'):
+			self._build_volume(region, region_coordinates, pixel_data)
+		#
 	#
 	def __str__(self):
 		return "DICOM Volume (Description: \'{}\', Multi-frame: {}, Series UID: {})".format(self.description, self._is_multiframe, self._dicom_series.uid)
@@ -59,7 +110,7 @@ class DicomVolume(object):
 		#
 		# make sure all images are the correct size
 		# not applicable for a multi-frame dicom
-		if not self._is_multiframe and any(x.pixel_array.shape != self.image_instances[0].pixel_array.shape for x in self.image_instances):
+		if not self._is_multiframe and any(self._get_instance_pixel_shape(x) != self._get_instance_pixel_shape(self.image_instances[0]) for x in self.image_instances):
 			raise Exception('Images are not all the same size.')
 		#
 		# make sure all images are in the same direction (check row and col vectors)
@@ -88,18 +139,86 @@ class DicomVolume(object):
 			#
 		#
 	#
+	def _get_instance_pixel_shape(self, instance):
+		r'''
+		Get the shape of the instance's ``pixel_array``. If the pixel data hasn't already
+		been decoded, the shape is determined from the image attributes so that the pixel
+		data does not need to be decoded.
+		'''
+		#
+		if _is_pixel_array_cached(instance):
+			return instance.pixel_array.shape
+		#
+		shape = (int(instance.Rows), int(instance.Columns))
+		if int(getattr(instance, 'NumberOfFrames', 1)) > 1:
+			shape = (int(instance.NumberOfFrames),) + shape
+		if int(getattr(instance, 'SamplesPerPixel', 1)) > 1:
+			shape = shape + (int(instance.SamplesPerPixel),)
+		#
+		return shape
+	#
 	def _get_denormalized_dicom_image(self, slice):
 		r'''
 		
 		'''
 		#
-		return np.transpose(self._get_raw_image_slice(slice)*self._get_rescale_slope(slice) + self._get_rescale_intercept(slice))
+		return self._denormalize_image(self._get_stored_image(slice), slice)
 	#
-	def _get_raw_image_slice(self, slice):
-		if self._is_multiframe:
-			return self.image_instances[0].pixel_array[slice, :, :].astype(np.double)
+	def _denormalize_image(self, stored_image, slice):
+		return np.transpose(stored_image.astype(np.double)*self._get_rescale_slope(slice) + self._get_rescale_intercept(slice))
+	#
+	def _get_stored_image(self, slice):
+		r'''
+		Get the image with the stored pixel values (before the rescale slope and intercept
+		are applied), cropped to the volume's region.
+		'''
+		#
+		(first_row, stop_row) = (self._region_start[1], self._region_stop[1])
+		(first_column, stop_column) = (self._region_start[0], self._region_stop[0])
+		#
+		if isinstance(self.image_instances[0], CompactDicomInstance):
+			with profiling.stage('DicomVolume.decode_pixels'):
+				profiling.count('DicomVolume.decode_pixels', 'slices_decoded')
+				if self._is_multiframe:
+					image = self.image_instances[0].read_frames(slice, slice+1, (first_row, stop_row))[0]
+				else:
+					image = self.image_instances[slice].read_frames(0, 1, (first_row, stop_row))[0]
+				# only read the one frame (and only the rows in the region) from the file
+			#
+		elif self._is_multiframe:
+			image = self._get_pixel_array(self.image_instances[0])[slice, first_row:stop_row, :]
 		else:
-			return self.image_instances[slice].pixel_array.astype(np.double)
+			image = self._get_pixel_array(self.image_instances[slice])[first_row:stop_row, :]
+		#
+		return image[:, first_column:stop_column]
+	#
+	def _load_stored_image_for_cache(self, index):
+		r'''
+		Get the stored image of slice ``index`` (of the region) to add to the pixel cache. The
+		decoded pixel data is released from the instance, so that the cache is the only place
+		it's kept.
+		'''
+		#
+		slice = self._region_start[2]+index
+		image = self._get_stored_image(slice)
+		if self._is_multiframe or self._has_region:
+			image = image.copy()
+			# otherwise the view would keep the full frame (or every frame) alive
+		#
+		_release_pixel_array(self.image_instances[0 if self._is_multiframe else slice])
+		return image
+	#
+	def _get_pixel_array(self, instance):
+		r'''
+		Get the instance's ``pixel_array``, recording the time spent decoding it and the
+		number of decoded slices for any active profilers.
+		'''
+		#
+		with profiling.stage('DicomVolume.decode_pixels'):
+			if profiling.is_active() and not _is_pixel_array_cached(instance):
+				profiling.count('DicomVolume.decode_pixels', 'slices_decoded', int(getattr(instance, 'NumberOfFrames', 1)))
+			#
+			return instance.pixel_array
 		#
 	#
 	def _get_pixel_spacing(self, slice):
@@ -147,16 +266,11 @@ class DicomVolume(object):
 			return float(self.image_instances[slice].RescaleIntercept)
 		#
 	#
-	def _build_volume(self):
+	def _build_volume(self, region=None, region_coordinates='image', pixel_data=None):
 		r'''
-		Build the volume data and metadata.
+		Build the volume metadata and data.
 		'''
 		#
-		image_shape = self._get_denormalized_dicom_image(0).shape
-		self.info['pixel_data'] = np.zeros((image_shape[0], image_shape[1], self._num_of_slices))
-		for x in range(self._num_of_slices):
-			self.info['pixel_data'][:,:,x] = self._get_denormalized_dicom_image(x)
-		#
 		if self._num_of_slices == 1:
 			self.info['pixel_spacing'] = np.array([self._get_pixel_spacing(0)[0], self._get_pixel_spacing(0)[1]])
 			# slice_vec doesn't make sense for a 2D dataset
@@ -169,6 +283,69 @@ class DicomVolume(object):
 		self.info['patient_orientation'] = self._get_patient_position(0)
 		self.info['row_vec'] = self._get_image_orientation_patient(0)[0:3]
 		self.info['col_vec'] = self._get_image_orientation_patient(0)[3:6]
+		#
+		(self._region_start, self._region_stop) = self._get_region_bounds(region, region_coordinates)
+		self._has_region = region is not None
+		if self._has_region:
+			self.info['position'] = coordinates.transform_vectors(self.build_image_to_patient_matrix(), self._region_start)
+			# the position of the region's first voxel
+		#
+		if pixel_data is not None:
+			if tuple(np.shape(pixel_data)) != self.get_shape():
+				raise ValueError('The pixel data has shape {}, but the volume has shape {}.'.format(np.shape(pixel_data), self.get_shape()))
+			#
+			self.info['pixel_data'] = pixel_data
+		elif self._load_pixel_data:
+			image_shape = self.get_shape()
+			# uses the image attributes, rather than decoding the first image an extra time
+			self.info['pixel_data'] = np.zeros(image_shape)
+			for x in range(image_shape[2]):
+				self.info['pixel_data'][:,:,x] = self._get_denormalized_dicom_image(self._region_start[2]+x)
+			#
+			for x in self.image_instances:
+				_release_pixel_array(x)
+			# the decoded pixel data is no longer needed now that it's in the volume
+			#
+		#
+	#
+	def _get_region_bounds(self, region, region_coordinates):
+		r'''
+		Get the ``(start, stop)`` voxel indices of the region, clipped to the volume. If
+		there is no region, this is the whole volume.
+		
+		A region in patient coordinates gives the smallest block of voxels which contains
+		every voxel whose center is within the box. If the box isn't aligned with the
+		volume's axes, the block also contains voxels outside of the box.
+		'''
+		#
+		image_shape = self._get_instance_pixel_shape(self.image_instances[0])[-2:]
+		full_shape = np.array([image_shape[1], image_shape[0], self._num_of_slices])
+		#
+		if region is None:
+			return (np.zeros(3, dtype=np.intp), full_shape)
+		#
+		(start, stop) = (np.asarray(region[0], dtype=np.double), np.asarray(region[1], dtype=np.double))
+		#
+		if region_coordinates == 'patient':
+			corners = np.array([[a[0], b[1], c[2]] for a in (start, stop) for b in (start, stop) for c in (start, stop)])
+			# the 8 corners of the box
+			pat2img = np.linalg.pinv(self.build_image_to_patient_matrix())
+			# a pseudo-inverse, since the matrix of a 2D volume is singular
+			voxels = coordinates.transform_vectors(pat2img, corners)[:, 0:3]
+			start = np.ceil(np.min(voxels, axis=0)-0.001)
+			stop = np.floor(np.max(voxels, axis=0)+0.001)+1
+			# the voxels whose centers are within the bounding box (in image coordinates) of
+			# the box's corners, allowing for rounding errors
+		elif region_coordinates != 'image':
+			raise ValueError('Unknown region coordinates: ' + str(region_coordinates))
+		#
+		start = np.clip(start, 0, full_shape).astype(np.intp)
+		stop = np.clip(stop, 0, full_shape).astype(np.intp)
+		#
+		if np.any(stop <= start):
+			raise Exception('The region does not intersect the volume.')
+		#
+		return (start, stop)
 	#
 	def build_image_to_patient_matrix(self):
 		r'''
@@ -211,7 +388,69 @@ class DicomVolume(object):
 			 ---------------------- 1/2 pixel_size
 		'''
 		#
-		return [self.info['pixel_spacing'][x]*(self.info['pixel_data'].shape[x]-1)+self.info['pixel_size'][x] for x in range(self.info['pixel_data'].ndim)]
+		shape = self.get_shape()
+		return [self.info['pixel_spacing'][x]*(shape[x]-1)+self.info['pixel_size'][x] for x in range(len(shape))]
+	#
+	def get_shape(self):
+		r'''
+		Get the shape of the volume's pixel data, even if the pixel data was not loaded.
+		'''
+		#
+		if 'pixel_data' in self.info:
+			return self.info['pixel_data'].shape
+		#
+		return tuple(int(x) for x in self._region_stop-self._region_start)
+	#
+	def get_slice(self, index):
+		r'''
+		Get a single slice (along axis 2) of the volume (or of its region). If the volume
+		was built without loading the pixel data, the slice is read from the DICOM instance,
+		or from the volume's pixel cache if it was read recently.
+		'''
+		#
+		if 'pixel_data' in self.info:
+			return self.info['pixel_data'][:,:,index]
+		#
+		stored_image = self._pixel_cache.get((self._cache_token, index), lambda: self._load_stored_image_for_cache(index))
+		return self._denormalize_image(stored_image, self._region_start[2]+index)
+	#
+	def get_slice_hashes(self, algorithm='sha1'):
+		r'''
+		Get a digest (a hex string) of the pixel values of each slice (along axis 2), using
+		the ``algorithm`` from :mod:`hashlib`. The slices are hashed one at a time (see
+		:meth:`get_slice`), so the pixel data doesn't need to be loaded.
+		
+		Slices with identical pixel values (and shapes) have identical digests, so the digests
+		can be compared instead of the pixel data, for example to find duplicate series.
+		'''
+		#
+		hashes = []
+		for x in range(self.get_shape()[2]):
+			image = np.ascontiguousarray(self.get_slice(x), dtype=np.double)
+			digest = hashlib.new(algorithm)
+			digest.update(str(image.shape).encode('ascii'))
+			digest.update(image.data)
+			hashes.append(digest.hexdigest())
+		#
+		return hashes
+	#
+	def get_content_hash(self, algorithm='sha1'):
+		r'''
+		Get a single digest of the volume's metadata (see :meth:`compare_volume_metadata`)
+		and the digests of its slices (see :meth:`get_slice_hashes`).
+		'''
+		#
+		digest = hashlib.new(algorithm)
+		for key in sorted(self.info):
+			if key != 'pixel_data':
+				value = self.info[key]
+				digest.update(repr((key, value.tolist() if isinstance(value, np.ndarray) else value)).encode('utf-8'))
+			#
+		#
+		for x in self.get_slice_hashes(algorithm):
+			digest.update(x.encode('ascii'))
+		#
+		return digest.hexdigest()
 	#
 	def export_images(self, directory, filename_prefix, axis=2):
 		'''
@@ -222,6 +461,545 @@ class DicomVolume(object):
 		#
 		return export.export_stack_to_png(self.info['pixel_data'], axis, directory, filename_prefix)
 	#
+	def get_oblique_slice(self, plane_origin, plane_row_vec, plane_col_vec, shape, spacing=None, interpolation='linear', fill_value=0):
+		r'''
+		Extract an arbitrary (oblique) plane from the volume, also known as a multi-planar
+		reformat (MPR). The plane is described in patient coordinates by the position of its
+		first pixel and its row and column direction vectors (the same convention as the DICOM
+		``ImagePositionPatient`` and ``ImageOrientationPatient`` attributes). The resulting image
+		has the given ``shape``, where axis 0 runs along ``plane_row_vec`` and axis 1 runs along
+		``plane_col_vec``, just like the first two axes of ``info['pixel_data']``.
+		
+		The ``spacing`` is the pixel spacing (in mm) of the resulting image, and defaults to the
+		in-plane pixel spacing of the volume. The ``interpolation`` can be either ``'linear'``
+		(trilinear) or ``'nearest'``. Pixels which fall outside of the volume are set to
+		``fill_value``. If the volume was built without loading the pixel data, only the
+		slices which the plane passes through are read (see :meth:`get_slice`).
+		
+		Returns a tuple of the 2D image and its image-to-patient matrix (see
+		:meth:`dicomtools.coordinates.build_image_to_patient_matrix`).
+		
+		Example (an axial slice through the middle of the volume):
+		::
+		
+			>>> img2pat = volume.build_image_to_patient_matrix()
+			>>> centre = dicomtools.coordinates.transform_vectors(img2pat, np.array(volume.get_shape())/2.0)
+			>>> image, image_img2pat = volume.get_oblique_slice(centre-[100,100,0], [1,0,0], [0,1,0], (200, 200))
+		'''
+		#
+		if 'slice_vec' not in self.info:
+			raise Exception('Oblique slices can only be extracted from a 3D volume.')
+		if interpolation not in ['linear', 'nearest']:
+			raise ValueError('Unknown interpolation: ' + str(interpolation))
+		#
+		plane_row_vec = np.asarray(plane_row_vec, dtype=np.double)
+		plane_col_vec = np.asarray(plane_col_vec, dtype=np.double)
+		plane_row_vec = plane_row_vec/np.linalg.norm(plane_row_vec)
+		plane_col_vec = plane_col_vec/np.linalg.norm(plane_col_vec)
+		#
+		if spacing is None:
+			spacing = self.info['pixel_spacing'][0:2]
+		#
+		plane_img2pat = coordinates.build_image_to_patient_matrix(plane_origin, spacing, plane_row_vec, plane_col_vec)
+		plane_img2vol = np.dot(np.linalg.inv(self.build_image_to_patient_matrix()), plane_img2pat)
+		# transforms a pixel in the plane directly to a (fractional) voxel position in the volume
+		#
+		# since the mapping is affine, the voxel position of every pixel is the origin plus a
+		# multiple of each step vector, so we can build all of them at once with broadcasting
+		u = np.arange(shape[0], dtype=np.double)[:, np.newaxis, np.newaxis]
+		v = np.arange(shape[1], dtype=np.double)[np.newaxis, :, np.newaxis]
+		voxel_positions = (plane_img2vol[0:3, 3] + u*plane_img2vol[0:3, 0] + v*plane_img2vol[0:3, 1]).reshape(-1, 3)
+		#
+		if 'pixel_data' in self.info:
+			pixel_data = self.info['pixel_data']
+		else:
+			num_of_slices = self.get_shape()[2]
+			first = int(np.clip(np.floor(np.min(voxel_positions[:,2])), 0, num_of_slices-1))
+			stop = int(np.clip(np.ceil(np.max(voxel_positions[:,2]))+1, first+1, num_of_slices))
+			pixel_data = np.dstack([self.get_slice(x) for x in range(first, stop)])
+			voxel_positions[:,2] -= first
+			# only the slices between the lowest and highest points of the plane
+		#
+		image = _sample_volume(pixel_data, voxel_positions, interpolation, fill_value)
+		#
+		return (image.reshape(shape[0], shape[1]), plane_img2pat)
+	#
+#
+def _get_volume_metadata(dicom_volume):
+	r'''
+	Get the volume metadata (everything but the pixel data) in a form which can be saved
+	as JSON.
+	'''
+	#
+	metadata = {'description': dicom_volume.description, 'shape': list(dicom_volume.get_shape())}
+	for (key, value) in dicom_volume.info.items():
+		if key == 'pixel_data':
+			continue
+		metadata[key] = value.tolist() if isinstance(value, np.ndarray) else value
+	#
+	return metadata
+#
+class DicomVolume4D(object):
+	r'''
+	A 4D (temporal or multi-phase) volume, such as a cardiac or perfusion series, where
+	each position is imaged once per phase. The instances are grouped into phases by a
+	temporal attribute, and the pixel data of every phase is stored in a single
+	contiguous ``info['pixel_data']`` array with a (columns, rows, slices, phases) shape.
+	
+	Each phase is also available as a :class:`DicomVolume` in ``phases``, with its own
+	metadata. The pixel data of each phase volume is a view of the 4D array, so it isn't
+	duplicated.
+	'''
+	TEMPORAL_KEYWORDS = ['TemporalPositionIdentifier', 'TriggerTime']
+	#
+	def __init__(self, dicom_series, temporal_keyword=None):
+		r'''
+		Given a DicomSeries object of single-frame instances, this groups the instances by
+		the ``temporal_keyword`` attribute and builds the 4D volume. By default the first of
+		:attr:`TEMPORAL_KEYWORDS` which the instances have is used.
+		
+		Every phase must have the same geometry (the same slice positions, orientation,
+		spacing, etc).
+		'''
+		#
+		self._dicom_series = dicom_series
+		self.description = self._dicom_series.description
+		#
+		image_instances = [x for x in self._dicom_series.instances if 'PixelData' in x]
+		if len(image_instances) == 0:
+			raise Exception('There are no DICOM instances with image data in the series.')
+		#
+		if temporal_keyword is None:
+			temporal_keyword = next((x for x in self.TEMPORAL_KEYWORDS if hasattr(image_instances[0], x)), None)
+			if temporal_keyword is None:
+				raise Exception('The DICOM instances do not have any of the temporal attributes: {}'.format(', '.join(self.TEMPORAL_KEYWORDS)))
+			#
+		#
+		if not all(hasattr(x, temporal_keyword) for x in image_instances):
+			raise Exception('Not all of the DICOM instances have a \'{}\' attribute.'.format(temporal_keyword))
+		#
+		with profiling.stage('DicomVolume4D._group_phases'):
+			phase_instances = {}
+			for x in image_instances:
+				phase_instances.setdefault(float(getattr(x, temporal_keyword)), []).append(x)
+			# the instances stay in the series order within each phase
+			#
+			temporal_values = sorted(phase_instances)
+			phases = [DicomVolume(DicomSeries(phase_instances[x]), load_pixel_data=False, pixel_cache=cache.PixelCache(0)) for x in temporal_values]
+			# validates and builds the metadata of each phase, without decoding the pixel data
+		#
+		with profiling.stage('DicomVolume4D._validate_volume'):
+			for phase in phases[1:]:
+				try:
+					compare_volume_metadata(phases[0], phase)
+				except AssertionError:
+					raise Exception('The phases do not all have the same geometry.')
+				#
+			#
+		#
+		self.info = dict(phases[0].info)
+		self.info['temporal_keyword'] = temporal_keyword
+		self.info['temporal_values'] = np.array(temporal_values)
+		#
+		with profiling.stage('DicomVolume4D._build_volume'):
+			self._build_volume(phases)
+		#
+	#
+	def __str__(self):
+		return "DICOM 4D Volume (Description: \'{}\', Phases: {}, Series UID: {})".format(self.description, len(self.phases), self._dicom_series.uid)
+	#
+	def _build_volume(self, phases):
+		r'''
+		Decode each slice of each phase directly into the 4D array, and give each phase's
+		volume a view of it as its pixel data.
+		'''
+		#
+		shape = phases[0].get_shape()
+		self.info['pixel_data'] = np.zeros(tuple(shape) + (len(phases),))
+		#
+		for (t, phase) in enumerate(phases):
+			for x in range(shape[2]):
+				self.info['pixel_data'][:,:,x,t] = phase.get_slice(x)
+			# the phases don't cache their slices, and each instance's decoded pixel data is
+			# released once it's been read
+			phase.info['pixel_data'] = self.info['pixel_data'][:,:,:,t]
+		#
+		self.phases = phases
+	#
+	def get_shape(self):
+		r'''
+		Get the (columns, rows, slices, phases) shape of the pixel data.
+		'''
+		#
+		return self.info['pixel_data'].shape
+	#
+	def build_image_to_patient_matrix(self):
+		r'''
+		Get the image-to-patient matrix of the spatial axes, which is the same for every
+		phase (see :meth:`DicomVolume.build_image_to_patient_matrix`).
+		'''
+		#
+		return self.phases[0].build_image_to_patient_matrix()
+	#
+#
+class IncrementalVolumeBuilder(object):
+	r'''
+	Builds a :class:`DicomVolume` from single-frame DICOM instances as they arrive (for
+	example while the series is still being acquired), rather than from a complete
+	series. Each instance is validated against the instances already added, its pixel
+	data is decoded once, and it's placed into its slot in the volume based on its
+	position, so the instances can arrive in any order.
+	
+	The slices received so far can be used with :meth:`get_partial_volume` before the
+	series is complete, and :meth:`build_volume` builds the final :class:`DicomVolume`
+	without decoding the pixel data again. Instances can be added from one thread while
+	another thread reads the partial volume.
+	
+	Example:
+	::
+	
+		>>> builder = dicomtools.volume.IncrementalVolumeBuilder(num_of_slices=120)
+		>>> for dicom_instance in receive_instances():
+		...     builder.add_instance(dicom_instance)
+		...     process(builder.get_partial_volume())
+		>>> volume = builder.build_volume()
+	'''
+	def __init__(self, num_of_slices=None):
+		r'''
+		If the ``num_of_slices`` is known, instances which would make the volume longer
+		than that are rejected, and the volume is not complete until all of them have
+		arrived.
+		'''
+		#
+		self.num_of_slices = num_of_slices
+		self._lock = threading.Lock()
+		self._reference = None
+		# the attributes of the first instance, which every other instance must match
+		self._direction = None
+		# +1 or -1, so that the slots are ordered by instance number (like a DicomSeries)
+		self._keys = []
+		self._positions = []
+		self._instances = []
+		self._images = []
+		# kept sorted by key (the distance along the slice normal, times the direction)
+	#
+	def _get_reference(self, dicom_instance):
+		orientation = np.array(dicom_instance.ImageOrientationPatient, dtype=np.double)
+		return {
+			'uid': dicom_instance.SeriesInstanceUID,
+			'shape': (int(dicom_instance.Rows), int(dicom_instance.Columns)),
+			'orientation': orientation,
+			'normal': np.cross(orientation[0:3], orientation[3:6]),
+			'pixel_spacing': np.array(dicom_instance.PixelSpacing, dtype=np.double),
+			'slice_thickness': float(dicom_instance.SliceThickness),
+		}
+	#
+	def _validate_instance(self, reference):
+		r'''
+		Make sure that the instance matches the instances already added (same series,
+		size, direction, etc), with the same checks as :class:`DicomVolume`.
+		'''
+		#
+		if reference['uid'] != self._reference['uid']:
+			raise Exception('Each \'SeriesInstanceUID\' does not match, so images do not belong to the same series.')
+		if reference['shape'] != self._reference['shape']:
+			raise Exception('Images are not all the same size.')
+		if np.any(reference['orientation'] != self._reference['orientation']):
+			raise Exception('Images do not have the same direction.')
+		if np.any(reference['pixel_spacing'] != self._reference['pixel_spacing']):
+			raise Exception('Images do not have the same pixel spacing.')
+		if reference['slice_thickness'] != self._reference['slice_thickness']:
+			raise Exception('Images do not have the same slice thickness.')
+		#
+	#
+	def _get_slots(self, keys, positions):
+		r'''
+		Get the slot of each (sorted) position, and the vector between adjacent slots.
+		The slice spacing is taken to be the largest spacing that puts every position a
+		whole number of slices from the first.
+		'''
+		#
+		if len(keys) == 1:
+			return (np.zeros(1, dtype=np.intp), None)
+		#
+		spacing = _get_common_spacing(np.diff(keys))
+		slots = np.rint((keys-keys[0])/spacing).astype(np.intp)
+		step = (positions[-1]-positions[0])/slots[-1]
+		#
+		if np.any(np.abs(positions - (positions[0] + slots[:,np.newaxis]*step)) > 0.001):
+			raise Exception('Images are not evenly spaced.')
+		#
+		steps = np.diff(positions, axis=0)/np.diff(slots)[:,np.newaxis]
+		if np.any(np.abs(steps-steps[0]) > 0.001):
+			# the same check as DicomVolume, for the vector between adjacent slots
+			raise Exception('Images are not evenly spaced.')
+		#
+		if self.num_of_slices is not None and slots[-1] >= self.num_of_slices:
+			raise Exception('The images span more than {} slices.'.format(self.num_of_slices))
+		#
+		return (slots, step)
+	#
+	def add_instance(self, dicom_instance):
+		r'''
+		Add a single-frame DICOM instance to the volume. An exception is raised (and the
+		instance is not added) if it doesn't fit with the instances already added.
+		'''
+		#
+		with profiling.stage('IncrementalVolumeBuilder.add_instance'):
+			if int(getattr(dicom_instance, 'NumberOfFrames', 1)) > 1:
+				raise Exception('Multi-frame dicom instances cannot be added incrementally.')
+			#
+			reference = self._get_reference(dicom_instance)
+			position = np.array(dicom_instance.ImagePositionPatient, dtype=np.double)
+			#
+			image = np.transpose(dicom_instance.pixel_array.astype(np.double)*float(dicom_instance.RescaleSlope) + float(dicom_instance.RescaleIntercept))
+			_release_pixel_array(dicom_instance)
+			# decode without holding the lock, and keep only the rescaled image
+			#
+			with self._lock:
+				if self._reference is None:
+					self._reference = reference
+				else:
+					self._validate_instance(reference)
+				#
+				if len(self._positions) > 0 and np.min(np.linalg.norm(np.array(self._positions)-position, axis=1)) < 0.001:
+					raise Exception('At least two images have the same position.')
+				#
+				(keys, positions, instances, images) = (self._keys, self._positions, self._instances, self._images)
+				direction = self._direction
+				if direction is None and hasattr(dicom_instance, 'InstanceNumber'):
+					direction = self._find_direction(dicom_instance, position)
+					if direction == -1:
+						(keys, positions, instances, images) = ([-x for x in reversed(keys)], positions[::-1], instances[::-1], images[::-1])
+					#
+				#
+				key = (direction or 1)*np.dot(position, self._reference['normal'])
+				index = bisect.bisect(keys, key)
+				keys = keys[:index] + [key] + keys[index:]
+				positions = positions[:index] + [position] + positions[index:]
+				self._get_slots(np.array(keys), np.array(positions))
+				# raises before anything is changed if the position doesn't fit
+				#
+				self._direction = direction
+				self._keys = keys
+				self._positions = positions
+				self._instances = instances[:index] + [dicom_instance] + instances[index:]
+				self._images = images[:index] + [image] + images[index:]
+			#
+		#
+	#
+	def _find_direction(self, dicom_instance, position):
+		r'''
+		Once two instances with instance numbers have arrived, the slots are ordered so that
+		the instance numbers increase along the volume (the order :class:`DicomSeries`
+		uses). Returns +1 if that's the direction of the slice normal, -1 if it's the
+		opposite direction, or None if it can't be determined yet.
+		'''
+		#
+		for (other, other_position) in zip(self._instances, self._positions):
+			if hasattr(other, 'InstanceNumber') and other.InstanceNumber != dicom_instance.InstanceNumber:
+				distance = np.dot(position-other_position, self._reference['normal'])
+				increasing = (dicom_instance.InstanceNumber > other.InstanceNumber) == (distance > 0)
+				return 1 if increasing else -1
+			#
+		#
+		return None
+	#
+	def get_num_of_instances(self):
+		r'''
+		Get the number of instances added so far.
+		'''
+		#
+		with self._lock:
+			return len(self._instances)
+		#
+	#
+	def get_missing_slices(self):
+		r'''
+		Get the indices of the slots (in the partial volume) which are between the instances
+		added so far, but haven't arrived yet.
+		'''
+		#
+		with self._lock:
+			if len(self._keys) == 0:
+				return []
+			#
+			(slots, step) = self._get_slots(np.array(self._keys), np.array(self._positions))
+		#
+		filled = np.zeros(slots[-1]+1, dtype=bool)
+		filled[slots] = True
+		return [int(x) for x in np.flatnonzero(~filled)]
+	#
+	def is_complete(self):
+		r'''
+		Returns True if there are no missing slices (and all ``num_of_slices`` slices have
+		arrived, if it was given), otherwise returns False.
+		'''
+		#
+		num_of_instances = self.get_num_of_instances()
+		if num_of_instances == 0 or len(self.get_missing_slices()) != 0:
+			return False
+		#
+		return self.num_of_slices is None or num_of_instances == self.num_of_slices
+	#
+	def get_partial_volume(self, fill_value=np.nan):
+		r'''
+		Get a volume info dictionary (with the same keys as :attr:`DicomVolume.info`) for the
+		instances added so far. The volume spans from the first to the last slice received
+		along the slice direction, and slices which haven't arrived yet are filled with
+		``fill_value``. The ``'filled'`` key is a boolean array of which slices have arrived.
+		
+		Slices can still arrive beyond either end of the partial volume, so the slice
+		indices (and ``'position'``) can change as more instances are added.
+		'''
+		#
+		with self._lock:
+			if len(self._instances) == 0:
+				raise Exception('No DICOM instances have been added.')
+			#
+			(slots, step) = self._get_slots(np.array(self._keys), np.array(self._positions))
+			images = list(self._images)
+			first_position = self._positions[0]
+			first_instance = self._instances[0]
+		#
+		image_shape = images[0].shape
+		info = {}
+		info['pixel_data'] = np.empty((image_shape[0], image_shape[1], slots[-1]+1))
+		info['pixel_data'].fill(fill_value)
+		for (slot, image) in zip(slots, images):
+			info['pixel_data'][:,:,slot] = image
+		#
+		info['filled'] = np.zeros(slots[-1]+1, dtype=bool)
+		info['filled'][slots] = True
+		#
+		pixel_spacing = self._reference['pixel_spacing']
+		if step is None:
+			info['pixel_spacing'] = np.array([pixel_spacing[0], pixel_spacing[1]])
+			# slice_vec doesn't make sense for a 2D dataset
+		else:
+			info['pixel_spacing'] = np.array([pixel_spacing[0], pixel_spacing[1], np.linalg.norm(step)])
+			info['slice_vec'] = step/info['pixel_spacing'][2]
+		#
+		info['pixel_size'] = np.array([pixel_spacing[0], pixel_spacing[1], self._reference['slice_thickness']])
+		info['position'] = np.array(first_position)
+		info['patient_orientation'] = str(first_instance.PatientPosition)
+		info['row_vec'] = self._reference['orientation'][0:3]
+		info['col_vec'] = self._reference['orientation'][3:6]
+		#
+		return info
+	#
+	def build_volume(self, pixel_cache=None):
+		r'''
+		Build the :class:`DicomVolume` once all of the slices have arrived (see
+		:meth:`is_complete`). The volume's metadata is validated and built as usual, but
+		the pixel data is taken from the already decoded slices.
+		'''
+		#
+		if not self.is_complete():
+			raise Exception('The volume is not complete, {} slices are missing.'.format(len(self.get_missing_slices())))
+		#
+		with self._lock:
+			instances = list(self._instances)
+			images = list(self._images)
+		#
+		series = DicomSeries(instances)
+		slots = dict((id(x), y) for (y, x) in enumerate(instances))
+		image_shape = images[0].shape
+		pixel_data = np.empty((image_shape[0], image_shape[1], len(images)))
+		for (x, instance) in enumerate(series.instances):
+			pixel_data[:,:,x] = images[slots[id(instance)]]
+		# the series orders its instances by instance number, which can differ from the
+		# slots if the instances don't all have instance numbers
+		#
+		return DicomVolume(series, pixel_cache=pixel_cache, pixel_data=pixel_data)
+	#
+#
+def _get_common_spacing(gaps, tolerance=0.001):
+	r'''
+	Get the largest spacing that each of the (positive) gaps is a multiple of, where each
+	gap can be off by the ``tolerance``. This is the greatest common divisor, using
+	Euclid's algorithm.
+	
+	Each remainder is a combination of the gaps, so its possible error is the sum of
+	their errors. A remainder within its error of zero means the spacing was found, while
+	a remainder within twice its error of zero can't be told apart from noise, so the
+	gaps aren't multiples of any spacing (for example, they're jittered by more than the
+	tolerance) and an exception is raised, rather than returning a tiny spacing.
+	'''
+	#
+	(spacing, error) = (gaps[0], tolerance)
+	for gap in gaps[1:]:
+		((a, a_error), (b, b_error)) = sorted([(spacing, error), (gap, tolerance)], reverse=True)
+		while True:
+			multiple = np.floor(a/b)
+			remainder = a - multiple*b
+			remainder_error = a_error + multiple*b_error
+			if min(remainder, b-remainder) <= remainder_error:
+				break
+			#
+			if remainder <= 2*remainder_error:
+				raise Exception('Images are not evenly spaced.')
+			#
+			((a, a_error), (b, b_error)) = ((b, b_error), (remainder, remainder_error))
+		#
+		(spacing, error) = (b, b_error)
+	#
+	return spacing
+#
+def _sample_volume(pixel_data, voxel_positions, interpolation, fill_value):
+	r'''
+	Sample the 3D ``pixel_data`` at each of the (fractional) ``voxel_positions`` (an
+	:math:`n \times 3` array). Only the voxels neighbouring each position are read, and
+	positions outside of the volume are given the ``fill_value``.
+	'''
+	#
+	shape = np.array(pixel_data.shape)
+	result = np.empty(len(voxel_positions))
+	result.fill(fill_value)
+	#
+	if interpolation == 'nearest':
+		nearest = np.rint(voxel_positions).astype(np.intp)
+		inside = np.all((nearest >= 0) & (nearest < shape), axis=1)
+		nearest = nearest[inside]
+		result[inside] = pixel_data[nearest[:,0], nearest[:,1], nearest[:,2]]
+		return result
+	#
+	# allow positions exactly on the last voxel, but nothing beyond it
+	inside = np.all((voxel_positions >= 0) & (voxel_positions <= shape-1), axis=1)
+	positions = voxel_positions[inside]
+	#
+	lower = np.minimum(np.floor(positions).astype(np.intp), np.maximum(shape-2, 0))
+	# clamp so that the upper neighbour is still within the volume
+	fraction = positions-lower
+	#
+	flat = pixel_data.ravel()
+	# flat indexing is faster than fancy indexing with three index arrays
+	strides = np.array([shape[1]*shape[2], shape[2], 1])
+	base = np.dot(lower, strides)
+	upper_offsets = [strides[axis] if shape[axis] > 1 else 0 for axis in range(3)]
+	# a volume with a single voxel along an axis has no upper neighbour along that axis
+	#
+	weights_x = [1-fraction[:,0], fraction[:,0]]
+	weights_y = [1-fraction[:,1], fraction[:,1]]
+	#
+	values = np.zeros(len(positions))
+	for x in range(2):
+		for y in range(2):
+			# loop over the 4 neighbouring voxel columns, interpolating along axis 2 within each
+			index = base + (x*upper_offsets[0] + y*upper_offsets[1])
+			lower_values = flat.take(index)
+			index += upper_offsets[2]
+			upper_values = flat.take(index)
+			# the two voxels along axis 2 are adjacent in memory
+			upper_values -= lower_values
+			upper_values *= fraction[:,2]
+			upper_values += lower_values
+			upper_values *= weights_x[x]*weights_y[y]
+			values += upper_values
+		#
+	#
+	result[inside] = values
+	return result
 #
 def compare_volume_metadata(volume1, volume2):
 	r'''
@@ -229,11 +1007,11 @@ def compare_volume_metadata(volume1, volume2):
 	data, but not the actual pixel data. Returns True if equal, otherwise returns False.
 	'''
 	#
-	assert volume1.info['pixel_data'].shape == volume2.info['pixel_data'].shape
+	assert volume1.get_shape() == volume2.get_shape()
 	#
 	keys = set(list(volume1.info)+list(volume2.info))
 	# get union of keys from both dictionaries
-	keys.remove('pixel_data')
+	keys.discard('pixel_data')
 	# we want to compare everything but the pixel data
 	#
 	for x in keys:
@@ -245,3 +1023,37 @@ def compare_volume_metadata(volume1, volume2):
 	#
 	return True
 #
+def compare_volume_pixels(volume1, volume2, tolerance=0.0):
+	r'''
+	Compare the pixel data of two volumes with the same shape, one slice at a time (see
+	:meth:`DicomVolume.get_slice`). Voxels differ if their values differ by more than the
+	``tolerance``.
+	
+	Returns a list with a dictionary for each slice which differs, with the keys
+	``'slice'``, ``'num_of_voxels'`` (the number of differing voxels),
+	``'max_difference'``, and ``'start'`` and ``'stop'`` (the bounding box of the differing
+	voxels within the slice). The list is empty if the pixel data is the same.
+	'''
+	#
+	if volume1.get_shape() != volume2.get_shape():
+		raise ValueError('The volumes do not have the same shape.')
+	#
+	differences = []
+	for x in range(volume1.get_shape()[2]):
+		difference = np.abs(volume1.get_slice(x)-volume2.get_slice(x))
+		differing = difference > tolerance
+		if not np.any(differing):
+			continue
+		#
+		axis0 = np.flatnonzero(np.any(differing, axis=1))
+		axis1 = np.flatnonzero(np.any(differing, axis=0))
+		differences.append({
+			'slice': x,
+			'num_of_voxels': int(np.count_nonzero(differing)),
+			'max_difference': float(np.max(difference)),
+			'start': (int(axis0[0]), int(axis1[0])),
+			'stop': (int(axis0[-1])+1, int(axis1[-1])+1),
+		})
+	#
+	return differences
+#
@@ -29,4 +29,9 @@ setup(
     keywords='dicom imaging',
     packages=find_packages(),
     install_requires=['pydicom', 'numpy', 'matplotlib'],
+    entry_points={
+        'console_scripts': [
+            'dicomtools=dicomtools.cli:main',
+        ],
+    },
 )
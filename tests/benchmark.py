@@ -0,0 +1,248 @@
+r'''
+Benchmarks for the main stages of loading and processing a DICOM series. The series are
+synthesized, so no external data is needed.
+
+Usage:
+::
+
+	python tests/benchmark.py --rows 512 --columns 512 --slices 100 --save baseline.json
+	python tests/benchmark.py --rows 512 --columns 512 --slices 100 --compare baseline.json
+
+When comparing against a baseline, the script exits with a non-zero status if any stage
+is slower than the baseline by more than the ``--threshold`` factor.
+
+With ``--check``, each of the alternative ways of loading a volume (see
+``equivalence.py``) is also timed and compared with the reference implementation, and the
+script exits with a non-zero status if any of them gives a different volume.
+'''
+import argparse
+import gc
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+#
+try:
+	import tracemalloc
+except ImportError:
+	tracemalloc = None
+	# not available before python 3.4, so peak memory won't be reported
+#
+import numpy as np
+import dicom
+#
+_package_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, _package_directory)
+import dicomtools
+import equivalence
+import synthetic
+#
+def _measure(function, setup, repeat):
+	r'''
+	Run ``function(setup())`` ``repeat`` times and return the fastest time in seconds,
+	along with the peak memory allocated by a single run (or None if it can't be measured).
+	Only the function call is timed.
+	'''
+	#
+	times = []
+	for x in range(repeat):
+		argument = setup()
+		gc.collect()
+		start = timeit.default_timer()
+		function(argument)
+		times.append(timeit.default_timer()-start)
+		del argument
+	#
+	peak = None
+	if tracemalloc is not None:
+		argument = setup()
+		gc.collect()
+		tracemalloc.start()
+		function(argument)
+		peak = tracemalloc.get_traced_memory()[1]
+		tracemalloc.stop()
+	#
+	return min(times), peak
+#
+def _build_stages(filenames, num_of_slices, export_directory):
+	r'''
+	Build a list of ``(name, function, setup, num_of_items, unit)`` for each benchmarked
+	stage of the given series.
+	'''
+	#
+	read = lambda: [dicom.read_file(x) for x in filenames]
+	series = lambda: dicomtools.dicom_read.read_dicom_series(filenames)
+	volume = dicomtools.volume.DicomVolume(series())
+	num_of_voxels = int(np.prod(volume.get_shape()))
+	file_bytes = sum(os.path.getsize(x) for x in filenames)
+	#
+	voxel_positions = np.indices(volume.get_shape()).reshape(3, -1).T
+	img2pat = volume.build_image_to_patient_matrix()
+	#
+	return [
+		('read_dicom_series', dicomtools.dicom_read.read_dicom_series, lambda: filenames, file_bytes/1e6, 'MB'),
+		('DicomSeries', dicomtools.series.DicomSeries, read, len(filenames), 'instances'),
+		('DicomVolume', dicomtools.volume.DicomVolume, series, num_of_voxels/1e6, 'Mvoxels'),
+		('transform_vectors', lambda x: dicomtools.coordinates.transform_vectors(img2pat, x), lambda: voxel_positions, len(voxel_positions)/1e6, 'Mvectors'),
+		('export_stack_to_png', lambda x: dicomtools.export.export_stack_to_png(x, 2, export_directory, 'bench'), lambda: volume.info['pixel_data'], num_of_slices, 'images'),
+	]
+#
+def measure_import_time(repeat):
+	r'''
+	Get the fastest time in seconds to start a new python interpreter and import
+	dicomtools, minus the time to start an interpreter which only imports numpy and
+	pydicom (which dicomtools can't avoid).
+	'''
+	#
+	def run(code):
+		times = []
+		for x in range(repeat):
+			start = timeit.default_timer()
+			subprocess.check_call([sys.executable, '-c', code], cwd=_package_directory)
+			times.append(timeit.default_timer()-start)
+		#
+		return min(times)
+	#
+	return run('import numpy, dicom, dicomtools')-run('import numpy, dicom')
+#
+def run_benchmarks(rows, columns, num_of_slices, repeat, layouts):
+	r'''
+	Run every stage for each of the series layouts (``'single_frame'`` and/or
+	``'multi_frame'``), and return a dictionary of results keyed by
+	``'<layout>.<stage>'``.
+	'''
+	#
+	data = synthetic.make_volume_data((columns, rows, num_of_slices))
+	results = {}
+	#
+	seconds = measure_import_time(repeat)
+	results['import.dicomtools'] = {'seconds': seconds, 'peak_bytes': None, 'throughput': 1/max(seconds, 1e-6), 'unit': 'imports/s'}
+	#
+	for layout in layouts:
+		directory = tempfile.mkdtemp()
+		try:
+			if layout == 'single_frame':
+				datasets = synthetic.make_single_frame_series(data)
+			else:
+				datasets = [synthetic.make_multiframe_instance(data)]
+			#
+			filenames = synthetic.write_series(datasets, directory)
+			del datasets
+			#
+			export_directory = os.path.join(directory, 'export')
+			os.mkdir(export_directory)
+			#
+			for (name, function, setup, num_of_items, unit) in _build_stages(filenames, num_of_slices, export_directory):
+				seconds, peak = _measure(function, setup, repeat)
+				results['{}.{}'.format(layout, name)] = {'seconds': seconds, 'peak_bytes': peak, 'throughput': num_of_items/seconds, 'unit': unit+'/s'}
+			#
+		finally:
+			shutil.rmtree(directory)
+		#
+	#
+	return results
+#
+def print_results(results, baseline=None):
+	r'''
+	Print a table of the results, and the ratio of each time to the baseline if given.
+	'''
+	#
+	header = '{:<40} {:>10} {:>22} {:>12}'.format('stage', 'time (s)', 'throughput', 'peak (MB)')
+	if baseline is not None:
+		header += ' {:>12}'.format('vs baseline')
+	print(header)
+	#
+	for name in sorted(results):
+		result = results[name]
+		peak = '-' if result['peak_bytes'] is None else '{:.1f}'.format(result['peak_bytes']/1e6)
+		line = '{:<40} {:>10.4f} {:>22} {:>12}'.format(name, result['seconds'], '{:.2f} {}'.format(result['throughput'], result['unit']), peak)
+		if baseline is not None:
+			if name in baseline['results']:
+				line += ' {:>11.2f}x'.format(result['seconds']/baseline['results'][name]['seconds'])
+			else:
+				line += ' {:>12}'.format('-')
+			#
+		#
+		print(line)
+	#
+#
+def find_regressions(results, baseline, threshold):
+	r'''
+	Get the names of the stages which are slower than the baseline by more than the
+	threshold factor.
+	'''
+	#
+	return [x for x in sorted(results) if x in baseline['results'] and results[x]['seconds'] > threshold*baseline['results'][x]['seconds']]
+#
+def print_check_results(check_results):
+	r'''
+	Print the time of each loading mode and whether its volume is identical to the
+	reference, for each series variant.
+	'''
+	#
+	for variant in sorted(check_results):
+		print('{}:'.format(variant))
+		for x in check_results[variant]:
+			identical = 'yes' if len(x['differences']) == 0 else 'NO ({})'.format(', '.join(x['differences']))
+			print('  {:<16} {:>10.2f} ms  identical: {}'.format(x['mode'], x['seconds']*1000, identical))
+		#
+	#
+#
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Benchmark dicomtools on synthetic DICOM series.')
+	parser.add_argument('--rows', type=int, default=256)
+	parser.add_argument('--columns', type=int, default=256)
+	parser.add_argument('--slices', type=int, default=50)
+	parser.add_argument('--repeat', type=int, default=3, help='number of timed runs of each stage (the fastest is reported)')
+	parser.add_argument('--layout', choices=['single_frame', 'multi_frame', 'both'], default='both')
+	parser.add_argument('--save', metavar='FILE', help='save the results as a baseline')
+	parser.add_argument('--compare', metavar='FILE', help='compare the results against a saved baseline')
+	parser.add_argument('--threshold', type=float, default=1.2, help='slowdown factor which counts as a regression')
+	parser.add_argument('--check', action='store_true', help='check that every loading mode gives the same volume as the reference')
+	args = parser.parse_args(argv)
+	#
+	layouts = ['single_frame', 'multi_frame'] if args.layout == 'both' else [args.layout]
+	config = {'rows': args.rows, 'columns': args.columns, 'slices': args.slices}
+	results = run_benchmarks(args.rows, args.columns, args.slices, args.repeat, layouts)
+	#
+	baseline = None
+	if args.compare is not None:
+		with open(args.compare) as f:
+			baseline = json.load(f)
+		#
+		if baseline['config'] != config:
+			print('Warning: the baseline was run with a different configuration: {}'.format(baseline['config']))
+		#
+	#
+	print_results(results, baseline)
+	#
+	if args.save is not None:
+		with open(args.save, 'w') as f:
+			json.dump({'config': config, 'results': results}, f, indent=2, sort_keys=True)
+		#
+	#
+	if args.check:
+		check_results = equivalence.check_variants((args.columns, args.rows, args.slices), repeat=args.repeat)
+		print_check_results(check_results)
+		#
+		mismatches = ['{}/{}'.format(x, y['mode']) for x in sorted(check_results) for y in check_results[x] if len(y['differences']) > 0]
+		if len(mismatches) > 0:
+			print('Not identical to the reference: {}'.format(', '.join(mismatches)))
+			return 1
+		#
+	#
+	if baseline is not None:
+		regressions = find_regressions(results, baseline, args.threshold)
+		if len(regressions) > 0:
+			print('Regressions (more than {}x slower): {}'.format(args.threshold, ', '.join(regressions)))
+			return 1
+		#
+	#
+	return 0
+#
+if __name__ == '__main__':
+	sys.exit(main())
+#
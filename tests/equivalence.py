@@ -0,0 +1,202 @@
+r'''
+A harness which checks that each of the faster (or lower memory) ways of loading a volume
+gives exactly the same volume as the reference implementation, which reads every file
+with :meth:`dicomtools.dicom_read.read_dicom_series` and builds a
+:class:`dicomtools.volume.DicomVolume` with its pixel data loaded. Every mode is timed as
+well, so that a speedup is only reported along with proof that it's correct.
+
+It's used by ``test_equivalence.py`` and by ``benchmark.py --check``.
+'''
+import io
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+import zipfile
+#
+import numpy as np
+#
+import dicomtools
+import synthetic
+#
+def _get_volume_info(dicom_volume):
+	r'''
+	Get the volume info, reading the slices one at a time if the pixel data wasn't loaded.
+	'''
+	#
+	info = dict(dicom_volume.info)
+	if 'pixel_data' not in info:
+		info['pixel_data'] = np.dstack([dicom_volume.get_slice(x) for x in range(dicom_volume.get_shape()[2])])
+	#
+	return info
+#
+def _read_bytes(filename):
+	with open(filename, 'rb') as f:
+		return f.read()
+	#
+#
+def _read_zip_archive(filenames):
+	archive_data = io.BytesIO()
+	with zipfile.ZipFile(archive_data, 'w') as archive:
+		for filename in filenames:
+			archive.write(filename, os.path.basename(filename))
+		#
+	#
+	archive_data.seek(0)
+	(series,) = dicomtools.dicom_read.read_dicom_archive(archive_data)
+	return _get_volume_info(dicomtools.volume.DicomVolume(series))
+#
+def _build_incrementally(filenames):
+	builder = dicomtools.volume.IncrementalVolumeBuilder()
+	for filename in filenames:
+		builder.add_instance(dicomtools.dicom_read._read_file(filename))
+	#
+	return _get_volume_info(builder.build_volume())
+#
+def _read_chunked(filenames):
+	directory = tempfile.mkdtemp()
+	try:
+		dicom_volume = dicomtools.volume.DicomVolume(dicomtools.dicom_read.read_dicom_series(filenames), load_pixel_data=False)
+		dicomtools.chunked.write_chunked_volume(dicom_volume, os.path.join(directory, 'volume'), chunk_shape=(16, 16, 16))
+		chunked_volume = dicomtools.chunked.ChunkedVolume(os.path.join(directory, 'volume'), pixel_cache=dicomtools.cache.PixelCache(0))
+		#
+		info = dict(chunked_volume.info)
+		info['pixel_data'] = chunked_volume.read_region((0, 0, 0), chunked_volume.get_shape())
+		return info
+	finally:
+		shutil.rmtree(directory)
+	#
+#
+def _read_asynchronously(filenames):
+	import asyncio
+	import dicomtools.aio
+	#
+	loop = asyncio.new_event_loop()
+	try:
+		return _get_volume_info(loop.run_until_complete(dicomtools.aio.read_dicom_volume(filenames)))
+	finally:
+		loop.close()
+	#
+#
+def read_reference(filenames):
+	r'''
+	The reference implementation.
+	'''
+	#
+	return dicomtools.volume.DicomVolume(dicomtools.dicom_read.read_dicom_series(filenames)).info
+#
+MODES = [
+	('lazy', lambda x: _get_volume_info(dicomtools.volume.DicomVolume(dicomtools.dicom_read.read_dicom_series(x), load_pixel_data=False, pixel_cache=dicomtools.cache.PixelCache(0)))),
+	('compact', lambda x: _get_volume_info(dicomtools.volume.DicomVolume(dicomtools.dicom_read.read_compact_dicom_series(x)))),
+	('compact_lazy', lambda x: _get_volume_info(dicomtools.volume.DicomVolume(dicomtools.dicom_read.read_compact_dicom_series(x), load_pixel_data=False))),
+	('region', lambda x: _get_volume_info(dicomtools.volume.DicomVolume(dicomtools.dicom_read.read_dicom_series(x), region=((0, 0, 0), (1 << 30,)*3)))),
+	('bytes', lambda x: _get_volume_info(dicomtools.volume.DicomVolume(dicomtools.dicom_read.read_dicom_series([_read_bytes(y) for y in x])))),
+	('zip_archive', _read_zip_archive),
+	('incremental', _build_incrementally),
+	('dataset', lambda x: dicomtools.dataset.VolumeDataset([x])[0]),
+	('chunked', _read_chunked),
+]
+if sys.version_info >= (3, 7):
+	MODES.append(('aio', _read_asynchronously))
+#
+def _sorted_by_position(datasets):
+	# without instance numbers the files are expected in the order of their positions
+	return sorted(datasets, key=lambda x: float(np.dot(x.ImagePositionPatient, np.cross(x.ImageOrientationPatient[0:3], x.ImageOrientationPatient[3:6]))))
+#
+_OBLIQUE = {'row_vec': (np.sqrt(0.5), np.sqrt(0.5), 0), 'col_vec': (0, 0, -1)}
+#
+VARIANTS = [
+	('single_frame', False, lambda x: synthetic.make_single_frame_series(x)),
+	('single_frame_oblique', False, lambda x: synthetic.make_single_frame_series(x, **_OBLIQUE)),
+	('single_frame_rescaled', False, lambda x: synthetic.make_single_frame_series(x, slope=0.5, intercept=-20.25)),
+	('single_frame_without_instance_numbers', False, lambda x: _sorted_by_position(synthetic.make_single_frame_series(x, instance_numbers=False))),
+	('single_frame_compressed', False, lambda x: [synthetic.compress_dataset(y) for y in synthetic.make_single_frame_series(x)]),
+	('multi_frame', True, lambda x: [synthetic.make_multiframe_instance(x)]),
+	('multi_frame_oblique_rescaled', True, lambda x: [synthetic.make_multiframe_instance(x, slope=2.0, intercept=-1000.0, **_OBLIQUE)]),
+	('multi_frame_compressed', True, lambda x: [synthetic.compress_dataset(synthetic.make_multiframe_instance(x))]),
+]
+# (name, is multi-frame, function to build the datasets from the volume data)
+#
+_SINGLE_FRAME_MODES = ['incremental']
+#
+def compare_info(reference, info):
+	r'''
+	Get the keys of the volume info (including ``'pixel_data'``) which are not exactly
+	equal to the reference.
+	'''
+	#
+	differences = []
+	for key in sorted(set(reference) | set(info)):
+		if key not in reference or key not in info:
+			differences.append(key)
+		elif isinstance(reference[key], np.ndarray) or isinstance(info[key], np.ndarray):
+			if np.shape(reference[key]) != np.shape(info[key]) or not np.array_equal(reference[key], info[key]):
+				differences.append(key)
+			#
+		elif reference[key] != info[key]:
+			differences.append(key)
+		#
+	#
+	return differences
+#
+def _time(function, filenames, repeat):
+	times = []
+	for x in range(repeat):
+		start = timeit.default_timer()
+		result = function(filenames)
+		times.append(timeit.default_timer()-start)
+	#
+	return (result, min(times))
+#
+def check_modes(filenames, is_multiframe, repeat=1):
+	r'''
+	Run the reference and every mode on the files, and return a list of results, each a
+	dictionary with the ``'mode'``, the fastest time in ``'seconds'``, and the
+	``'differences'`` from the reference (see :meth:`compare_info`).
+	'''
+	#
+	(reference, seconds) = _time(read_reference, filenames, repeat)
+	results = [{'mode': 'reference', 'seconds': seconds, 'differences': []}]
+	#
+	for (mode, function) in MODES:
+		if is_multiframe and mode in _SINGLE_FRAME_MODES:
+			continue
+		#
+		(info, seconds) = _time(function, filenames, repeat)
+		info.pop('image_to_patient', None)
+		info.pop('uid', None)
+		# the extra keys of a dataset sample
+		results.append({'mode': mode, 'seconds': seconds, 'differences': compare_info(reference, info)})
+	#
+	return results
+#
+def check_variants(shape=(24, 20, 10), variants=None, repeat=1):
+	r'''
+	Write each of the series ``variants`` (by name, all of them by default) to files and
+	check every mode on them. Returns a dictionary of the :meth:`check_modes` results keyed
+	by variant. Variants which can't be built with the installed pydicom (compressed pixel
+	data) are left out.
+	'''
+	#
+	data = synthetic.make_volume_data(shape)
+	results = {}
+	for (name, is_multiframe, build) in VARIANTS:
+		if variants is not None and name not in variants:
+			continue
+		#
+		try:
+			datasets = build(data)
+		except NotImplementedError:
+			continue
+		#
+		directory = tempfile.mkdtemp()
+		try:
+			filenames = synthetic.write_series(datasets, directory)
+			results[name] = check_modes(filenames, is_multiframe, repeat)
+		finally:
+			shutil.rmtree(directory)
+		#
+	#
+	return results
+#
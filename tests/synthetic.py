@@ -0,0 +1,165 @@
+import numpy as np
+import os
+import dicom
+import dicom.UID
+from dicom.dataset import Dataset, FileDataset
+#
+# Helpers for building small synthetic DICOM series in memory, so that the tests do not
+# depend on any external data.
+#
+CT_IMAGE_STORAGE = '1.2.840.10008.5.1.4.1.1.2'
+ENHANCED_CT_IMAGE_STORAGE = '1.2.840.10008.5.1.4.1.1.2.1'
+#
+def _new_image_dataset(series_uid, rows, columns, sop_class_uid=CT_IMAGE_STORAGE):
+	ds = Dataset()
+	ds.file_meta = Dataset()
+	ds.file_meta.TransferSyntaxUID = dicom.UID.ExplicitVRLittleEndian
+	ds.file_meta.MediaStorageSOPClassUID = sop_class_uid
+	ds.file_meta.ImplementationClassUID = '1.2.3.4.5'
+	ds.SOPClassUID = sop_class_uid
+	ds.is_little_endian = True
+	ds.is_implicit_VR = False
+	#
+	ds.SeriesInstanceUID = series_uid
+	ds.SeriesDescription = 'synthetic'
+	ds.PatientPosition = 'HFS'
+	ds.Rows = rows
+	ds.Columns = columns
+	ds.SamplesPerPixel = 1
+	ds.PhotometricInterpretation = 'MONOCHROME2'
+	ds.BitsAllocated = 16
+	ds.BitsStored = 16
+	ds.HighBit = 15
+	ds.PixelRepresentation = 0
+	return ds
+#
+def make_volume_data(shape, seed=0):
+	r'''
+	Build a 3D array of stored pixel values with the given (columns, rows, slices) shape,
+	which is the same axis order as ``DicomVolume.info['pixel_data']``.
+	'''
+	#
+	return np.random.RandomState(seed).randint(0, 4096, size=shape).astype(np.uint16)
+#
+def make_single_frame_series(volume_data, pixel_spacing=(0.8, 0.8), slice_spacing=1.5, position=(-100.0, -120.0, 50.0), row_vec=(1, 0, 0), col_vec=(0, 1, 0), slope=1.0, intercept=-1024.0, series_uid='1.2.3.4', instance_numbers=True):
+	r'''
+	Build a list of single-frame datasets, one for each slice of ``volume_data``. The slices
+	are returned in a shuffled order.
+	'''
+	#
+	row_vec = np.asarray(row_vec, dtype=np.double)
+	col_vec = np.asarray(col_vec, dtype=np.double)
+	slice_vec = np.cross(row_vec, col_vec)
+	#
+	datasets = []
+	for x in range(volume_data.shape[2]):
+		ds = _new_image_dataset(series_uid, volume_data.shape[1], volume_data.shape[0])
+		ds.SOPInstanceUID = '{}.{}'.format(series_uid, x+1)
+		ds.file_meta.MediaStorageSOPInstanceUID = ds.SOPInstanceUID
+		if instance_numbers:
+			ds.InstanceNumber = x+1
+		ds.PixelSpacing = list(pixel_spacing)
+		ds.SliceThickness = slice_spacing
+		ds.ImagePositionPatient = list(np.asarray(position) + x*slice_spacing*slice_vec)
+		ds.ImageOrientationPatient = list(row_vec) + list(col_vec)
+		ds.RescaleSlope = slope
+		ds.RescaleIntercept = intercept
+		ds.PixelData = np.ascontiguousarray(volume_data[:,:,x].T).tobytes()
+		datasets.append(ds)
+	#
+	np.random.RandomState(len(datasets)).shuffle(datasets)
+	return datasets
+#
+def make_multiframe_instance(volume_data, pixel_spacing=(0.8, 0.8), slice_spacing=1.5, position=(-100.0, -120.0, 50.0), row_vec=(1, 0, 0), col_vec=(0, 1, 0), slope=1.0, intercept=-1024.0, series_uid='1.2.3.4'):
+	r'''
+	Build a single enhanced multi-frame dataset containing every slice of ``volume_data``.
+	'''
+	#
+	row_vec = np.asarray(row_vec, dtype=np.double)
+	col_vec = np.asarray(col_vec, dtype=np.double)
+	slice_vec = np.cross(row_vec, col_vec)
+	#
+	ds = _new_image_dataset(series_uid, volume_data.shape[1], volume_data.shape[0], ENHANCED_CT_IMAGE_STORAGE)
+	ds.SOPInstanceUID = '{}.1'.format(series_uid)
+	ds.file_meta.MediaStorageSOPInstanceUID = ds.SOPInstanceUID
+	ds.InstanceNumber = 1
+	ds.NumberOfFrames = volume_data.shape[2]
+	#
+	frames = []
+	for x in range(volume_data.shape[2]):
+		measures = Dataset()
+		measures.PixelSpacing = list(pixel_spacing)
+		measures.SliceThickness = slice_spacing
+		plane_position = Dataset()
+		plane_position.ImagePositionPatient = list(np.asarray(position) + x*slice_spacing*slice_vec)
+		plane_orientation = Dataset()
+		plane_orientation.ImageOrientationPatient = list(row_vec) + list(col_vec)
+		value_transformation = Dataset()
+		value_transformation.RescaleSlope = slope
+		value_transformation.RescaleIntercept = intercept
+		#
+		frame = Dataset()
+		frame.PixelMeasuresSequence = [measures]
+		frame.PlanePositionSequence = [plane_position]
+		frame.PlaneOrientationSequence = [plane_orientation]
+		frame.PixelValueTransformationSequence = [value_transformation]
+		frames.append(frame)
+	#
+	ds.PerFrameFunctionalGroupsSequence = frames
+	ds.PatientPosition = 'HFS'
+	ds.PixelData = np.ascontiguousarray(np.transpose(volume_data, (2, 1, 0))).tobytes()
+	return ds
+#
+def make_temporal_series(volume_data, trigger_times, series_uid='1.2.3.4', **kwargs):
+	r'''
+	Build a list of single-frame datasets for a 4D series, where ``volume_data`` has a
+	(columns, rows, slices, phases) shape and each phase is acquired at the corresponding
+	``trigger_times`` value. The instances are numbered through each phase in turn, and
+	are returned in a shuffled order. Any keyword arguments are passed to
+	:meth:`make_single_frame_series`.
+	'''
+	#
+	datasets = []
+	for (t, trigger_time) in enumerate(trigger_times):
+		phase = make_single_frame_series(volume_data[:,:,:,t], series_uid=series_uid, **kwargs)
+		for ds in phase:
+			ds.InstanceNumber += t*volume_data.shape[2]
+			ds.SOPInstanceUID = '{}.{}'.format(series_uid, ds.InstanceNumber)
+			ds.file_meta.MediaStorageSOPInstanceUID = ds.SOPInstanceUID
+			ds.TriggerTime = trigger_time
+			ds.TemporalPositionIdentifier = t+1
+		#
+		datasets += phase
+	#
+	np.random.RandomState(len(datasets)).shuffle(datasets)
+	return datasets
+#
+def compress_dataset(ds):
+	r'''
+	Compress the pixel data of the dataset (in-place) with the RLE Lossless transfer
+	syntax. This needs a version of pydicom which can encode pixel data, and raises
+	NotImplementedError otherwise.
+	'''
+	#
+	if not hasattr(ds, 'compress') or not hasattr(dicom.UID, 'RLELossless'):
+		raise NotImplementedError('This version of pydicom cannot compress pixel data.')
+	#
+	ds.compress(dicom.UID.RLELossless)
+	return ds
+#
+def write_series(datasets, directory, filename_prefix='im'):
+	r'''
+	Save each dataset to a file in the directory, and return the list of filenames.
+	'''
+	#
+	filenames = []
+	for x in range(len(datasets)):
+		filename = os.path.join(directory, '{}_{:05d}.dcm'.format(filename_prefix, x))
+		file_dataset = FileDataset(filename, datasets[x], file_meta=datasets[x].file_meta, preamble=b'\0'*128)
+		file_dataset.is_little_endian = True
+		file_dataset.is_implicit_VR = False
+		file_dataset.save_as(filename)
+		filenames.append(filename)
+	#
+	return filenames
+#
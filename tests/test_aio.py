@@ -0,0 +1,46 @@
+import unittest
+import shutil
+import sys
+import tempfile
+#
+import dicomtools
+import synthetic
+#
+import numpy as np
+#
+@unittest.skipIf(sys.version_info < (3, 7), 'dicomtools.aio requires python 3.7')
+class TestAio(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+	#
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+	#
+	def test_read_volumes_concurrently(self):
+		import asyncio
+		import dicomtools.aio
+		#
+		data = synthetic.make_volume_data((8, 6, 5))
+		filename_lists = [synthetic.write_series(synthetic.make_single_frame_series(data, series_uid='1.2.{}'.format(x)), self.directory, 'series{}'.format(x)) for x in range(3)]
+		#
+		loop = asyncio.new_event_loop()
+		asyncio.set_event_loop(loop)
+		# this file must also be importable by python 2, so 'async def' can't be used here
+		try:
+			semaphore = asyncio.Semaphore(2)
+			tasks = [loop.create_task(dicomtools.aio.read_dicom_volume(x, semaphore)) for x in filename_lists]
+			volumes = loop.run_until_complete(asyncio.gather(*tasks))
+		finally:
+			asyncio.set_event_loop(None)
+			loop.close()
+		#
+		#
+		self.assertEqual([x._dicom_series.uid for x in volumes], ['1.2.0', '1.2.1', '1.2.2'])
+		for volume in volumes:
+			np.testing.assert_allclose(volume.info['pixel_data'], data-1024.0)
+		#
+	#
+#
+if __name__ == '__main__':
+	unittest.main()
+#
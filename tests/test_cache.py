@@ -0,0 +1,66 @@
+import unittest
+#
+import dicomtools
+import synthetic
+#
+import numpy as np
+#
+class TestPixelCache(unittest.TestCase):
+	def test_lru_eviction(self):
+		cache = dicomtools.cache.PixelCache(3*80)
+		# room for three arrays of 10 doubles
+		for x in range(3):
+			cache.get(x, lambda: np.zeros(10)+x)
+		#
+		cache.get(0, lambda: None)
+		# 0 is now the most recently used, so 1 should be evicted next
+		cache.get(3, lambda: np.zeros(10)+3)
+		#
+		stats = cache.get_stats()
+		self.assertEqual(stats['current_bytes'], 240)
+		self.assertEqual(stats['evictions'], 1)
+		self.assertEqual(stats['hits'], 1)
+		np.testing.assert_array_equal(cache.get(1, lambda: np.zeros(10)-1), -1)
+		# 1 had to be loaded again
+	#
+	def test_disabled_cache(self):
+		cache = dicomtools.cache.PixelCache(0)
+		cache.get(0, lambda: np.zeros(10))
+		self.assertEqual(cache.get_stats()['num_of_arrays'], 0)
+	#
+	def test_volume_slices(self):
+		data = synthetic.make_volume_data((8, 6, 4))
+		series = dicomtools.series.DicomSeries(synthetic.make_single_frame_series(data))
+		cache = dicomtools.cache.PixelCache(2*8*6*2)
+		# room for two slices of stored uint16 values
+		volume = dicomtools.volume.DicomVolume(series, load_pixel_data=False, pixel_cache=cache)
+		#
+		for x in [0, 1, 0, 2, 3]:
+			np.testing.assert_allclose(volume.get_slice(x), data[:,:,x]-1024.0)
+		#
+		stats = cache.get_stats()
+		self.assertEqual(stats['hits'], 1)
+		self.assertEqual(stats['misses'], 4)
+		self.assertEqual(stats['num_of_arrays'], 2)
+		self.assertFalse(any(dicomtools.series._is_pixel_array_cached(x) for x in series.instances))
+		# the decoded pixel data should only be kept by the cache
+	#
+	def test_multiframe_volume_slices(self):
+		data = synthetic.make_volume_data((8, 6, 4))
+		series = dicomtools.series.DicomSeries([synthetic.make_multiframe_instance(data)])
+		#
+		for max_bytes in [0, 2*8*6*2]:
+			cache = dicomtools.cache.PixelCache(max_bytes)
+			volume = dicomtools.volume.DicomVolume(series, load_pixel_data=False, pixel_cache=cache)
+			for x in [0, 1, 0, 2, 3]:
+				np.testing.assert_allclose(volume.get_slice(x), data[:,:,x]-1024.0)
+			#
+			self.assertLessEqual(cache.get_stats()['current_bytes'], max_bytes)
+			self.assertFalse(dicomtools.series._is_pixel_array_cached(series.instances[0]))
+			# the frames outside of the cache aren't kept by the instance
+		#
+	#
+#
+if __name__ == '__main__':
+	unittest.main()
+#
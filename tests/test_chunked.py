@@ -0,0 +1,64 @@
+import unittest
+import os
+import shutil
+import tempfile
+#
+import dicomtools
+import synthetic
+#
+import numpy as np
+#
+class TestChunkedVolume(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.data = synthetic.make_volume_data((40, 30, 20))
+		series = dicomtools.series.DicomSeries(synthetic.make_single_frame_series(self.data))
+		self.volume = dicomtools.volume.DicomVolume(series, load_pixel_data=False)
+		self.pixel_data = self.data.astype(np.double)-1024.0
+	#
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+	#
+	def test_region_reads(self):
+		for compression in [None, 'zlib']:
+			directory = os.path.join(self.directory, str(compression))
+			dicomtools.chunked.write_chunked_volume(self.volume, directory, chunk_shape=(16, 16, 16), compression=compression, dtype=np.int16)
+			#
+			pixel_cache = dicomtools.cache.PixelCache(1024*1024)
+			chunked_volume = dicomtools.chunked.ChunkedVolume(directory, pixel_cache=pixel_cache)
+			self.assertEqual(chunked_volume.get_shape(), (40, 30, 20))
+			self.assertEqual(len(os.listdir(os.path.join(directory, 'chunks'))), 3*2*2)
+			#
+			np.testing.assert_array_equal(chunked_volume.read_region((10, 5, 3), (35, 17, 18)), self.pixel_data[10:35, 5:17, 3:18])
+			self.assertEqual(pixel_cache.get_stats()['misses'], 3*2*2)
+			np.testing.assert_array_equal(chunked_volume.read_region((0, 0, 0), (5, 5, 5)), self.pixel_data[0:5, 0:5, 0:5])
+			self.assertEqual(pixel_cache.get_stats()['misses'], 3*2*2)
+			# the chunk was already cached
+			#
+			np.testing.assert_array_equal(chunked_volume.get_slice(33, axis=0), self.pixel_data[33])
+			np.testing.assert_array_equal(chunked_volume.get_slice(7, axis=1), self.pixel_data[:, 7])
+			np.testing.assert_array_equal(chunked_volume.get_slice(19), self.pixel_data[:, :, 19])
+			#
+			np.testing.assert_allclose(chunked_volume.build_image_to_patient_matrix(), self.volume.build_image_to_patient_matrix())
+			self.assertEqual(chunked_volume.info['patient_orientation'], 'HFS')
+		#
+	#
+	def test_slice_index(self):
+		directory = os.path.join(self.directory, 'volume')
+		dicomtools.chunked.write_chunked_volume(self.volume, directory, chunk_shape=(16, 16, 16))
+		chunked_volume = dicomtools.chunked.ChunkedVolume(directory)
+		#
+		np.testing.assert_array_equal(chunked_volume.get_slice(-1), self.pixel_data[:, :, 19])
+		np.testing.assert_array_equal(chunked_volume.get_slice(-40, axis=0), self.pixel_data[0])
+		for (index, axis) in [(20, 2), (-21, 2), (30, 1), (40, 0)]:
+			self.assertRaises(IndexError, chunked_volume.get_slice, index, axis)
+		#
+	#
+	def test_lossy_dtype(self):
+		self.assertRaises(ValueError, dicomtools.chunked.write_chunked_volume, self.volume, os.path.join(self.directory, 'volume'), dtype=np.uint8)
+		self.assertEqual(os.listdir(self.directory), [])
+	#
+#
+if __name__ == '__main__':
+	unittest.main()
+#
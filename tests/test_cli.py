@@ -0,0 +1,49 @@
+import unittest
+import os
+import shutil
+import tempfile
+#
+import dicomtools
+import dicomtools.cli
+import synthetic
+#
+import numpy as np
+#
+class TestCli(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.input_directory = os.path.join(self.directory, 'input')
+		self.output_directory = os.path.join(self.directory, 'output')
+		os.makedirs(os.path.join(self.input_directory, 'a'))
+		os.makedirs(os.path.join(self.input_directory, 'b'))
+		#
+		self.data = synthetic.make_volume_data((8, 6, 4))
+		synthetic.write_series(synthetic.make_single_frame_series(self.data, series_uid='1.2.3'), os.path.join(self.input_directory, 'a'))
+		synthetic.write_series([synthetic.make_multiframe_instance(self.data, series_uid='1.2.4')], os.path.join(self.input_directory, 'b'))
+		with open(os.path.join(self.input_directory, 'notes.txt'), 'w') as f:
+			f.write('not a dicom file')
+		#
+	#
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+	#
+	def test_find_series(self):
+		series = dicomtools.cli.find_series([self.input_directory])
+		self.assertEqual(sorted(series), ['1.2.3', '1.2.4'])
+		self.assertEqual(len(series['1.2.3']), 4)
+	#
+	def test_convert_and_resume(self):
+		self.assertEqual(dicomtools.cli.main([self.input_directory, '-o', self.output_directory, '-j', '1', '-q']), 0)
+		#
+		for uid in ['1.2.3', '1.2.4']:
+			pixel_data = np.load(os.path.join(self.output_directory, uid, 'pixel_data.npz'))['pixel_data']
+			np.testing.assert_allclose(pixel_data, self.data-1024.0)
+		#
+		series = dicomtools.cli.find_series([self.input_directory])
+		results = dicomtools.cli.convert_series(series, self.output_directory)
+		self.assertEqual([x[1] for x in results], ['skipped', 'skipped'])
+	#
+#
+if __name__ == '__main__':
+	unittest.main()
+#
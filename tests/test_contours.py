@@ -0,0 +1,57 @@
+import unittest
+#
+import dicomtools
+import synthetic
+#
+import numpy as np
+#
+class TestContours(unittest.TestCase):
+	def setUp(self):
+		self.data = synthetic.make_volume_data((20, 16, 6))
+		series = dicomtools.series.DicomSeries(synthetic.make_single_frame_series(self.data, row_vec=(0, 1, 0), col_vec=(1, 0, 0)))
+		self.volume = dicomtools.volume.DicomVolume(series, load_pixel_data=False)
+		self.img2pat = self.volume.build_image_to_patient_matrix()
+	#
+	def _to_patient(self, voxels, slice_index):
+		voxels = np.asarray(voxels, dtype=np.double)
+		return dicomtools.coordinates.transform_vectors(self.img2pat, np.column_stack([voxels, np.zeros(len(voxels))+slice_index]))
+	#
+	def test_square_with_hole(self):
+		square = self._to_patient([[2.5, 3.5], [8.5, 3.5], [8.5, 9.5], [2.5, 9.5]], 2)
+		hole = self._to_patient([[4.5, 5.5], [6.5, 5.5], [6.5, 7.5], [4.5, 7.5]], 2)
+		mask = dicomtools.contours.rasterize_contours(self.volume, [square.ravel(), hole])
+		#
+		expected = np.zeros(self.volume.get_shape(), dtype=bool)
+		expected[3:9, 4:10, 2] = True
+		expected[5:7, 6:8, 2] = False
+		np.testing.assert_array_equal(mask, expected)
+	#
+	def test_circle(self):
+		angles = np.linspace(0, 2*np.pi, 400, endpoint=False)
+		circle = np.column_stack([10.2+5*np.cos(angles), 8.3+5*np.sin(angles)])
+		mask = dicomtools.contours.rasterize_contours(self.volume, [self._to_patient(circle, 4)])
+		#
+		(i, j) = np.meshgrid(np.arange(20), np.arange(16), indexing='ij')
+		distance = np.hypot(i-10.2, j-8.3)
+		away_from_edge = np.abs(distance-5) > 0.01
+		np.testing.assert_array_equal(mask[:,:,4][away_from_edge], (distance < 5)[away_from_edge])
+		self.assertFalse(np.any(mask[:,:,[0, 1, 2, 3, 5]]))
+	#
+	def test_structures(self):
+		first = [self._to_patient([[0.5, 0.5], [5.5, 0.5], [5.5, 5.5], [0.5, 5.5]], x) for x in [1, 2]]
+		second = [self._to_patient([[3.5, 3.5], [9.5, 3.5], [9.5, 9.5]], 2), self._to_patient([[0, 0], [3, 0], [0, 3]], 10)]
+		# the last contour is outside of the volume
+		labels = dicomtools.contours.rasterize_structures(self.volume, [first, second])
+		#
+		self.assertEqual(np.count_nonzero(labels[:,:,1] == 1), 25)
+		self.assertEqual(labels[4, 4, 2], 2)
+		# the overlapping voxels get the later label
+		self.assertEqual(labels[1, 1, 2], 1)
+		self.assertEqual(np.count_nonzero(labels[:,:,2] == 2), np.count_nonzero(np.tril(np.ones((6, 6)))))
+		#
+		self.assertRaises(ValueError, dicomtools.contours.rasterize_contours, self.volume, [np.array([[0, 0, 50], [10, 0, 50], [10, 0, 55]])])
+	#
+#
+if __name__ == '__main__':
+	unittest.main()
+#
@@ -0,0 +1,66 @@
+import unittest
+import os
+import shutil
+import tempfile
+#
+import dicomtools
+import synthetic
+#
+import numpy as np
+#
+class TestVolumeDataset(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.cache_directory = os.path.join(self.directory, 'cache')
+		self.data = [synthetic.make_volume_data((8, 6, 4), seed=x) for x in range(3)]
+		self.series = {}
+		for x in range(3):
+			uid = '1.2.{}'.format(x)
+			self.series[uid] = synthetic.write_series(synthetic.make_single_frame_series(self.data[x], series_uid=uid, intercept=-1024.5), self.directory, 'series{}'.format(x))
+		#
+	#
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+	#
+	def _assert_samples(self, samples, indices):
+		self.assertEqual([x['uid'] for x in samples], ['1.2.{}'.format(x) for x in indices])
+		for (sample, x) in zip(samples, indices):
+			np.testing.assert_array_equal(sample['pixel_data'], self.data[x]-1024.5)
+			np.testing.assert_allclose(sample['position'], [-100, -120, 50])
+			np.testing.assert_allclose(sample['image_to_patient'][0:3, 0:3], np.diag([0.8, 0.8, 1.5]))
+		#
+	#
+	def test_prefetch_and_cache(self):
+		dataset = dicomtools.dataset.VolumeDataset(self.series, cache_directory=self.cache_directory)
+		self.assertEqual(len(dataset), 3)
+		self._assert_samples(list(dataset.iterate([2, 0, 1], workers=2, prefetch=1)), [2, 0, 1])
+		self.assertEqual(len(os.listdir(self.cache_directory)), 3)
+		#
+		for filenames in self.series.values():
+			for filename in filenames:
+				os.remove(filename)
+			#
+		#
+		self._assert_samples(list(dataset), [0, 1, 2])
+		# loaded from the cache
+		self.assertEqual(dataset[1]['pixel_data'].dtype, np.double)
+	#
+	def test_processes_and_dtype(self):
+		dataset = dicomtools.dataset.VolumeDataset(list(self.series[x] for x in sorted(self.series)), dtype=np.float32)
+		samples = list(dataset.iterate(workers=2, processes=True))
+		#
+		self.assertEqual(samples[0]['pixel_data'].dtype, np.float32)
+		for (sample, data) in zip(samples, self.data):
+			np.testing.assert_array_equal(sample['pixel_data'], data-1024.5)
+		#
+	#
+	def test_stop_early(self):
+		dataset = dicomtools.dataset.VolumeDataset(self.series)
+		iterator = dataset.iterate(workers=2)
+		self._assert_samples([next(iterator)], [0])
+		iterator.close()
+	#
+#
+if __name__ == '__main__':
+	unittest.main()
+#
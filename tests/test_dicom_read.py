@@ -0,0 +1,76 @@
+import unittest
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+#
+import dicomtools
+import synthetic
+#
+import numpy as np
+#
+class TestDicomRead(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.data = synthetic.make_volume_data((8, 6, 4))
+		self.filenames = synthetic.write_series(synthetic.make_single_frame_series(self.data), self.directory)
+		self.filenames += synthetic.write_series([synthetic.make_multiframe_instance(self.data, series_uid='1.2.3.5')], self.directory, filename_prefix='mf')
+	#
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+	#
+	def _read_bytes(self, filename):
+		with open(filename, 'rb') as f:
+			return f.read()
+		#
+	#
+	def _assert_volumes(self, series_list):
+		self.assertEqual(len(series_list), 2)
+		for series in series_list:
+			volume = dicomtools.volume.DicomVolume(series)
+			np.testing.assert_allclose(volume.info['pixel_data'], self.data-1024.0)
+		#
+	#
+	def test_bytes_and_file_objects(self):
+		single_frame_filenames = self.filenames[:4]
+		volume = dicomtools.volume.DicomVolume(dicomtools.dicom_read.read_dicom_series(single_frame_filenames))
+		#
+		with dicomtools.profiling.Profiler() as profiler:
+			from_bytes = dicomtools.volume.DicomVolume(dicomtools.dicom_read.read_dicom_series([self._read_bytes(x) for x in single_frame_filenames]))
+		#
+		from_file_objects = dicomtools.volume.DicomVolume(dicomtools.dicom_read.read_dicom_series([io.BytesIO(self._read_bytes(x)) for x in single_frame_filenames]))
+		#
+		for other in [from_bytes, from_file_objects]:
+			self.assertTrue(dicomtools.volume.compare_volume_metadata(volume, other))
+			np.testing.assert_array_equal(volume.info['pixel_data'], other.info['pixel_data'])
+		#
+		report = dict((x['stage'], x) for x in profiler.get_report())
+		bytes_read = report['dicom_read.read_file']['counts']['bytes_read']
+		self.assertEqual(bytes_read, sum(os.path.getsize(x) for x in single_frame_filenames))
+	#
+	def test_zip_archive(self):
+		archive_filename = os.path.join(self.directory, 'series.zip')
+		with zipfile.ZipFile(archive_filename, 'w') as archive:
+			for filename in self.filenames:
+				archive.write(filename, os.path.join('study', os.path.basename(filename)))
+			#
+			archive.writestr('README.txt', 'not a dicom file')
+		#
+		self._assert_volumes(dicomtools.dicom_read.read_dicom_archive(archive_filename))
+	#
+	def test_tar_stream(self):
+		archive_data = io.BytesIO()
+		with tarfile.open(fileobj=archive_data, mode='w:gz') as archive:
+			for filename in self.filenames:
+				archive.add(filename, os.path.basename(filename))
+			#
+		#
+		archive_data.seek(0)
+		self._assert_volumes(dicomtools.dicom_read.read_dicom_archive(archive_data))
+	#
+#
+if __name__ == '__main__':
+	unittest.main()
+#
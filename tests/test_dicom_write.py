@@ -0,0 +1,95 @@
+import unittest
+import shutil
+import tempfile
+#
+import dicomtools
+import synthetic
+#
+import numpy as np
+#
+class TestDicomWrite(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.data = synthetic.make_volume_data((12, 10, 6))
+		self.series = dicomtools.series.DicomSeries(synthetic.make_single_frame_series(self.data, row_vec=(0, 1, 0), col_vec=(1, 0, 0)))
+		self.volume = dicomtools.volume.DicomVolume(self.series)
+	#
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+	#
+	def _read_volume(self, filenames):
+		return dicomtools.volume.DicomVolume(dicomtools.dicom_read.read_dicom_series(filenames))
+	#
+	def test_single_frame_round_trip(self):
+		filenames = dicomtools.dicom_write.write_dicom_series(self.volume, self.directory, series_description='processed', workers=3)
+		volume = self._read_volume(filenames)
+		#
+		self.assertEqual(len(filenames), 6)
+		self.assertTrue(dicomtools.volume.compare_volume_metadata(volume, self.volume))
+		np.testing.assert_array_equal(volume.info['pixel_data'], self.volume.info['pixel_data'])
+		self.assertEqual(volume.description, 'processed')
+		self.assertNotEqual(volume._dicom_series.uid, self.series.uid)
+		self.assertEqual(self.series.instances[0].Rows, 10)
+		# the source instances are unchanged
+		self.assertEqual(volume.image_instances[0].SOPClassUID, synthetic.CT_IMAGE_STORAGE)
+		self.assertEqual(volume.image_instances[0].file_meta.ImplementationClassUID, dicomtools.dicom_write.IMPLEMENTATION_CLASS_UID)
+	#
+	def test_multiframe_region_round_trip(self):
+		region_volume = dicomtools.volume.DicomVolume(self.series, region=((2, 3, 1), (9, 8, 5)))
+		filenames = dicomtools.dicom_write.write_dicom_series(region_volume, self.directory, multiframe=True)
+		volume = self._read_volume(filenames)
+		#
+		self.assertEqual(len(filenames), 1)
+		self.assertTrue(dicomtools.volume.compare_volume_metadata(volume, region_volume))
+		np.testing.assert_array_equal(volume.info['pixel_data'], region_volume.info['pixel_data'])
+		#
+		instance = volume.image_instances[0]
+		self.assertEqual(instance.SOPClassUID, synthetic.ENHANCED_CT_IMAGE_STORAGE)
+		self.assertEqual(instance.file_meta.MediaStorageSOPClassUID, synthetic.ENHANCED_CT_IMAGE_STORAGE)
+		self.assertEqual(instance.file_meta.ImplementationClassUID, dicomtools.dicom_write.IMPLEMENTATION_CLASS_UID)
+		self.assertEqual(list(instance.SharedFunctionalGroupsSequence[0].CTImageFrameTypeSequence[0].FrameType), list(instance.ImageType))
+		self.assertEqual(len(instance.DimensionIndexSequence), 2)
+		self.assertEqual([list(x.FrameContentSequence[0].DimensionIndexValues) for x in instance.PerFrameFunctionalGroupsSequence], [[1, x] for x in range(1, 5)])
+		self.assertEqual(instance.PerFrameFunctionalGroupsSequence[0].PixelValueTransformationSequence[0].RescaleType, 'HU')
+		#
+		filenames = dicomtools.dicom_write.write_dicom_series(volume, self.directory, filename_prefix='SF')
+		self.assertEqual(dicomtools.dicom_read.read_dicom_series(filenames).instances[0].SOPClassUID, synthetic.CT_IMAGE_STORAGE)
+		# written as single-frame instances again
+	#
+	def test_derived_attributes(self):
+		for x in self.series.instances:
+			x.ImageType = ['ORIGINAL', 'PRIMARY', 'AXIAL']
+			x.WindowCenter = 40
+			x.WindowWidth = 400
+			x.PixelPaddingValue = -2000
+			x.SmallestImagePixelValue = 0
+			x.add_new(0x00091001, 'LO', 'private')
+		#
+		filenames = dicomtools.dicom_write.write_dicom_series(self.volume, self.directory)
+		instance = self._read_volume(filenames).image_instances[0]
+		#
+		self.assertEqual(list(instance.ImageType), ['DERIVED', 'SECONDARY'])
+		for keyword in ['WindowCenter', 'WindowWidth', 'PixelPaddingValue', 'SmallestImagePixelValue']:
+			self.assertNotIn(keyword, instance)
+		#
+		self.assertFalse(any(x.tag.is_private for x in instance))
+	#
+	def test_unsupported_multiframe_sop_class(self):
+		for x in self.series.instances:
+			x.SOPClassUID = '1.2.840.10008.5.1.4.1.1.7'
+		# Secondary Capture Image Storage
+		self.assertRaises(ValueError, dicomtools.dicom_write.write_dicom_series, self.volume, self.directory, multiframe=True)
+	#
+	def test_processed_pixel_data(self):
+		pixel_data = np.sqrt(self.volume.info['pixel_data']+1024.0)
+		filenames = dicomtools.dicom_write.write_dicom_series(self.volume, self.directory, pixel_data=pixel_data)
+		volume = self._read_volume(filenames)
+		#
+		slope = float(volume.image_instances[0].RescaleSlope)
+		self.assertLessEqual(np.max(np.abs(volume.info['pixel_data']-pixel_data)), slope/2+1e-9)
+		self.assertRaises(ValueError, dicomtools.dicom_write.write_dicom_series, self.volume, self.directory, pixel_data=pixel_data[:,:,0:2])
+	#
+#
+if __name__ == '__main__':
+	unittest.main()
+#
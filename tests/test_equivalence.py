@@ -0,0 +1,16 @@
+import unittest
+#
+import equivalence
+#
+class TestEquivalence(unittest.TestCase):
+	def test_modes_match_reference(self):
+		results = equivalence.check_variants()
+		self.assertIn('single_frame', results)
+		#
+		differences = ['{}/{}: {}'.format(x, y['mode'], ', '.join(y['differences'])) for x in sorted(results) for y in results[x] if len(y['differences']) > 0]
+		self.assertEqual(differences, [])
+	#
+#
+if __name__ == '__main__':
+	unittest.main()
+#
@@ -0,0 +1,35 @@
+import unittest
+#
+import dicomtools
+import synthetic
+#
+import numpy as np
+#
+class TestExport(unittest.TestCase):
+	def setUp(self):
+		self.data = synthetic.make_volume_data((6, 4, 5))
+		series = dicomtools.series.DicomSeries(synthetic.make_single_frame_series(self.data))
+		self.volume = dicomtools.volume.DicomVolume(series)
+	#
+	def test_build_montage(self):
+		window = (1024, 2048)
+		# covers the values 0 to 2048 (stored values 1024 to 3072), so values from 2048 up are white
+		montage = dicomtools.export.build_montage(self.volume, slice_indices=[0, 2, 4], columns=2, window=window)
+		#
+		self.assertEqual(montage.shape, (12, 8))
+		self.assertEqual(montage.dtype, np.uint8)
+		#
+		expected = np.clip((self.data.astype(np.double)-1024.0)*255.0/2048, 0, 255).astype(np.uint8)
+		np.testing.assert_array_equal(montage[0:6, 0:4], expected[:,:,0])
+		np.testing.assert_array_equal(montage[0:6, 4:8], expected[:,:,2])
+		np.testing.assert_array_equal(montage[6:12, 0:4], expected[:,:,4])
+		np.testing.assert_array_equal(montage[6:12, 4:8], 0)
+	#
+	def test_build_montage_even_spacing(self):
+		montage = dicomtools.export.build_montage(self.volume, num_of_slices=3, axis=0)
+		self.assertEqual(montage.shape, (8, 10))
+	#
+#
+if __name__ == '__main__':
+	unittest.main()
+#
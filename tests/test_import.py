@@ -0,0 +1,16 @@
+import unittest
+import os
+import subprocess
+import sys
+#
+class TestImport(unittest.TestCase):
+	def test_import_does_not_load_matplotlib(self):
+		# this needs a new interpreter, since other tests may have already imported matplotlib
+		code = 'import sys, dicomtools; sys.exit(1 if "matplotlib" in sys.modules else 0)'
+		package_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+		self.assertEqual(subprocess.call([sys.executable, '-c', code], cwd=package_directory), 0)
+	#
+#
+if __name__ == '__main__':
+	unittest.main()
+#
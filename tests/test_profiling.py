@@ -0,0 +1,56 @@
+import unittest
+import json
+import shutil
+import tempfile
+#
+import dicomtools
+import synthetic
+#
+class TestProfiling(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		data = synthetic.make_volume_data((8, 6, 5))
+		self.filenames = synthetic.write_series(synthetic.make_single_frame_series(data), self.directory)
+	#
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+	#
+	def test_profile_volume_loading(self):
+		with dicomtools.profiling.Profiler() as profiler:
+			series = dicomtools.dicom_read.read_dicom_series(self.filenames)
+			dicomtools.volume.DicomVolume(series)
+		#
+		report = dict((x['stage'], x) for x in profiler.get_report())
+		#
+		self.assertEqual(report['dicom_read.read_file']['calls'], 5)
+		self.assertGreater(report['dicom_read.read_file']['counts']['bytes_read'], 5*8*6*2)
+		self.assertEqual(report['DicomSeries.decode_pixels']['counts']['slices_decoded'], 5)
+		self.assertEqual(report['DicomVolume._validate_volume']['calls'], 1)
+		self.assertEqual(report['DicomVolume._build_volume']['calls'], 1)
+		self.assertEqual(json.loads(profiler.to_json()), profiler.get_report())
+	#
+	def test_inactive_profiler(self):
+		with dicomtools.profiling.Profiler() as profiler:
+			pass
+		#
+		dicomtools.dicom_read.read_dicom_series(self.filenames)
+		self.assertEqual(profiler.get_report(), [])
+		self.assertFalse(dicomtools.profiling.is_active())
+	#
+	@unittest.skipUnless(hasattr(dicomtools.profiling.tracemalloc, 'reset_peak'), 'tracemalloc.reset_peak requires python 3.9')
+	def test_track_memory(self):
+		series = dicomtools.dicom_read.read_dicom_series(self.filenames)
+		with dicomtools.profiling.Profiler(track_memory=True) as profiler:
+			volume = dicomtools.volume.DicomVolume(series)
+		#
+		report = dict((x['stage'], x) for x in profiler.get_report())
+		#
+		self.assertGreaterEqual(report['DicomVolume._build_volume']['peak_bytes'], volume.info['pixel_data'].nbytes)
+		self.assertGreaterEqual(report['DicomVolume._build_volume']['peak_bytes'], report['DicomVolume.decode_pixels']['peak_bytes'])
+		# the peak of a stage includes the peaks of the stages within it
+		self.assertFalse(dicomtools.profiling.tracemalloc.is_tracing())
+	#
+#
+if __name__ == '__main__':
+	unittest.main()
+#
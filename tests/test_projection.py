@@ -0,0 +1,47 @@
+import unittest
+#
+import dicomtools
+import synthetic
+#
+import numpy as np
+#
+class TestProjection(unittest.TestCase):
+	def setUp(self):
+		stored_data = synthetic.make_volume_data((12, 10, 9))
+		self.series = dicomtools.series.DicomSeries(synthetic.make_single_frame_series(stored_data))
+		self.data = stored_data-1024.0
+	#
+	def test_project_volume_along_slices(self):
+		for mode in ['max', 'min', 'mean']:
+			for workers in [1, 3]:
+				result = dicomtools.projection.project_volume(self.series, mode, axis=2, workers=workers)
+				np.testing.assert_allclose(result, getattr(np, mode)(self.data, axis=2))
+			#
+		#
+	#
+	def test_project_volume_across_slices(self):
+		for axis in [0, 1]:
+			result = dicomtools.projection.project_volume(self.series, 'max', axis=axis, workers=2)
+			np.testing.assert_allclose(result, np.max(self.data, axis=axis))
+		#
+	#
+	def test_project_loaded_volume(self):
+		volume = dicomtools.volume.DicomVolume(self.series)
+		result = dicomtools.projection.project_volume(volume, 'mean')
+		np.testing.assert_allclose(result, np.mean(self.data, axis=2))
+		np.testing.assert_allclose(volume.info['pixel_data'], self.data)
+		# the volume should not be modified
+	#
+	def test_project_slabs(self):
+		# the slice spacing is 1.5 mm, so each slab has 2 slices and a new slab starts every 3 slices
+		result = dicomtools.projection.project_slabs(self.series, 3.0, slab_spacing=4.5, mode='max', workers=2)
+		#
+		self.assertEqual(result.shape, (12, 10, 3))
+		for x in range(3):
+			np.testing.assert_allclose(result[:,:,x], np.max(self.data[:,:,3*x:3*x+2], axis=2))
+		#
+	#
+#
+if __name__ == '__main__':
+	unittest.main()
+#
@@ -0,0 +1,68 @@
+import unittest
+import shutil
+import tempfile
+#
+import dicomtools
+import synthetic
+#
+import numpy as np
+#
+class TestCompactSeries(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.data = synthetic.make_volume_data((10, 8, 5))
+	#
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+	#
+	def _assert_volumes_equal(self, filenames):
+		volume = dicomtools.volume.DicomVolume(dicomtools.dicom_read.read_dicom_series(filenames))
+		compact_volume = dicomtools.volume.DicomVolume(dicomtools.dicom_read.read_compact_dicom_series(filenames))
+		#
+		self.assertTrue(dicomtools.volume.compare_volume_metadata(volume, compact_volume))
+		np.testing.assert_array_equal(volume.info['pixel_data'], compact_volume.info['pixel_data'])
+	#
+	def test_single_frame_volume(self):
+		filenames = synthetic.write_series(synthetic.make_single_frame_series(self.data), self.directory)
+		self._assert_volumes_equal(filenames)
+	#
+	def test_multi_frame_volume(self):
+		filenames = synthetic.write_series([synthetic.make_multiframe_instance(self.data)], self.directory)
+		self._assert_volumes_equal(filenames)
+	#
+	def test_region(self):
+		region = ((2, 3, 1), (7, 6, 4))
+		for datasets in [synthetic.make_single_frame_series(self.data), [synthetic.make_multiframe_instance(self.data)]]:
+			filenames = synthetic.write_series(datasets, self.directory)
+			volume = dicomtools.volume.DicomVolume(dicomtools.dicom_read.read_compact_dicom_series(filenames), region=region)
+			np.testing.assert_allclose(volume.info['pixel_data'], self.data[2:7, 3:6, 1:4]-1024.0)
+		#
+		self.assertEqual(dicomtools.dicom_read.read_compact_dicom_series(filenames).instances[0].read_frames(1, 3, (3, 6)).shape, (2, 3, 10))
+		# only the rows in the region are read
+	#
+	def test_compact_instances(self):
+		filenames = synthetic.write_series(synthetic.make_single_frame_series(self.data, instance_numbers=False), self.directory)
+		series = dicomtools.dicom_read.read_compact_dicom_series(filenames)
+		#
+		self.assertEqual(len(series.get_instances_with_image_data()), 5)
+		self.assertFalse(hasattr(series.instances[0], 'InstanceNumber'))
+		self.assertFalse(hasattr(series.instances[0], '__dict__'))
+		self.assertIs(series.instances[0].ImageOrientationPatient, series.instances[1].ImageOrientationPatient)
+		# equal values are shared between the instances
+		self.assertEqual(series.instances[0].pixel_array.shape, (8, 10))
+		np.testing.assert_array_equal(series.instances[0].read_frames(0, 1)[0], series.instances[0].pixel_array)
+	#
+	def test_compact_volume_decodes_each_slice_once(self):
+		filenames = synthetic.write_series(synthetic.make_single_frame_series(self.data), self.directory)
+		series = dicomtools.dicom_read.read_compact_dicom_series(filenames)
+		#
+		with dicomtools.profiling.Profiler() as profiler:
+			dicomtools.volume.DicomVolume(series)
+		report = dict((x['stage'], x) for x in profiler.get_report())
+		# the image shapes are taken from the image attributes, rather than decoding the images
+		self.assertEqual(report['DicomVolume.decode_pixels']['counts']['slices_decoded'], 5)
+	#
+#
+if __name__ == '__main__':
+	unittest.main()
+#
@@ -0,0 +1,47 @@
+import unittest
+#
+import dicomtools
+import synthetic
+#
+import numpy as np
+#
+class TestStatistics(unittest.TestCase):
+	def setUp(self):
+		self.data = synthetic.make_volume_data((12, 10, 9))
+		self.values = self.data.astype(np.double)-1024.0
+	#
+	def test_series_statistics(self):
+		series = dicomtools.series.DicomSeries(synthetic.make_single_frame_series(self.data))
+		statistics = dicomtools.statistics.compute_statistics(series, workers=3)
+		#
+		self.assertEqual(statistics.count, self.values.size)
+		self.assertEqual(statistics.min, self.values.min())
+		self.assertEqual(statistics.max, self.values.max())
+		self.assertAlmostEqual(statistics.get_mean(), self.values.mean())
+		self.assertAlmostEqual(statistics.get_std(), self.values.std())
+		for x in [1, 25, 50, 99, 100]:
+			self.assertEqual(statistics.get_percentile(x), np.percentile(self.values, x, method='inverted_cdf'))
+		#
+		(counts, bin_edges) = np.histogram(self.values, bins=statistics.get_bin_edges())
+		np.testing.assert_array_equal(statistics.counts, counts)
+	#
+	def test_merge_and_out_of_range_values(self):
+		low = dicomtools.statistics.VolumeStatistics(low=0, high=100, bin_width=10)
+		low.update([-50, 4, 5, 14])
+		high = dicomtools.statistics.VolumeStatistics(low=0, high=100, bin_width=10)
+		high.update([96, 200])
+		#
+		statistics = low.merge(high)
+		self.assertEqual((statistics.underflow, statistics.overflow), (1, 1))
+		self.assertEqual(list(statistics.counts), [1, 2, 0, 0, 0, 0, 0, 0, 0, 0, 1])
+		self.assertEqual(statistics.get_percentile(0), -50)
+		self.assertEqual(statistics.get_percentile(50), 10)
+		self.assertEqual(statistics.get_percentile(100), 200)
+		self.assertAlmostEqual(statistics.get_std(), np.std([-50, 4, 5, 14, 96, 200]))
+		#
+		self.assertRaises(ValueError, statistics.merge, dicomtools.statistics.VolumeStatistics())
+	#
+#
+if __name__ == '__main__':
+	unittest.main()
+#
@@ -0,0 +1,71 @@
+import unittest
+#
+import matplotlib
+matplotlib.use('Agg')
+# no display is needed
+#
+import dicomtools
+import synthetic
+#
+import numpy as np
+#
+class TestSliceViewer(unittest.TestCase):
+	def setUp(self):
+		self.data = synthetic.make_volume_data((10, 8, 4))
+		self.series = dicomtools.series.DicomSeries(synthetic.make_single_frame_series(self.data))
+		self.volume = dicomtools.volume.DicomVolume(self.series)
+		self.viewers = []
+	#
+	def tearDown(self):
+		for x in self.viewers:
+			x.close()
+		#
+	#
+	def _create_viewer(self, *args, **kwargs):
+		viewer = dicomtools.visualization.SliceViewer(*args, **kwargs)
+		self.viewers.append(viewer)
+		return viewer
+	#
+	def test_set_slice_and_step(self):
+		viewer = self._create_viewer(self.volume, 2)
+		#
+		viewer.set_slice(2)
+		np.testing.assert_array_equal(viewer.image.get_array(), self.volume.info['pixel_data'][:,:,2])
+		viewer.step(10)
+		self.assertEqual(viewer.slice_index, 3)
+		viewer.step(-10)
+		self.assertEqual(viewer.slice_index, 0)
+		# stepping stops at the first and last slices
+		#
+		self.assertRaises(IndexError, viewer.set_slice, 4)
+		self.assertRaises(IndexError, viewer.set_slice, -1)
+		self.assertEqual(viewer.slice_index, 0)
+	#
+	def test_downsample(self):
+		viewer = self._create_viewer(self.volume, 1, slice_index=3, downsample=2)
+		np.testing.assert_array_equal(viewer.image.get_array(), self.volume.info['pixel_data'][::2,3,::2])
+	#
+	def test_window(self):
+		viewer = self._create_viewer(self.volume, 2, window=(40, 400))
+		viewer.set_slice(3)
+		self.assertEqual(viewer.image.get_clim(), (-160, 240))
+		# the window stays the same for every slice
+		#
+		viewer = self._create_viewer(self.volume, 2)
+		viewer.set_slice(3)
+		self.assertEqual(viewer.image.get_clim(), (self.volume.info['pixel_data'].min(), self.volume.info['pixel_data'].max()))
+		# by default the full range of the volume
+	#
+	def test_volume_without_pixel_data(self):
+		volume = dicomtools.volume.DicomVolume(self.series, load_pixel_data=False)
+		viewer = self._create_viewer(volume, 2)
+		viewer.set_slice(1)
+		np.testing.assert_array_equal(viewer.image.get_array(), self.volume.info['pixel_data'][:,:,1])
+		#
+		self.assertRaises(Exception, dicomtools.visualization.SliceViewer, volume, 0)
+		# only slices along axis 2 can be read without the pixel data
+	#
+#
+if __name__ == '__main__':
+	unittest.main()
+#
@@ -0,0 +1,287 @@
+import unittest
+#
+import dicomtools
+import synthetic
+#
+import numpy as np
+#
+class TestVolume(unittest.TestCase):
+	def setUp(self):
+		self.data = synthetic.make_volume_data((24, 20, 16))
+		series = dicomtools.series.DicomSeries(synthetic.make_single_frame_series(self.data))
+		self.volume = dicomtools.volume.DicomVolume(series)
+	#
+	def test_build_volume(self):
+		np.testing.assert_allclose(self.volume.info['pixel_data'], self.data-1024.0)
+		np.testing.assert_allclose(self.volume.info['pixel_spacing'], [0.8, 0.8, 1.5])
+		np.testing.assert_allclose(self.volume.info['slice_vec'], [0, 0, 1])
+	#
+	def test_volume_without_pixel_data(self):
+		series = dicomtools.series.DicomSeries(synthetic.make_single_frame_series(self.data))
+		volume = dicomtools.volume.DicomVolume(series, load_pixel_data=False)
+		#
+		self.assertNotIn('pixel_data', volume.info)
+		self.assertEqual(volume.get_shape(), self.data.shape)
+		self.assertTrue(dicomtools.volume.compare_volume_metadata(volume, self.volume))
+		for x in range(self.data.shape[2]):
+			np.testing.assert_allclose(volume.get_slice(x), self.volume.info['pixel_data'][:,:,x])
+		#
+	#
+	def test_volume_without_pixel_data_does_not_decode(self):
+		series = dicomtools.series.DicomSeries(synthetic.make_single_frame_series(self.data))
+		dicomtools.volume.DicomVolume(series, load_pixel_data=False)
+		self.assertFalse(any(dicomtools.series._is_pixel_array_cached(x) for x in series.instances))
+		# the instances with image data are found without decoding them
+	#
+	def test_decoded_pixel_data(self):
+		series = dicomtools.series.DicomSeries(synthetic.make_single_frame_series(self.data))
+		pixel_data = self.data-1024.0
+		volume = dicomtools.volume.DicomVolume(series, pixel_data=pixel_data)
+		#
+		self.assertIs(volume.info['pixel_data'], pixel_data)
+		self.assertTrue(dicomtools.volume.compare_volume_metadata(volume, self.volume))
+		self.assertFalse(any(dicomtools.series._is_pixel_array_cached(x) for x in series.instances))
+		# the instances weren't decoded
+		self.assertRaises(ValueError, dicomtools.volume.DicomVolume, series, pixel_data=pixel_data[:,:,1:])
+	#
+	def test_region_in_image_coordinates(self):
+		series = dicomtools.series.DicomSeries(synthetic.make_single_frame_series(self.data))
+		with dicomtools.profiling.Profiler() as profiler:
+			volume = dicomtools.volume.DicomVolume(series, region=((3, 4, 5), (10, 12, 9)))
+		#
+		report = dict((x['stage'], x) for x in profiler.get_report())
+		self.assertEqual(report['DicomVolume.decode_pixels']['counts']['slices_decoded'], 4)
+		# only the slices in the region are decoded
+		np.testing.assert_allclose(volume.info['pixel_data'], self.volume.info['pixel_data'][3:10, 4:12, 5:9])
+		img2pat = self.volume.build_image_to_patient_matrix()
+		np.testing.assert_allclose(volume.info['position'], dicomtools.coordinates.transform_vectors(img2pat, [3, 4, 5]))
+		np.testing.assert_allclose(dicomtools.coordinates.transform_vectors(volume.build_image_to_patient_matrix(), [1, 1, 1]), dicomtools.coordinates.transform_vectors(img2pat, [4, 5, 6]))
+		#
+		lazy_volume = dicomtools.volume.DicomVolume(series, load_pixel_data=False, region=((3, 4, 5), (10, 12, 9)))
+		self.assertEqual(lazy_volume.get_shape(), (7, 8, 4))
+		np.testing.assert_allclose(lazy_volume.get_slice(2), volume.info['pixel_data'][:,:,2])
+	#
+	def test_region_in_patient_coordinates(self):
+		series = dicomtools.series.DicomSeries(synthetic.make_single_frame_series(self.data, row_vec=(0, 1, 0), col_vec=(-1, 0, 0)))
+		full_volume = dicomtools.volume.DicomVolume(series)
+		img2pat = full_volume.build_image_to_patient_matrix()
+		corners = dicomtools.coordinates.transform_vectors(img2pat, [[3.2, 4.0, 5.0], [9.0, 11.5, 30.0]])
+		# the box extends beyond the last slice
+		volume = dicomtools.volume.DicomVolume(series, region=corners, region_coordinates='patient')
+		#
+		np.testing.assert_allclose(volume.info['pixel_data'], full_volume.info['pixel_data'][4:10, 4:12, 5:16])
+		np.testing.assert_allclose(volume.info['position'], dicomtools.coordinates.transform_vectors(img2pat, [4, 4, 5]))
+		self.assertRaises(Exception, dicomtools.volume.DicomVolume, series, region=((30, 0, 0), (40, 5, 5)))
+	#
+	def test_content_hashes(self):
+		series = dicomtools.series.DicomSeries(synthetic.make_single_frame_series(self.data))
+		lazy_volume = dicomtools.volume.DicomVolume(series, load_pixel_data=False)
+		#
+		self.assertEqual(lazy_volume.get_slice_hashes(), self.volume.get_slice_hashes())
+		self.assertEqual(lazy_volume.get_content_hash(), self.volume.get_content_hash())
+		self.assertEqual(dicomtools.volume.compare_volume_pixels(lazy_volume, self.volume), [])
+		#
+		changed_data = self.data.copy()
+		changed_data[5:8, 2:4, 3] += 2
+		changed_volume = dicomtools.volume.DicomVolume(dicomtools.series.DicomSeries(synthetic.make_single_frame_series(changed_data)))
+		#
+		hashes = changed_volume.get_slice_hashes()
+		self.assertEqual([x for x in range(len(hashes)) if hashes[x] != self.volume.get_slice_hashes()[x]], [3])
+		self.assertNotEqual(changed_volume.get_content_hash(), self.volume.get_content_hash())
+		self.assertEqual(dicomtools.volume.compare_volume_pixels(changed_volume, self.volume), [{'slice': 3, 'num_of_voxels': 6, 'max_difference': 2.0, 'start': (5, 2), 'stop': (8, 4)}])
+		self.assertEqual(dicomtools.volume.compare_volume_pixels(changed_volume, self.volume, tolerance=2.0), [])
+		#
+		moved_volume = dicomtools.volume.DicomVolume(dicomtools.series.DicomSeries(synthetic.make_single_frame_series(self.data, position=(0, 0, 0))))
+		self.assertEqual(moved_volume.get_slice_hashes(), self.volume.get_slice_hashes())
+		self.assertNotEqual(moved_volume.get_content_hash(), self.volume.get_content_hash())
+		# the same pixels, but a different position
+	#
+	def test_oblique_slice_matches_axial_slice(self):
+		img2pat = self.volume.build_image_to_patient_matrix()
+		origin = dicomtools.coordinates.transform_vectors(img2pat, [0, 0, 7])
+		#
+		image, image_img2pat = self.volume.get_oblique_slice(origin, [1, 0, 0], [0, 1, 0], (24, 20))
+		#
+		np.testing.assert_allclose(image, self.volume.info['pixel_data'][:,:,7])
+		np.testing.assert_allclose(image_img2pat[0:3, 3], origin)
+	#
+	def test_oblique_slice_matches_sagittal_slice(self):
+		img2pat = self.volume.build_image_to_patient_matrix()
+		origin = dicomtools.coordinates.transform_vectors(img2pat, [5, 0, 0])
+		#
+		image, image_img2pat = self.volume.get_oblique_slice(origin, [0, 1, 0], [0, 0, 1], (20, 16), spacing=[0.8, 1.5])
+		#
+		np.testing.assert_allclose(image, self.volume.info['pixel_data'][5,:,:])
+	#
+	def test_oblique_slice_interpolation(self):
+		img2pat = self.volume.build_image_to_patient_matrix()
+		origin = dicomtools.coordinates.transform_vectors(img2pat, [0.5, 0, 3.5])
+		#
+		image, image_img2pat = self.volume.get_oblique_slice(origin, [1, 0, 0], [0, 1, 0], (4, 4))
+		#
+		pixel_data = self.volume.info['pixel_data']
+		expected = (pixel_data[0:4,0:4,3]+pixel_data[1:5,0:4,3]+pixel_data[0:4,0:4,4]+pixel_data[1:5,0:4,4])/4
+		np.testing.assert_allclose(image, expected)
+	#
+	def test_oblique_slice_without_pixel_data(self):
+		lazy_volume = dicomtools.volume.DicomVolume(dicomtools.series.DicomSeries(synthetic.make_single_frame_series(self.data)), load_pixel_data=False)
+		img2pat = self.volume.build_image_to_patient_matrix()
+		origin = dicomtools.coordinates.transform_vectors(img2pat, [2, 1, 3.25])
+		#
+		for interpolation in ['linear', 'nearest']:
+			(image, image_img2pat) = lazy_volume.get_oblique_slice(origin, [1, 0, 0.1], [0, 1, 0.05], (12, 10), interpolation=interpolation, fill_value=-5)
+			(expected, expected_img2pat) = self.volume.get_oblique_slice(origin, [1, 0, 0.1], [0, 1, 0.05], (12, 10), interpolation=interpolation, fill_value=-5)
+			np.testing.assert_allclose(image, expected)
+		#
+		self.assertNotIn('pixel_data', lazy_volume.info)
+	#
+	def test_oblique_slice_outside_volume(self):
+		image, image_img2pat = self.volume.get_oblique_slice([1000, 1000, 1000], [1, 1, 0], [0, 0, 1], (8, 8), fill_value=-5)
+		#
+		np.testing.assert_allclose(image, -5)
+	#
+#
+class TestDicomVolume4D(unittest.TestCase):
+	def setUp(self):
+		self.data = np.stack([synthetic.make_volume_data((12, 10, 6), seed=x) for x in range(3)], axis=3)
+		self.trigger_times = [400.0, 0.0, 200.0]
+	#
+	def test_build_volume(self):
+		series = dicomtools.series.DicomSeries(synthetic.make_temporal_series(self.data, self.trigger_times))
+		with dicomtools.profiling.Profiler() as profiler:
+			volume = dicomtools.volume.DicomVolume4D(series, temporal_keyword='TriggerTime')
+		#
+		report = dict((x['stage'], x) for x in profiler.get_report())
+		self.assertEqual(report['DicomVolume._validate_volume']['calls'], 3)
+		# each phase is only validated once
+		order = np.argsort(self.trigger_times)
+		self.assertEqual(volume.get_shape(), (12, 10, 6, 3))
+		np.testing.assert_array_equal(volume.info['temporal_values'], [0.0, 200.0, 400.0])
+		np.testing.assert_allclose(volume.info['pixel_data'], self.data[:,:,:,order]-1024.0)
+		#
+		phase_volume = dicomtools.volume.DicomVolume(dicomtools.series.DicomSeries(synthetic.make_single_frame_series(self.data[:,:,:,0])))
+		for (t, phase) in enumerate(volume.phases):
+			self.assertTrue(dicomtools.volume.compare_volume_metadata(phase, phase_volume))
+			self.assertTrue(np.shares_memory(phase.info['pixel_data'], volume.info['pixel_data']))
+			np.testing.assert_allclose(phase.get_slice(2), self.data[:,:,2,order[t]]-1024.0)
+		#
+	#
+	def test_temporal_position_identifier(self):
+		series = dicomtools.series.DicomSeries(synthetic.make_temporal_series(self.data, self.trigger_times))
+		volume = dicomtools.volume.DicomVolume4D(series)
+		#
+		self.assertEqual(volume.info['temporal_keyword'], 'TemporalPositionIdentifier')
+		np.testing.assert_allclose(volume.info['pixel_data'], self.data-1024.0)
+		# the phases are in the order they were acquired, rather than by trigger time
+	#
+	def test_mismatched_phases(self):
+		datasets = synthetic.make_temporal_series(self.data, self.trigger_times)
+		datasets = [x for x in datasets if not (x.TriggerTime == 0.0 and x.InstanceNumber == 6+6)]
+		# drop the last slice of one phase
+		self.assertRaises(Exception, dicomtools.volume.DicomVolume4D, dicomtools.series.DicomSeries(datasets))
+		#
+		single_volume = synthetic.make_single_frame_series(self.data[:,:,:,0])
+		self.assertRaises(Exception, dicomtools.volume.DicomVolume4D, dicomtools.series.DicomSeries(single_volume))
+	#
+#
+class TestIncrementalVolumeBuilder(unittest.TestCase):
+	def setUp(self):
+		self.data = synthetic.make_volume_data((12, 10, 8))
+		self.volume = dicomtools.volume.DicomVolume(dicomtools.series.DicomSeries(synthetic.make_single_frame_series(self.data)))
+	#
+	def test_partial_and_complete_volume(self):
+		builder = dicomtools.volume.IncrementalVolumeBuilder(num_of_slices=8)
+		datasets = synthetic.make_single_frame_series(self.data)
+		# the slices arrive in a shuffled order
+		#
+		for x in range(4):
+			builder.add_instance(datasets[x])
+		#
+		info = builder.get_partial_volume()
+		first = int(min(x.InstanceNumber for x in datasets[:4]))-1
+		self.assertEqual(info['pixel_data'].shape[2], int(max(x.InstanceNumber for x in datasets[:4]))-first)
+		for x in np.flatnonzero(info['filled']):
+			np.testing.assert_allclose(info['pixel_data'][:,:,x], self.data[:,:,first+x]-1024.0)
+		#
+		self.assertTrue(np.all(np.isnan(info['pixel_data'][:,:,~info['filled']])))
+		np.testing.assert_allclose(info['position'], self.volume.info['position']+[0, 0, 1.5*first])
+		self.assertFalse(builder.is_complete())
+		self.assertRaises(Exception, builder.build_volume)
+		#
+		for x in range(4, 8):
+			builder.add_instance(datasets[x])
+		#
+		self.assertTrue(builder.is_complete())
+		volume = builder.build_volume()
+		self.assertTrue(dicomtools.volume.compare_volume_metadata(volume, self.volume))
+		np.testing.assert_array_equal(volume.info['pixel_data'], self.volume.info['pixel_data'])
+	#
+	def test_reversed_instance_numbers(self):
+		datasets = synthetic.make_single_frame_series(self.data)
+		for x in datasets:
+			x.InstanceNumber = 9-x.InstanceNumber
+		#
+		builder = dicomtools.volume.IncrementalVolumeBuilder()
+		for x in datasets:
+			builder.add_instance(x)
+		#
+		volume = dicomtools.volume.DicomVolume(dicomtools.series.DicomSeries(datasets))
+		np.testing.assert_array_equal(builder.get_partial_volume()['pixel_data'], volume.info['pixel_data'])
+		np.testing.assert_array_equal(builder.build_volume().info['pixel_data'], volume.info['pixel_data'])
+	#
+	def test_rejected_instances(self):
+		datasets = sorted(synthetic.make_single_frame_series(self.data), key=lambda x: x.InstanceNumber)
+		builder = dicomtools.volume.IncrementalVolumeBuilder(num_of_slices=8)
+		for x in [0, 1, 3]:
+			builder.add_instance(datasets[x])
+		#
+		#
+		self.assertRaises(Exception, builder.add_instance, datasets[0])
+		# same position
+		other_series = sorted(synthetic.make_single_frame_series(self.data, series_uid='1.2.3.5'), key=lambda x: x.InstanceNumber)
+		self.assertRaises(Exception, builder.add_instance, other_series[1])
+		shifted = sorted(synthetic.make_single_frame_series(self.data, position=(-99.0, -120.0, 50.0)), key=lambda x: x.InstanceNumber)
+		self.assertRaises(Exception, builder.add_instance, shifted[5])
+		# not in line with the other slices
+		too_long = sorted(synthetic.make_single_frame_series(synthetic.make_volume_data((12, 10, 9))), key=lambda x: x.InstanceNumber)
+		self.assertRaises(Exception, builder.add_instance, too_long[8])
+		#
+		self.assertEqual(builder.get_num_of_instances(), 3)
+		self.assertEqual(builder.get_missing_slices(), [2])
+	#
+	def test_jittered_positions(self):
+		for jitter in [0.0015, 0.0025, 0.004]:
+			datasets = sorted(synthetic.make_single_frame_series(self.data), key=lambda x: x.InstanceNumber)[0:3]
+			position = [float(x) for x in datasets[2].ImagePositionPatient]
+			datasets[2].ImagePositionPatient = position[0:2] + [position[2]+jitter]
+			# slices at 50.0, 51.5 and 53.0+jitter
+			self.assertRaises(Exception, dicomtools.volume.DicomVolume, dicomtools.series.DicomSeries(datasets))
+			#
+			builder = dicomtools.volume.IncrementalVolumeBuilder()
+			builder.add_instance(datasets[0])
+			builder.add_instance(datasets[1])
+			self.assertRaises(Exception, builder.add_instance, datasets[2])
+			# rather than treating the jitter as the slice spacing
+			self.assertEqual(builder.get_partial_volume()['pixel_data'].shape, (12, 10, 2))
+		#
+		datasets[2].ImagePositionPatient = position[0:2] + [position[2]+0.02]
+		builder = dicomtools.volume.IncrementalVolumeBuilder(num_of_slices=8)
+		builder.add_instance(datasets[0])
+		builder.add_instance(datasets[1])
+		self.assertRaises(Exception, builder.add_instance, datasets[2])
+		# a larger jitter fits a finer spacing with missing slices, which is only ruled out
+		# by the number of slices
+	#
+	def test_missing_slices_between_arrivals(self):
+		datasets = sorted(synthetic.make_single_frame_series(self.data), key=lambda x: x.InstanceNumber)
+		builder = dicomtools.volume.IncrementalVolumeBuilder()
+		for x in [0, 2, 5]:
+			builder.add_instance(datasets[x])
+		#
+		self.assertEqual(builder.get_missing_slices(), [1, 3, 4])
+		# the spacing is found even though no two adjacent slices have arrived
+	#
+#
+if __name__ == '__main__':
+	unittest.main()
+#